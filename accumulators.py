@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Streaming statistics of WFS measurements.
+
+WelfordAccumulator keeps the running count, mean, variance, minimum
+and maximum of every element of an array with Welford's online
+algorithm. NaN values (e.g. lenslets outside the pupil) are skipped per
+element. Memory is fixed by the array shape, however many frames are
+added, and every update is a few in-place NumPy operations.
+
+LensletStatistics feeds accumulators for the wavefront, the spot
+deviations, the spot intensities and the Zernike coefficients from
+every WFS.update():
+
+    statistics = LensletStatistics(wfs)
+    for _ in range(frames):
+        wfs.update()
+    rms = statistics['wavefront'].std()
+    statistics.detach()
+"""
+import logging
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+log_accumulators = logging.getLogger('WFS.accumulators')
+
+
+class WelfordAccumulator(object):
+    """Running mean, variance, min and max of each array element.
+
+    Args:
+        shape (tuple): Shape of the accumulated arrays.
+    """
+
+    def __init__(self, shape):
+        self.shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+        self.min = np.full(self.shape, np.nan)
+        self.max = np.full(self.shape, np.nan)
+        self.frames = 0
+        # Scratch buffers, so that add() does not allocate
+        self._valid = np.empty(self.shape, dtype=bool)
+        self._delta = np.empty(self.shape)
+        self._delta2 = np.empty(self.shape)
+
+    def add(self, values):
+        """Add one array of values.
+
+        Args:
+            values (np.ndarray): Values with the accumulator's shape,
+                NaN and infinite values are skipped.
+        """
+        valid, delta, delta2 = self._valid, self._delta, self._delta2
+        np.isfinite(values, out=valid)
+        self.count += valid
+        # delta = values - mean, 0 where not valid
+        delta.fill(0)
+        np.subtract(values, self.mean, out=delta, where=valid)
+        # mean += delta / count
+        np.divide(delta, self.count, out=delta2, where=valid)
+        np.add(self.mean, delta2, out=self.mean, where=valid)
+        # m2 += delta * (values - new mean)
+        delta2.fill(0)
+        np.subtract(values, self.mean, out=delta2, where=valid)
+        delta *= delta2
+        self.m2 += delta
+        np.fmin(self.min, values, out=self.min)
+        np.fmax(self.max, values, out=self.max)
+        self.frames += 1
+
+    def variance(self, ddof=1):
+        """Get the variance of each element, NaN with too few values.
+
+        Args:
+            ddof (int): Delta degrees of freedom, 1 for the sample
+                variance, 0 for the population variance.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=1):
+        """Get the standard deviation of each element."""
+        return np.sqrt(self.variance(ddof))
+
+    def peak_to_valley(self):
+        """Get max - min of each element."""
+        return self.max - self.min
+
+    def reset(self):
+        """Remove all values."""
+        self.count[:] = 0
+        self.mean[:] = 0
+        self.m2[:] = 0
+        self.min[:] = np.nan
+        self.max[:] = np.nan
+        self.frames = 0
+
+    def summary(self):
+        """Get the statistics as dict of arrays."""
+        return {'count': self.count.copy(),
+                'mean': np.where(self.count > 0, self.mean, np.nan),
+                'std': self.std(),
+                'min': self.min.copy(),
+                'max': self.max.copy(),
+                'peak_to_valley': self.peak_to_valley()}
+
+
+class LensletStatistics(object):
+    """Per-lenslet and per-Zernike-mode statistics fed from WFS.update().
+
+    The lenslet accumulators cover the current [spots_y][spots_x] grid
+    and are reset when the grid changes.
+
+    Args:
+        wfs (WFS): WFS session.
+        intensities (bool): Also accumulate the spot intensities,
+            which needs an extra _get_spot_intensities() call per frame.
+        attach (bool): Add to wfs.frame_listeners.
+    """
+
+    def __init__(self, wfs, intensities=True, attach=True):
+        self.wfs = wfs
+        self.intensities = intensities
+        self.grid = None
+        self.accumulators = {}
+        self.zernike = WelfordAccumulator(wfs.MAX_ZERNIKE_MODES)
+        self._arrays = {}
+        if attach:
+            wfs.frame_listeners.append(self.update)
+
+    def __getitem__(self, name):
+        if name == 'zernike':
+            return self.zernike
+        return self.accumulators[name]
+
+    def _start_grid(self, grid):
+        """Create the lenslet accumulators for a spot grid."""
+        if self.grid is not None:
+            log_accumulators.warning(f'Spot grid changed from {self.grid} to {grid}, lenslet statistics reset')
+        self.grid = grid
+        rows, columns = grid
+        wfs = self.wfs
+        arrays = {'wavefront': wfs.array_wavefront,
+                  'deviations_x': wfs.array_deviations_x,
+                  'deviations_y': wfs.array_deviations_y}
+        if self.intensities:
+            arrays['intensity'] = wfs.array_intensity
+        # Views of the ctypes arrays, cropped to the grid
+        self._arrays = {name: np.ctypeslib.as_array(array)[:rows, :columns] for name, array in arrays.items()}
+        self.accumulators = {name: WelfordAccumulator(grid) for name in self._arrays}
+
+    def update(self, wfs=None):
+        """Add the results of the last WFS.update().
+
+        Args:
+            wfs (WFS): Ignored, for use as frame listener.
+        """
+        wfs = self.wfs
+        grid = (wfs.spots_y.value, wfs.spots_x.value)
+        if grid != self.grid:
+            self._start_grid(grid)
+        if self.intensities:
+            wfs._get_spot_intensities()
+        for name, accumulator in self.accumulators.items():
+            accumulator.add(self._arrays[name])
+        self.zernike.add(np.ctypeslib.as_array(wfs.array_zernike_um)[1:wfs.MAX_ZERNIKE_MODES + 1])
+
+    def detach(self):
+        """Stop receiving WFS updates."""
+        if self.update in self.wfs.frame_listeners:
+            self.wfs.frame_listeners.remove(self.update)
+
+    def reset(self):
+        """Remove all values."""
+        for accumulator in self.accumulators.values():
+            accumulator.reset()
+        self.zernike.reset()
+
+    def summary(self):
+        """Get the statistics of all accumulators.
+
+        Returns:
+            dict: {name: WelfordAccumulator.summary()} for each lenslet
+                field and 'zernike', with index i of 'zernike' being
+                Zernike mode i + 1.
+        """
+        summary = {name: accumulator.summary() for name, accumulator in self.accumulators.items()}
+        summary['zernike'] = self.zernike.summary()
+        return summary
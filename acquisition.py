@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Long-running acquisition loop feeding a latest-frame mailbox.
+
+AcquisitionWorker calls WFS.update() in a loop until stopped and puts a
+FrameSnapshot of every frame into a FrameMailbox. The mailbox only
+keeps the latest frame, so a slow consumer such as the GUI takes the
+newest frame when it is ready and never holds up the sensor. The
+worker does not depend on Qt; the GUI runs it inside a QThread:
+
+    mailbox = FrameMailbox()
+    worker = AcquisitionWorker(wfs, mailbox)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    ...
+    snapshot = mailbox.take()
+    ...
+    worker.stop()
+    thread.join()
+"""
+import logging
+import threading
+
+from display import FrameSnapshot, RingBuffer, display_factor, downsample
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+log_acquisition = logging.getLogger('WFS.acquisition')
+
+
+class FrameMailbox(object):
+    """Latest frame of the acquisition loop and the RoC history.
+
+    Args:
+        history (int): Number of RoC values kept.
+    """
+
+    def __init__(self, history=100):
+        self.lock = threading.Lock()
+        self.latest = None
+        self.new = False
+        self.frames = 0
+        # Frames replaced before they were taken
+        self.skipped = 0
+        self.roc_history = RingBuffer(history)
+
+    def put(self, snapshot):
+        """Replace the latest frame."""
+        with self.lock:
+            if self.new:
+                self.skipped += 1
+            self.latest = snapshot
+            self.new = True
+            self.frames += 1
+            self.roc_history.append(snapshot.roc_mm)
+
+    def take(self):
+        """Get the latest frame if it has not been taken yet.
+
+        Returns:
+            FrameSnapshot: Latest frame, or None if there is no new one.
+        """
+        with self.lock:
+            if not self.new:
+                return None
+            self.new = False
+            return self.latest
+
+    def history(self):
+        """Get a copy of the RoC history from the oldest to the newest value."""
+        with self.lock:
+            return self.roc_history.ordered().copy()
+
+
+class AcquisitionWorker(object):
+    """Run WFS.update() in a loop with start, pause and stop control.
+
+    Args:
+        wfs (WFS): Connected and configured WFS.
+        mailbox (FrameMailbox): Receives a snapshot of every frame.
+        spotfield_width (int): Add the spotfield image downsampled to at
+            most this width to every snapshot, None for no image.
+    """
+
+    def __init__(self, wfs, mailbox, spotfield_width=None):
+        self.wfs = wfs
+        self.mailbox = mailbox
+        self.spotfield_width = spotfield_width
+        self.error = None
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._grid = None
+
+    @property
+    def paused(self):
+        """Check if the loop is paused."""
+        return not self._resume.is_set()
+
+    def run(self):
+        """Acquire frames until stop() is called.
+
+        A stop() before run() starts ends it right away; call resume()
+        first to run the loop again after a stop().
+        """
+        self._idle.clear()
+        self.error = None
+        log_acquisition.info('Acquisition started')
+        try:
+            while not self._stop.is_set():
+                if not self._resume.is_set():
+                    self._idle.set()
+                    self._resume.wait()
+                    self._idle.clear()
+                    continue
+                wfs = self.wfs
+                wfs.update()
+                grid = (wfs.spots_x.value, wfs.spots_y.value)
+                if grid != self._grid:
+                    # Lenslet and reference spot positions of the snapshot
+                    wfs._get_xy_scale()
+                    wfs._get_spot_reference_positions()
+                    self._grid = grid
+                snapshot = FrameSnapshot(wfs)
+                if self.spotfield_width:
+                    self.add_spotfield(snapshot)
+                self.mailbox.put(snapshot)
+        except Exception as e:
+            self.error = e
+            log_acquisition.exception('Acquisition stopped by an error')
+        finally:
+            self._idle.set()
+        log_acquisition.info('Acquisition stopped')
+
+    def add_spotfield(self, snapshot):
+        """Add the downsampled spotfield image to a snapshot."""
+        image = self.wfs.spotfield_view()
+        if image is not None:
+            snapshot.image_factor = display_factor(image.shape[1], self.spotfield_width)
+            snapshot.image = downsample(image, snapshot.image_factor)
+
+    def pause(self, timeout=None):
+        """Pause after the current frame.
+
+        Args:
+            timeout (float): Time in s to wait until the current frame
+                is done, None to wait without limit.
+
+        Returns:
+            bool: True if the loop is idle.
+        """
+        self._resume.clear()
+        return self._idle.wait(timeout)
+
+    def resume(self):
+        """Continue a paused loop, or prepare a stopped one to run again."""
+        self._stop.clear()
+        self._resume.set()
+
+    def stop(self):
+        """End the loop after the current frame."""
+        self._stop.set()
+        self._resume.set()
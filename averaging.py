@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Average spotfield images in Python.
+
+The driver functions _average_image() and _average_image_rolling() are
+limited to AVERAGE_COUNT_MAX = 256 frames of 8 bit images. ImageAverager
+averages any number of frames directly from the zero-copy spotfield
+view of WFS.spotfield_view(), in a uint32 or float32 accumulator:
+
+    boxcar: mean of count frames, then start over
+    rolling: mean of the last count frames
+    exponential: exponential moving average with weight alpha
+    sigma_clip: mean of the last count frames without pixels further
+        than sigma standard deviations from their median
+
+Only rolling and sigma_clip keep the last count frames in memory.
+
+As an image stage of WFS, the averaged image is written back into the
+spotfield view, so the driver calculates the spots from the average:
+
+    averager = ImageAverager('boxcar', count=1000)
+    wfs.image_stages.append(averager)
+"""
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+MODES = ('boxcar', 'rolling', 'exponential', 'sigma_clip')
+
+
+class ImageAverager(object):
+    """Average spotfield images beyond the driver's 256 frame limit.
+
+    Args:
+        mode (str): 'boxcar', 'rolling', 'exponential' or 'sigma_clip'.
+        count (int): Number of averaged frames; for 'exponential' only
+            the number of frames until ready.
+        dtype: Accumulator type, np.uint32 (exact sums, boxcar and
+            rolling only) or np.float32.
+        alpha (float): Weight of a new frame in 'exponential' mode,
+            default 2 / (count + 1).
+        sigma (float): Clipping threshold in standard deviations.
+        push_back (bool): Write the average back into the image.
+    """
+
+    def __init__(self, mode='boxcar', count=16, dtype=np.float32, alpha=None, sigma=3.0, push_back=True):
+        if mode not in MODES:
+            raise ValueError(f'Unknown averaging mode {mode!r}, use one of {MODES}')
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        dtype = np.dtype(dtype)
+        if dtype not in (np.uint32, np.float32):
+            raise ValueError('dtype must be np.uint32 or np.float32')
+        if dtype == np.uint32 and mode not in ('boxcar', 'rolling'):
+            raise ValueError(f'{mode} averaging needs a float32 accumulator')
+        self.mode = mode
+        self.count = int(count)
+        self.dtype = dtype
+        self.alpha = 2 / (count + 1) if alpha is None else alpha
+        self.sigma = sigma
+        self.push_back = push_back
+        self.shape = None
+        self.sum = None
+        self.frames = None
+        self.average = None
+        self.frame_count = 0
+        self._index = 0
+        self._rounded = None
+
+    def _start(self, shape):
+        """Allocate the accumulators for an image shape."""
+        self.shape = shape
+        self.sum = np.zeros(shape, dtype=self.dtype)
+        self.average = np.zeros(shape, dtype=np.float32)
+        self._rounded = np.empty(shape, dtype=np.float32)
+        # Ring buffer of the last count frames
+        self.frames = None
+        if self.mode in ('rolling', 'sigma_clip'):
+            self.frames = np.zeros((self.count,) + shape, dtype=np.uint8)
+        self.frame_count = 0
+        self._index = 0
+
+    def reset(self):
+        """Start averaging from the next frame."""
+        self.shape = None
+
+    @property
+    def ready(self):
+        """Check if count frames have been averaged."""
+        return self.frame_count >= self.count
+
+    def add(self, image):
+        """Add an image to the average.
+
+        Args:
+            image (np.ndarray): uint8 [rows][columns] image.
+
+        Returns:
+            np.ndarray: float32 average of the frames so far.
+        """
+        if image.shape != self.shape or (self.mode == 'boxcar' and self.ready):
+            self._start(image.shape)
+        if self.mode == 'boxcar':
+            np.add(self.sum, image, out=self.sum, casting='unsafe')
+            self.frame_count += 1
+            np.divide(self.sum, self.frame_count, out=self.average, casting='unsafe')
+        elif self.mode == 'rolling':
+            oldest = self.frames[self._index]
+            if self.frame_count >= self.count:
+                np.subtract(self.sum, oldest, out=self.sum, casting='unsafe')
+            np.add(self.sum, image, out=self.sum, casting='unsafe')
+            oldest[:] = image
+            self._index = (self._index + 1) % self.count
+            self.frame_count += 1
+            np.divide(self.sum, min(self.frame_count, self.count), out=self.average, casting='unsafe')
+        elif self.mode == 'exponential':
+            if self.frame_count == 0:
+                self.average[:] = image
+            else:
+                # average += alpha * (image - average)
+                np.subtract(image, self.average, out=self.sum)
+                self.sum *= self.alpha
+                self.average += self.sum
+            self.frame_count += 1
+        else:
+            self.frames[self._index] = image
+            self._index = (self._index + 1) % self.count
+            self.frame_count += 1
+            self._sigma_clip(self.frames[:min(self.frame_count, self.count)])
+        return self.average
+
+    def _sigma_clip(self, frames):
+        """Average frames without outliers of each pixel."""
+        median = np.median(frames, axis=0)
+        std = frames.std(axis=0, dtype=np.float32)
+        keep = np.abs(frames - median) <= self.sigma * std
+        kept = keep.sum(axis=0)
+        total = np.where(keep, frames, 0).sum(axis=0, dtype=np.float32)
+        np.divide(total, kept, out=self.average, where=kept > 0)
+        np.copyto(self.average, median, where=kept == 0, casting='unsafe')
+
+    def write(self, image):
+        """Write the rounded average into an image in place."""
+        np.rint(self.average, out=self._rounded)
+        np.clip(self._rounded, 0, 255, out=self._rounded)
+        np.copyto(image, self._rounded, casting='unsafe')
+
+    def __call__(self, image, wfs=None):
+        """Image stage: add the image and write the average back.
+
+        Args:
+            image (np.ndarray): Spotfield view.
+            wfs (WFS): Ignored.
+        """
+        self.add(image)
+        if self.push_back:
+            self.write(image)
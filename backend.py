@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Stand-in driver libraries for running WFS without the Thorlabs DLL.
+
+A backend is passed to WFS(lib=...) in place of the loaded WFS_32.dll
+and receives exactly the same calls with the same ctypes arguments.
+StubLibrary answers every WFS_* function with WFS_SUCCESS and fills in
+the instrument information needed by WFS.connect() and WFS.config();
+subclasses provide the measurement data.
+"""
+import ctypes
+
+import numpy as np
+
+from wfs import WFS
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+
+def deref(arg):
+    """Get the ctypes object passed with ctypes.byref().
+
+    Args:
+        arg: Argument received by a driver function.
+
+    Returns:
+        The referenced ctypes object, or arg itself.
+    """
+    return getattr(arg, '_obj', arg)
+
+
+def set_value(arg, value):
+    """Set the value of a ctypes scalar output argument.
+
+    Args:
+        arg: ctypes scalar or byref() of one.
+        value: New value.
+    """
+    deref(arg).value = value
+
+
+def set_grid(arg, data):
+    """Copy spot data into a [MAX_SPOTS_Y][MAX_SPOTS_X] output array.
+
+    Args:
+        arg: ctypes 2D float array.
+        data (np.ndarray): [spots_y][spots_x] data.
+    """
+    rows, columns = np.shape(data)
+    np.ctypeslib.as_array(deref(arg))[:rows, :columns] = data
+
+
+class StubLibrary(object):
+    """Driver stand-in that accepts every call and returns WFS_SUCCESS.
+
+    Args:
+        instrument_name (bytes): Instrument name, e.g. b'WFS20-5C'.
+        serial_number_wfs (bytes): Serial number of the WFS.
+        serial_number_camera (bytes): Serial number of the camera.
+        mla_name (bytes): Name of the Microlens Array.
+        cam_pitch_um (float): Camera pixel pitch in µm.
+        lenslet_pitch_um (float): Microlens Array pitch in µm.
+        spots (tuple): Detectable spots (X, Y) for each camera
+            resolution index. If None, they are derived from the
+            camera resolution, pixel and lenslet pitch.
+    """
+    HANDLE = 1
+
+    def __init__(self, instrument_name=b'WFS20-5C', serial_number_wfs=b'M00000000',
+                 serial_number_camera=b'0000000000', mla_name=b'MLA150-5C', cam_pitch_um=5.0,
+                 lenslet_pitch_um=150.0, spots=None):
+        self.instrument_name = instrument_name
+        self.serial_number_wfs = serial_number_wfs
+        self.serial_number_camera = serial_number_camera
+        self.mla_name = mla_name
+        self.cam_pitch_um = cam_pitch_um
+        self.lenslet_pitch_um = lenslet_pitch_um
+        self.spots = spots
+        self.cam_resolution_index = 0
+        self.device_status = WFS.WFS_STATBIT_CFG
+        self.image = None
+
+    def __getattr__(self, name):
+        if not name.startswith('WFS_'):
+            raise AttributeError(name)
+
+        def success(*args):
+            return WFS.WFS_SUCCESS
+        success.__name__ = name
+        return success
+
+    @property
+    def model(self):
+        """Get the model name used as key of WFS.cam_res_id."""
+        return self.instrument_name.decode().split('-', 1)[0]
+
+    def resolution(self, cam_resolution_index=None):
+        """Get (x_res, y_res, sub_factor) of a camera resolution index."""
+        if cam_resolution_index is None:
+            cam_resolution_index = self.cam_resolution_index
+        return WFS.cam_res_id[self.model][cam_resolution_index]
+
+    def spot_count(self, cam_resolution_index=None):
+        """Get the number of detectable spots (X, Y) at a resolution."""
+        if cam_resolution_index is None:
+            cam_resolution_index = self.cam_resolution_index
+        if self.spots is not None:
+            return self.spots[cam_resolution_index]
+        x_res, y_res, factor = self.resolution(cam_resolution_index)
+        lenslet_pixels = self.lenslet_pitch_um / (self.cam_pitch_um * factor)
+        return (min(int(x_res / lenslet_pixels) - 1, WFS.MAX_SPOTS_X),
+                min(int(y_res / lenslet_pixels) - 1, WFS.MAX_SPOTS_Y))
+
+    # Driver functions
+    def WFS_GetInstrumentListLen(self, handle, instrument_count):
+        set_value(instrument_count, 1)
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetInstrumentListInfo(self, handle, instrument_index, device_id, in_use, instrument_name,
+                                  serial_number_wfs, resource_name):
+        set_value(device_id, 1)
+        set_value(in_use, 0)
+        set_value(instrument_name, self.instrument_name)
+        set_value(serial_number_wfs, self.serial_number_wfs)
+        set_value(resource_name, b'USB::0x1313::0x0000::1')
+        return WFS.WFS_SUCCESS
+
+    def WFS_init(self, resource_name, id_query, reset_device, instrument_handle):
+        set_value(instrument_handle, self.HANDLE)
+        return WFS.WFS_SUCCESS
+
+    def WFS_close(self, instrument_handle):
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetStatus(self, instrument_handle, device_status):
+        set_value(device_status, self.device_status)
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetInstrumentInfo(self, instrument_handle, manufacturer_name, instrument_name, serial_number_wfs,
+                              serial_number_camera):
+        set_value(manufacturer_name, b'Thorlabs GmbH')
+        set_value(instrument_name, self.instrument_name)
+        set_value(serial_number_wfs, self.serial_number_wfs)
+        set_value(serial_number_camera, self.serial_number_camera)
+        return WFS.WFS_SUCCESS
+
+    def WFS_revision_query(self, instrument_handle, instrument_driver_revision, firmware_revision):
+        set_value(instrument_driver_revision, __version__.encode())
+        set_value(firmware_revision, __version__.encode())
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetMlaCount(self, instrument_handle, mla_count):
+        set_value(mla_count, 1)
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetMlaData(self, instrument_handle, mla_index, mla_name, cam_pitch_um, lenslet_pitch_um, *args):
+        set_value(mla_name, self.mla_name)
+        set_value(cam_pitch_um, self.cam_pitch_um)
+        set_value(lenslet_pitch_um, self.lenslet_pitch_um)
+        return WFS.WFS_SUCCESS
+
+    def WFS_ConfigureCam(self, instrument_handle, pixel_format, cam_resolution_index, spots_x, spots_y):
+        self.cam_resolution_index = deref(cam_resolution_index).value
+        x_res, y_res, _ = self.resolution()
+        self.image = np.zeros((y_res, x_res), dtype=np.uint8)
+        columns, rows = self.spot_count()
+        set_value(spots_x, columns)
+        set_value(spots_y, rows)
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotfieldImage(self, instrument_handle, image_buffer_ref, rows, columns):
+        if self.image is None:
+            return WFS.WFS_ERROR_CAM_NOT_CONFIGURED
+        # Like the driver, return the address of the current image
+        address = ctypes.c_void_p(self.image.ctypes.data)
+        ctypes.memmove(deref(image_buffer_ref), ctypes.byref(address), ctypes.sizeof(address))
+        set_value(rows, self.image.shape[0])
+        set_value(columns, self.image.shape[1])
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotfieldImageCopy(self, instrument_handle, image_buffer, rows, columns):
+        if self.image is None:
+            return WFS.WFS_ERROR_CAM_NOT_CONFIGURED
+        size = min(self.image.nbytes, ctypes.sizeof(deref(image_buffer)))
+        ctypes.memmove(deref(image_buffer), self.image.ctypes.data, size)
+        set_value(rows, self.image.shape[0])
+        set_value(columns, self.image.shape[1])
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetXYScale(self, instrument_handle, array_scale_x, array_scale_y):
+        # Lenslet positions in mm with the center lenslet at 0
+        columns, rows = self.spot_count()
+        pitch_mm = self.lenslet_pitch_um / 1000
+        np.ctypeslib.as_array(deref(array_scale_x))[:columns] = (np.arange(columns) - columns // 2) * pitch_mm
+        np.ctypeslib.as_array(deref(array_scale_y))[:rows] = (np.arange(rows) - rows // 2) * pitch_mm
+        return WFS.WFS_SUCCESS
+
+    def WFS_error_message(self, instrument_handle, error_code, error_message):
+        set_value(error_message, f'Error {deref(error_code).value}'.encode())
+        return WFS.WFS_SUCCESS
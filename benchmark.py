@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the WFS wrapper against a simulated driver.
+
+Measures without hardware:
+    methods: latency of every WFS._* method callable without arguments
+    update: end-to-end and per-stage time of WFS.update() for each
+        camera resolution in WFS.cam_res_id
+    gui: rendering cost of WFSApp.on_display_timer() for one
+        FrameSnapshot, with --gui pyqt or --gui pyside
+
+Results are compared with a JSON baseline; a benchmark whose median is
+more than its threshold slower than the baseline is a regression:
+
+    python benchmark.py --baseline benchmarks.json --update-baseline
+    python benchmark.py --baseline benchmarks.json
+
+The baseline stores a default "threshold" and optional per-benchmark
+"thresholds", e.g. {"update/WFS20:0/total": 0.1}.
+"""
+import argparse
+import inspect
+import json
+import logging
+import platform
+import sys
+import time
+
+import numpy as np
+
+from acquisition import AcquisitionWorker
+from backend import StubLibrary, deref, set_grid, set_value
+from display import SPOTFIELD_DISPLAY_WIDTH, FrameSnapshot
+from wfs import WFS, setup_logging
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+BENCHMARK_VERSION = 1
+DEFAULT_THRESHOLD = 0.25
+# Ignore regressions smaller than this, timer noise dominates below
+MIN_DELTA_US = 5.0
+# Camera pixel pitch in µm of each model
+CAM_PITCH_UM = {'WFS150': 4.65,
+                'WFS10': 4.65,
+                'WFS20': 5.0,
+                'WFS30': 5.86,
+                'WFS40': 5.5}
+# Methods that are not benchmarked on their own
+SKIP_METHODS = ('_init', '_close')
+
+log_benchmark = logging.getLogger('WFS.benchmark')
+
+
+class SimulatedLibrary(StubLibrary):
+    """Driver stand-in producing synthetic measurement data.
+
+    Every spotfield image has one spot per lenslet and every
+    measurement fills the spot arrays of the configured resolution,
+    so the wrapper moves as much data as with a live sensor.
+
+    Args:
+        model (str): Instrument model, a key of WFS.cam_res_id.
+        seed (int): Seed of the random spot deviations.
+    """
+
+    def __init__(self, model='WFS20', seed=0):
+        super(SimulatedLibrary, self).__init__(instrument_name=f'{model}-5C'.encode(),
+                                               cam_pitch_um=CAM_PITCH_UM[model])
+        self.random = np.random.default_rng(seed)
+        self.deviations = None
+
+    def WFS_ConfigureCam(self, instrument_handle, pixel_format, cam_resolution_index, spots_x, spots_y):
+        status = super(SimulatedLibrary, self).WFS_ConfigureCam(instrument_handle, pixel_format,
+                                                                cam_resolution_index, spots_x, spots_y)
+        _, _, factor = self.resolution()
+        lenslet_pixels = self.lenslet_pitch_um / (self.cam_pitch_um * factor)
+        columns, rows = self.spot_count()
+        centers_x = ((np.arange(columns) + 1) * lenslet_pixels).astype(int)
+        centers_y = ((np.arange(rows) + 1) * lenslet_pixels).astype(int)
+        self.image[np.ix_(centers_y, centers_x)] = 200
+        self.deviations = self.random.normal(0, 0.1, (2, rows, columns))
+        return status
+
+    def WFS_TakeSpotfieldImageAutoExpos(self, instrument_handle, exposure_time_actual, master_gain_actual):
+        set_value(exposure_time_actual, 1.0)
+        set_value(master_gain_actual, 1.0)
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotCentroids(self, instrument_handle, array_centroid_x, array_centroid_y):
+        rows, columns = self.deviations.shape[1:]
+        grid_x, grid_y = np.meshgrid(np.arange(columns), np.arange(rows))
+        set_grid(array_centroid_x, grid_x * 30.0 + self.deviations[0])
+        set_grid(array_centroid_y, grid_y * 30.0 + self.deviations[1])
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotDeviations(self, instrument_handle, array_deviations_x, array_deviations_y):
+        set_grid(array_deviations_x, self.deviations[0])
+        set_grid(array_deviations_y, self.deviations[1])
+        return WFS.WFS_SUCCESS
+
+    def WFS_CalcWavefront(self, instrument_handle, wavefront_type, limit_to_pupil, array_wavefront):
+        set_grid(array_wavefront, np.cumsum(self.deviations[0], axis=1))
+        return WFS.WFS_SUCCESS
+
+    def WFS_ZernikeLsf(self, instrument_handle, zernike_orders, array_zernike_um, array_zernike_orders_um, roc_mm):
+        if deref(zernike_orders).value == WFS.ZERNIKE_ORDERS_AUTO:
+            set_value(zernike_orders, 4)
+        modes = WFS.zernike_modes_per_order[deref(zernike_orders).value]
+        np.ctypeslib.as_array(deref(array_zernike_um))[1:modes + 1] = self.deviations[0, 0, 0]
+        set_value(roc_mm, 1000.0 + self.deviations[1, 0, 0])
+        return WFS.WFS_SUCCESS
+
+
+def measure(function, repeat):
+    """Time repeated calls of a function.
+
+    Args:
+        function: Function called without arguments.
+        repeat (int): Number of timed calls.
+
+    Returns:
+        dict: median, p95, min and mean duration in µs.
+    """
+    durations = np.empty(repeat)
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations[index] = time.perf_counter() - start
+    return summarize(durations * 1e6)
+
+
+def summarize(durations_us):
+    """Summarize durations in µs."""
+    durations_us = np.asarray(durations_us)
+    return {'median_us': float(np.median(durations_us)),
+            'p95_us': float(np.percentile(durations_us, 95)),
+            'min_us': float(durations_us.min()),
+            'mean_us': float(durations_us.mean())}
+
+
+def connected_wfs(model='WFS20', cam_resolution_index=0):
+    """Get a configured WFS on a simulated driver."""
+    wfs = WFS(lib=SimulatedLibrary(model))
+    wfs.connect()
+    wfs.config()
+    if cam_resolution_index != 0:
+        wfs._configure_cam(cam_resolution_index=cam_resolution_index)
+    return wfs
+
+
+def benchmark_methods(repeat=100):
+    """Benchmark every WFS._* method that has no required arguments.
+
+    Args:
+        repeat (int): Number of timed calls per method.
+
+    Returns:
+        dict: Summary for each method name.
+    """
+    wfs = connected_wfs()
+    wfs.update()
+    results = {}
+    for name, method in inspect.getmembers(wfs, inspect.ismethod):
+        if not name.startswith('_') or name.startswith('__') or name in SKIP_METHODS:
+            continue
+        parameters = inspect.signature(method).parameters.values()
+        if any(parameter.default is inspect.Parameter.empty for parameter in parameters):
+            continue
+        try:
+            method()
+        except Exception as e:
+            log_benchmark.warning(f'{name} skipped: {e!r}')
+            continue
+        results[name] = measure(method, repeat)
+    return results
+
+
+def benchmark_update(wfs, repeat=20):
+    """Benchmark WFS.update() end-to-end and per stage.
+
+    Each WFS method called by update() is timed as one stage.
+
+    Args:
+        wfs (WFS): Configured WFS.
+        repeat (int): Number of timed updates.
+
+    Returns:
+        dict: {'total': summary, 'stages': {method name: summary}}
+    """
+    stages = {}
+
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            stages.setdefault(name, []).append(time.perf_counter() - start)
+            return result
+        return wrapper
+
+    wfs.update()
+    wrapped = [name for name, _ in inspect.getmembers(wfs, inspect.ismethod)
+               if name.startswith('_') and not name.startswith('__')]
+    for name in wrapped:
+        setattr(wfs, name, timed(name, getattr(wfs, name)))
+    try:
+        total = measure(wfs.update, repeat)
+    finally:
+        for name in wrapped:
+            delattr(wfs, name)
+    return {'total': total,
+            'stages': {name: summarize(np.array(durations) * 1e6) for name, durations in stages.items()}}
+
+
+def benchmark_resolutions(repeat=20, models=None):
+    """Benchmark WFS.update() for each camera resolution.
+
+    Args:
+        repeat (int): Number of timed updates per resolution.
+        models (list): Models to benchmark, all of WFS.cam_res_id if None.
+
+    Returns:
+        dict: Results of benchmark_update() for each 'model:index'.
+    """
+    results = {}
+    for model in models or WFS.cam_res_id:
+        for cam_resolution_index in WFS.cam_res_id[model]:
+            wfs = connected_wfs(model, cam_resolution_index)
+            results[f'{model}:{cam_resolution_index}'] = benchmark_update(wfs, repeat)
+    return results
+
+
+def benchmark_gui(repeat=20, binding=None):
+    """Benchmark the GUI rendering of one WFS frame.
+
+    main.py selects its Qt binding from the -pyqt or -pyside command
+    line flag when it is imported, as for python main.py -pyqt.
+
+    Args:
+        repeat (int): Number of timed calls.
+        binding (str): Qt binding of the GUI, 'pyqt' or 'pyside'; None
+            skips the GUI benchmark.
+
+    Returns:
+        dict: Summary for each benchmarked slot, or None if the GUI
+            cannot be loaded.
+    """
+    if binding is None:
+        log_benchmark.warning('GUI benchmark skipped: no Qt binding selected')
+        return None
+    argv = sys.argv
+    sys.argv = argv + [f'-{binding}']
+    try:
+        import main
+    except (ImportError, OSError) as e:
+        log_benchmark.warning(f'GUI benchmark skipped: {e!r}')
+        return None
+    finally:
+        sys.argv = argv
+    app = main.QApplication.instance() or main.QApplication(['benchmark', '-platform', 'offscreen'])
+    wfs = connected_wfs()
+    window = main.WFSApp(wfs=wfs)
+    # One frame as the acquisition worker delivers it
+    wfs.update()
+    wfs._get_xy_scale()
+    wfs._get_spot_reference_positions()
+    snapshot = FrameSnapshot(wfs)
+    AcquisitionWorker(wfs, window.wfs_thread.mailbox, SPOTFIELD_DISPLAY_WIDTH).add_spotfield(snapshot)
+
+    def display_frame():
+        window.wfs_thread.mailbox.put(snapshot)
+        # Render the rate-limited wavefront surface on every call
+        window.wavefront_surface.last_update = None
+        window.on_display_timer()
+
+    # The first frame creates the plots
+    display_frame()
+    result = {'on_display_timer': measure(display_frame, repeat),
+              'plot_wavefront': measure(lambda: window.plot_wavefront(snapshot), repeat)}
+    window.close()
+    app.processEvents()
+    return result
+
+
+def run(repeat=20, models=None, gui=None):
+    """Run all benchmarks.
+
+    Args:
+        repeat (int): Number of timed calls per benchmark; methods are
+            called 5 times as often.
+        models (list): Models for the update() benchmarks.
+        gui (str): Qt binding of the GUI benchmark, 'pyqt' or 'pyside';
+            None skips it.
+
+    Returns:
+        dict: Benchmark results.
+    """
+    return {'version': BENCHMARK_VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'log_level': logging.getLevelName(logging.getLogger('WFS').getEffectiveLevel()),
+            'repeat': repeat,
+            'methods': benchmark_methods(repeat * 5),
+            'update': benchmark_resolutions(repeat, models),
+            'gui': benchmark_gui(repeat, gui)}
+
+
+def flatten(results):
+    """Get the median of every benchmark by 'section/name[/stage]'."""
+    medians = {}
+    for name, summary in results['methods'].items():
+        medians[f'methods/{name}'] = summary['median_us']
+    for resolution, update in results['update'].items():
+        medians[f'update/{resolution}/total'] = update['total']['median_us']
+        for stage, summary in update['stages'].items():
+            medians[f'update/{resolution}/{stage}'] = summary['median_us']
+    for name, summary in (results['gui'] or {}).items():
+        medians[f'gui/{name}'] = summary['median_us']
+    return medians
+
+
+def compare(results, baseline, threshold=None):
+    """Compare benchmark results with a baseline.
+
+    Args:
+        results (dict): Results of run().
+        baseline (dict): Baseline results with optional 'threshold'
+            and 'thresholds' entries.
+        threshold (float): Allowed relative slowdown, overrides the
+            default threshold of the baseline.
+
+    Returns:
+        list of (name, baseline µs, current µs, threshold) tuples
+            of every regression.
+    """
+    if threshold is None:
+        threshold = baseline.get('threshold', DEFAULT_THRESHOLD)
+    thresholds = baseline.get('thresholds', {})
+    current = flatten(results)
+    regressions = []
+    for name, reference in flatten(baseline).items():
+        if name not in current:
+            continue
+        limit = thresholds.get(name, threshold)
+        if current[name] > reference * (1 + limit) and current[name] - reference > MIN_DELTA_US:
+            regressions.append((name, reference, current[name], limit))
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line.
+
+    Returns:
+        int: 1 if a benchmark regressed, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the WFS wrapper against a simulated driver')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per benchmark')
+    parser.add_argument('--models', nargs='+', choices=list(WFS.cam_res_id), help='models for update()')
+    parser.add_argument('--gui', choices=('pyqt', 'pyside'), help='benchmark the GUI with this Qt binding')
+    parser.add_argument('--log-level', help='level of the WFS logger while benchmarking')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON baseline to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as new baseline')
+    parser.add_argument('--threshold', type=float, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if args.log_level:
+        logging.getLogger('WFS').setLevel(args.log_level.upper())
+    results = run(args.repeat, args.models, gui=args.gui)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and args.update_baseline:
+        results['threshold'] = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, reference, current, limit in regressions:
+            print(f'REGRESSION {name}: {reference:.1f} µs -> {current:.1f} µs (> {limit:.0%})')
+        print(f'{len(regressions)} regressions against {args.baseline}')
+        return 1 if regressions else 0
+    for resolution, update in results['update'].items():
+        print(f'update {resolution}: {update["total"]["median_us"]:.1f} µs')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""Camera calibration stages for the spotfield image.
+
+The stages are added to WFS.image_stages and correct the spotfield view
+in place before the driver calculates the spots.
+
+DarkFrameLibrary stores averaged dark frames for each exposure time,
+master gain and camera resolution index and subtracts the matching
+dark frame, interpolated between the captured exposure times:
+
+    darks = DarkFrameLibrary()
+    # Block the beam
+    for exposure in (0.1, 1, 10):
+        wfs._set_exposure_time(exposure)
+        darks.capture(wfs, frames=32)
+    darks.save('darks.npz')
+    wfs.image_stages.append(darks)
+
+FlatField corrects the pixel response non-uniformity (PRNU) with a gain
+map per camera resolution index, averaged from frames of uniform
+illumination. Add it after the dark frame stage:
+
+    flat = FlatField()
+    # Illuminate the camera uniformly
+    flat.capture(wfs, frames=64, darks=darks)
+    flat.save('flat.npz')
+    wfs.image_stages.append(flat)
+
+HotPixelMask finds hot and flickering pixels in a stack of dark frames
+and replaces them by the mean of their good neighbours, per camera
+serial number and resolution index. Add it after the dark frame stage:
+
+    hot_pixels = HotPixelMask()
+    # Block the beam, use the longest exposure time
+    hot_pixels.capture(wfs, frames=32)
+    hot_pixels.save('hot_pixels.npz')
+    wfs.image_stages.append(hot_pixels)
+"""
+import bisect
+import logging
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+# Dark frames are stored as uint16 fixed point with 4 fractional bits
+DARK_SCALE = 16
+# Steps of the interpolation weight between two dark frames, so small
+# auto-exposure changes reuse the prepared dark frame
+DARK_WEIGHT_STEPS = 64
+# Limits of the flat-field gain, pixels outside are left uncorrected
+FLAT_GAIN_MIN = 0.5
+FLAT_GAIN_MAX = 2.0
+# Threshold of the hot pixel detection in robust standard deviations
+HOT_PIXEL_SIGMA = 6.0
+# Scale of the median absolute deviation to the standard deviation
+MAD_TO_STD = 1.4826
+
+log_calibration = logging.getLogger('WFS.calibration')
+
+
+def grab_frames(wfs, frames):
+    """Take spotfield images without running the image stages.
+
+    Args:
+        wfs (WFS): Connected and configured WFS.
+        frames (int): Number of images.
+
+    Yields:
+        np.ndarray: uint8 [rows][columns] view of each image, valid
+            until the next image is taken.
+    """
+    for _ in range(frames):
+        wfs._take_spotfield_image()
+        wfs._get_spotfield_image()
+        image = wfs.spotfield_view()
+        if image is None:
+            raise RuntimeError('No spotfield image available')
+        yield image
+
+
+def mean_frame(wfs, frames):
+    """Average spotfield images.
+
+    Args:
+        wfs (WFS): Connected and configured WFS.
+        frames (int): Number of images.
+
+    Returns:
+        np.ndarray: float32 [rows][columns] mean image.
+    """
+    total = None
+    for image in grab_frames(wfs, frames):
+        if total is None:
+            total = np.zeros(image.shape, dtype=np.uint32)
+        total += image
+    return (total / frames).astype(np.float32)
+
+
+def settings(wfs):
+    """Get (exposure time in ms, master gain, camera resolution index) of a WFS."""
+    return (round(wfs.exposure_time_actual.value, 6), round(wfs.master_gain_actual.value, 6),
+            wfs.cam_resolution_index.value)
+
+
+class DarkFrameLibrary(object):
+    """Dark frames keyed by exposure time, master gain and resolution.
+
+    Used as image stage, the dark frame matching the current settings
+    of the WFS is subtracted from the spotfield image, clipped at 0.
+    The dark frame is prepared once per setting, so each frame costs a
+    single saturating subtraction. The interpolation weight between two
+    captured exposure times is quantized to DARK_WEIGHT_STEPS, so the
+    small exposure changes of auto-exposure keep the prepared frame.
+    """
+
+    def __init__(self):
+        # {(gain, cam_resolution_index): {exposure: uint16 fixed point dark frame}}
+        self.darks = {}
+        self._key = None
+        self._dark = None
+        self._blend = None
+        self._missing = set()
+
+    def __len__(self):
+        return sum(len(exposures) for exposures in self.darks.values())
+
+    def add(self, exposure, gain, cam_resolution_index, dark):
+        """Add a dark frame.
+
+        Args:
+            exposure (float): Exposure time in ms.
+            gain (float): Master gain.
+            cam_resolution_index (int): Camera resolution index.
+            dark (np.ndarray): Mean dark frame.
+        """
+        fixed = np.clip(np.rint(np.asarray(dark, dtype=np.float32) * DARK_SCALE), 0, np.iinfo(np.uint16).max)
+        self.darks.setdefault((gain, cam_resolution_index), {})[exposure] = fixed.astype(np.uint16)
+        self._key = None
+
+    def capture(self, wfs, frames=16):
+        """Capture a dark frame at the current settings of the WFS.
+
+        The beam must be blocked.
+
+        Args:
+            wfs (WFS): Connected and configured WFS.
+            frames (int): Number of averaged frames.
+
+        Returns:
+            tuple: (exposure, gain, cam_resolution_index) of the frame.
+        """
+        dark = mean_frame(wfs, frames)
+        key = settings(wfs)
+        self.add(*key, dark)
+        log_calibration.info(f'Dark frame captured: exposure {key[0]} ms, gain {key[1]}, resolution {key[2]}')
+        return key
+
+    def dark(self, exposure, gain, cam_resolution_index):
+        """Get the dark frame for a setting.
+
+        Between two captured exposure times the dark frame is linearly
+        interpolated, outside the captured range the nearest one is used.
+
+        Returns:
+            np.ndarray: float32 dark frame, or None if there is no dark
+                frame for the gain and resolution.
+        """
+        exposures = self.darks.get((gain, cam_resolution_index))
+        if not exposures:
+            return None
+        low, high, weight = self.bracket(exposures, exposure)
+        dark = exposures[low].astype(np.float32)
+        if weight:
+            dark += np.float32(weight) * (exposures[high].astype(np.float32) - dark)
+        return dark / np.float32(DARK_SCALE)
+
+    @staticmethod
+    def bracket(exposures, exposure):
+        """Find the captured exposure times around an exposure time.
+
+        Args:
+            exposures (dict): {exposure: dark frame} of one gain and
+                resolution.
+            exposure (float): Exposure time in ms.
+
+        Returns:
+            tuple: (low, high, weight) exposure times and the weight of
+                high; outside the captured range low == high.
+        """
+        times = sorted(exposures)
+        index = bisect.bisect_left(times, exposure)
+        if index < len(times) and times[index] == exposure:
+            return exposure, exposure, 0.0
+        if index == 0:
+            return times[0], times[0], 0.0
+        if index == len(times):
+            return times[-1], times[-1], 0.0
+        low, high = times[index - 1], times[index]
+        return low, high, (exposure - low) / (high - low)
+
+    def subtract(self, image, exposure, gain, cam_resolution_index):
+        """Subtract the dark frame for a setting from an image in place.
+
+        Returns:
+            bool: False if there is no dark frame for the setting.
+        """
+        exposures = self.darks.get((gain, cam_resolution_index))
+        if not exposures or next(iter(exposures.values())).shape != image.shape:
+            missing = (gain, cam_resolution_index, image.shape)
+            if missing not in self._missing:
+                self._missing.add(missing)
+                log_calibration.warning(f'No dark frame for exposure {exposure} ms, gain {gain}, '
+                                        f'resolution {cam_resolution_index}')
+            return False
+        low, high, weight = self.bracket(exposures, exposure)
+        step = round(weight * DARK_WEIGHT_STEPS)
+        key = (gain, cam_resolution_index, low, high, step)
+        if key != self._key:
+            self._prepare(exposures[low], exposures[high], step / DARK_WEIGHT_STEPS)
+            self._key = key
+        # Saturating subtraction: image = max(image, dark) - dark
+        np.maximum(image, self._dark, out=image)
+        image -= self._dark
+        return True
+
+    def _prepare(self, low, high, weight):
+        """Blend two fixed point dark frames into the reused uint8 dark frame."""
+        if self._blend is None or self._blend.shape != low.shape:
+            self._blend = np.empty(low.shape, dtype=np.float32)
+            self._dark = np.empty(low.shape, dtype=np.uint8)
+        blend = self._blend
+        np.subtract(high, low, out=blend, dtype=np.float32)
+        blend *= np.float32(weight)
+        blend += low
+        blend *= np.float32(1 / DARK_SCALE)
+        np.rint(blend, out=blend)
+        np.clip(blend, 0, 255, out=blend)
+        np.copyto(self._dark, blend, casting='unsafe')
+
+    def __call__(self, image, wfs):
+        """Image stage: subtract the dark frame matching the WFS settings."""
+        self.subtract(image, *settings(wfs))
+
+    def save(self, path):
+        """Save all dark frames into a compressed .npz file."""
+        keys = []
+        arrays = {}
+        for (gain, cam_resolution_index), exposures in self.darks.items():
+            for exposure, dark in exposures.items():
+                arrays[f'dark_{len(keys)}'] = dark
+                keys.append((exposure, gain, cam_resolution_index))
+        np.savez_compressed(path, keys=np.array(keys, dtype=np.float64).reshape(-1, 3), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load dark frames saved with save()."""
+        library = cls()
+        with np.load(path) as data:
+            for index, (exposure, gain, cam_resolution_index) in enumerate(data['keys']):
+                dark = data[f'dark_{index}']
+                library.darks.setdefault((float(gain), int(cam_resolution_index)), {})[float(exposure)] = dark
+        return library
+
+
+class FlatField(object):
+    """Pixel response non-uniformity correction per camera resolution.
+
+    The gain map is the mean of a flat frame divided by each pixel, so
+    multiplying an image by it equalizes the pixel responses. Gains
+    outside FLAT_GAIN_MIN to FLAT_GAIN_MAX (dead or hot pixels) are set
+    to 1. The float32 gain map and a scratch buffer are cached for the
+    current resolution, so the correction does not allocate per frame.
+    """
+
+    def __init__(self):
+        # {cam_resolution_index: float32 gain map}
+        self.gains = {}
+        self._key = None
+        self._gain = None
+        self._scratch = None
+        self._missing = set()
+
+    def __len__(self):
+        return len(self.gains)
+
+    def add(self, cam_resolution_index, flat):
+        """Add a gain map from a dark-subtracted mean flat frame.
+
+        Args:
+            cam_resolution_index (int): Camera resolution index.
+            flat (np.ndarray): Mean frame of uniform illumination.
+
+        Returns:
+            np.ndarray: float32 gain map.
+        """
+        flat = np.asarray(flat, dtype=np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = np.float32(flat.mean()) / flat
+        gain[~np.isfinite(gain) | (gain < FLAT_GAIN_MIN) | (gain > FLAT_GAIN_MAX)] = 1
+        self.gains[cam_resolution_index] = gain.astype(np.float32)
+        self._key = None
+        return self.gains[cam_resolution_index]
+
+    def capture(self, wfs, frames=16, darks=None):
+        """Capture a gain map at the current resolution of the WFS.
+
+        The camera must be illuminated uniformly and not saturated.
+
+        Args:
+            wfs (WFS): Connected and configured WFS.
+            frames (int): Number of averaged frames.
+            darks (DarkFrameLibrary): Dark frames subtracted from the
+                mean flat frame.
+
+        Returns:
+            np.ndarray: float32 gain map.
+        """
+        flat = mean_frame(wfs, frames)
+        exposure, gain, cam_resolution_index = settings(wfs)
+        if darks is not None:
+            dark = darks.dark(exposure, gain, cam_resolution_index)
+            if dark is not None and dark.shape == flat.shape:
+                flat -= dark
+        log_calibration.info(f'Flat field captured: resolution {cam_resolution_index}, mean {flat.mean():.1f}')
+        return self.add(cam_resolution_index, flat)
+
+    def correct(self, image, cam_resolution_index):
+        """Correct an image in place.
+
+        Returns:
+            bool: False if there is no gain map for the resolution.
+        """
+        key = (cam_resolution_index, image.shape)
+        if key != self._key:
+            gain = self.gains.get(cam_resolution_index)
+            if gain is None or gain.shape != image.shape:
+                if key not in self._missing:
+                    self._missing.add(key)
+                    log_calibration.warning(f'No flat field for resolution {cam_resolution_index}')
+                return False
+            self._gain = np.ascontiguousarray(gain, dtype=np.float32)
+            self._scratch = np.empty(image.shape, dtype=np.float32)
+            self._key = key
+        scratch = self._scratch
+        np.multiply(image, self._gain, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.minimum(scratch, 255, out=scratch)
+        np.copyto(image, scratch, casting='unsafe')
+        return True
+
+    def __call__(self, image, wfs):
+        """Image stage: correct the image at the WFS resolution."""
+        self.correct(image, wfs.cam_resolution_index.value)
+
+    def save(self, path):
+        """Save all gain maps into a compressed .npz file."""
+        np.savez_compressed(path, **{f'gain_{index}': gain for index, gain in self.gains.items()})
+
+    @classmethod
+    def load(cls, path):
+        """Load gain maps saved with save()."""
+        flat = cls()
+        with np.load(path) as data:
+            for name in data.files:
+                flat.gains[int(name.split('_', 1)[1])] = data[name].astype(np.float32)
+        return flat
+
+
+def detect_hot_pixels(stack, sigma=HOT_PIXEL_SIGMA):
+    """Find hot and flickering pixels in a stack of dark frames.
+
+    A pixel is hot if its temporal median, or flickering if its
+    temporal median absolute deviation (MAD), lies more than sigma
+    robust standard deviations above the median over all pixels.
+
+    Args:
+        stack (np.ndarray): [frames][rows][columns] dark frames.
+        sigma (float): Threshold in robust standard deviations.
+
+    Returns:
+        np.ndarray: Sorted int32 flat indices of the bad pixels.
+    """
+    stack = np.asarray(stack)
+    median = np.median(stack, axis=0)
+    mad = np.median(np.abs(stack - median), axis=0)
+    bad = np.zeros(median.shape, dtype=bool)
+    for values in (median, mad):
+        center = np.median(values)
+        spread = max(MAD_TO_STD * np.median(np.abs(values - center)), 1.0)
+        bad |= values > center + sigma * spread
+    return np.flatnonzero(bad).astype(np.int32)
+
+
+class HotPixelMask(object):
+    """Sparse bad pixel index per camera serial number and resolution.
+
+    Each bad pixel is replaced by the mean of its good 4-neighbours. The
+    neighbour indices and weights are prepared once per camera and
+    resolution, so a frame costs one gather and one scatter of the bad
+    pixels only.
+
+    Args:
+        sigma (float): Threshold of the detection in robust standard
+            deviations.
+    """
+
+    def __init__(self, sigma=HOT_PIXEL_SIGMA):
+        self.sigma = sigma
+        # {(serial_number_camera, cam_resolution_index): int32 flat indices}
+        self.pixels = {}
+        self._key = None
+        self._bad = None
+        self._neighbours = None
+        self._weights = None
+        self._missing = set()
+
+    def __len__(self):
+        return sum(len(pixels) for pixels in self.pixels.values())
+
+    def add(self, serial_number_camera, cam_resolution_index, pixels):
+        """Add the bad pixels of a camera and resolution.
+
+        Args:
+            serial_number_camera (str): Camera serial number.
+            cam_resolution_index (int): Camera resolution index.
+            pixels (np.ndarray): Flat indices of the bad pixels.
+        """
+        self.pixels[(serial_number_camera, cam_resolution_index)] = np.unique(np.asarray(pixels, dtype=np.int32))
+        self._key = None
+
+    def capture(self, wfs, frames=32):
+        """Detect the bad pixels at the current settings of the WFS.
+
+        The beam must be blocked.
+
+        Args:
+            wfs (WFS): Connected and configured WFS.
+            frames (int): Number of dark frames.
+
+        Returns:
+            np.ndarray: Flat indices of the bad pixels.
+        """
+        stack = None
+        for index, image in enumerate(grab_frames(wfs, frames)):
+            if stack is None:
+                stack = np.empty((frames,) + image.shape, dtype=np.uint8)
+            stack[index] = image
+        pixels = detect_hot_pixels(stack, self.sigma)
+        key = self.camera(wfs)
+        self.add(*key, pixels)
+        log_calibration.info(f'{len(pixels)} hot pixels found: camera {key[0]}, resolution {key[1]}')
+        return self.pixels[key]
+
+    @staticmethod
+    def camera(wfs):
+        """Get (camera serial number, camera resolution index) of a WFS."""
+        return wfs.serial_number_camera.value.decode(), wfs.cam_resolution_index.value
+
+    def _prepare(self, pixels, shape):
+        """Get the neighbour indices and weights of the bad pixels."""
+        rows, columns = shape
+        row, column = np.divmod(pixels.astype(np.int64), columns)
+        bad = np.zeros(rows * columns, dtype=bool)
+        bad[pixels] = True
+        neighbours = np.empty((len(pixels), 4), dtype=np.int64)
+        weights = np.empty((len(pixels), 4), dtype=np.float32)
+        for i, (dy, dx) in enumerate(((-1, 0), (1, 0), (0, -1), (0, 1))):
+            y = row + dy
+            x = column + dx
+            inside = (y >= 0) & (y < rows) & (x >= 0) & (x < columns)
+            index = np.where(inside, y * columns + x, 0)
+            neighbours[:, i] = index
+            weights[:, i] = inside & ~bad[index]
+        total = weights.sum(axis=1, keepdims=True)
+        # Pixels without a good neighbour are set to 0
+        np.divide(weights, total, out=weights, where=total > 0)
+        return neighbours, weights
+
+    def apply(self, image, serial_number_camera, cam_resolution_index):
+        """Replace the bad pixels of an image in place.
+
+        Returns:
+            bool: False if there is no bad pixel index for the camera.
+        """
+        key = (serial_number_camera, cam_resolution_index, image.shape)
+        if key != self._key:
+            pixels = self.pixels.get(key[:2])
+            if pixels is None or (len(pixels) and pixels[-1] >= image.size):
+                if key not in self._missing:
+                    self._missing.add(key)
+                    log_calibration.warning(f'No hot pixels for camera {serial_number_camera}, '
+                                            f'resolution {cam_resolution_index}')
+                return False
+            self._bad = pixels
+            self._neighbours, self._weights = self._prepare(pixels, image.shape)
+            self._key = key
+        flat = image.reshape(-1)
+        values = np.einsum('ij,ij->i', flat[self._neighbours], self._weights)
+        flat[self._bad] = np.rint(values)
+        return True
+
+    def __call__(self, image, wfs):
+        """Image stage: replace the bad pixels of the WFS camera."""
+        self.apply(image, *self.camera(wfs))
+
+    def save(self, path):
+        """Save all bad pixel indices into a compressed .npz file."""
+        keys = list(self.pixels)
+        np.savez_compressed(path,
+                            serials=np.array([serial for serial, _ in keys], dtype=str),
+                            resolutions=np.array([index for _, index in keys], dtype=np.int32),
+                            **{f'pixels_{i}': self.pixels[key] for i, key in enumerate(keys)})
+
+    @classmethod
+    def load(cls, path):
+        """Load bad pixel indices saved with save()."""
+        mask = cls()
+        with np.load(path) as data:
+            for i, (serial, index) in enumerate(zip(data['serials'], data['resolutions'])):
+                mask.pixels[(str(serial), int(index))] = data[f'pixels_{i}']
+        return mask
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Record WFS driver calls and replay them without hardware.
+
+TracingLibrary wraps the loaded WFS .dll and records every WFS_* call:
+the arguments passed by value, the contents of every output buffer the
+driver changed, the status code and the call duration.
+
+    wfs = WFS()
+    wfs.lib = TracingLibrary('update.trace', wfs.lib)
+    wfs.connect()
+    ...
+    wfs.lib.close()
+
+TraceReplayLibrary plays such a trace back on any machine. Given the
+same call sequence it writes byte-identical output buffers and returns
+the recorded status codes, optionally taking the recorded time.
+
+    wfs = WFS(lib=TraceReplayLibrary('update.trace', timing=True))
+
+A trace file is a sequence of calls, each stored as a little-endian
+uint32 header length, a JSON header and the raw output blobs:
+    {"f": function name,
+     "a": arguments, [kind, value] with kind 'v' for values passed
+          by value and 'b' for buffers with their size,
+     "s": status code,
+     "ns": duration in ns,
+     "o": [[argument index, blob size], ...] changed output buffers,
+     "p": [argument index, blob size] memory behind a returned pointer}
+"""
+import ctypes
+import json
+import logging
+import struct
+import threading
+import time
+
+from backend import deref
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+HEADER_SIZE = struct.Struct('<I')
+# Functions returning a pointer to driver memory: (pointer, rows, columns) argument indexes
+POINTER_OUTPUTS = {'WFS_GetSpotfieldImage': (1, 2, 3)}
+
+log_trace = logging.getLogger('WFS.trace')
+
+
+def is_buffer(obj):
+    """Check if the driver may write to an argument."""
+    return isinstance(obj, (ctypes.Array, ctypes._SimpleCData))
+
+
+def buffer_bytes(obj):
+    """Get a copy of the memory of a ctypes object."""
+    return ctypes.string_at(ctypes.addressof(obj), ctypes.sizeof(obj))
+
+
+def describe(arg):
+    """Describe an argument for the trace header.
+
+    Args:
+        arg: Argument passed to a driver function.
+
+    Returns:
+        list: ['v', value] for values, ['b', size] for buffers.
+    """
+    obj = deref(arg)
+    if obj is arg and isinstance(obj, ctypes._SimpleCData):
+        return ['v', obj.value if not isinstance(obj.value, bytes) else obj.value.decode(errors='replace')]
+    if is_buffer(obj):
+        return ['b', ctypes.sizeof(obj)]
+    return ['v', obj]
+
+
+def read_pointer(obj):
+    """Read a pointer value stored in a ctypes object."""
+    return ctypes.c_void_p.from_buffer_copy(buffer_bytes(obj)[:ctypes.sizeof(ctypes.c_void_p)]).value
+
+
+class TracingLibrary(object):
+    """Record every call made to a driver library.
+
+    Args:
+        path (str): Trace file to write.
+        lib: Loaded driver library to forward calls to.
+    """
+
+    def __init__(self, path, lib):
+        self.path = path
+        self.lib = lib
+        self.file = open(path, 'wb')
+        self.lock = threading.Lock()
+        self.call_count = 0
+
+    def __getattr__(self, name):
+        if not name.startswith('WFS_'):
+            raise AttributeError(name)
+        function = getattr(self.lib, name)
+
+        def traced(*args):
+            return self.call(name, function, args)
+        traced.__name__ = name
+        setattr(self, name, traced)
+        return traced
+
+    def call(self, name, function, args):
+        """Call a driver function and record the call.
+
+        Args:
+            name (str): Function name.
+            function: Driver function.
+            args (tuple): Arguments.
+
+        Returns:
+            Status code of the driver function.
+        """
+        objects = [deref(arg) for arg in args]
+        before = [buffer_bytes(obj) if is_buffer(obj) and (obj is not arg or isinstance(obj, ctypes.Array)) else None
+                  for obj, arg in zip(objects, args)]
+        start = time.perf_counter_ns()
+        status = function(*args)
+        duration = time.perf_counter_ns() - start
+        outputs = []
+        blobs = []
+        for index, (obj, data) in enumerate(zip(objects, before)):
+            if data is None:
+                continue
+            after = buffer_bytes(obj)
+            if after != data:
+                outputs.append([index, len(after)])
+                blobs.append(after)
+        header = {'f': name, 'a': [describe(arg) for arg in args], 's': status, 'ns': duration, 'o': outputs}
+        if name in POINTER_OUTPUTS and status == 0:
+            pointer, rows, columns = POINTER_OUTPUTS[name]
+            address = read_pointer(objects[pointer])
+            size = deref(args[rows]).value * deref(args[columns]).value
+            if address and size > 0:
+                header['p'] = [pointer, size]
+                blobs.append(ctypes.string_at(address, size))
+        encoded = json.dumps(header).encode()
+        with self.lock:
+            self.file.write(HEADER_SIZE.pack(len(encoded)))
+            self.file.write(encoded)
+            for blob in blobs:
+                self.file.write(blob)
+            self.call_count += 1
+        return status
+
+    def close(self):
+        """Close the trace file."""
+        with self.lock:
+            self.file.close()
+        log_trace.info(f'Traced {self.call_count} calls to {self.path}')
+
+
+def read_trace(path):
+    """Read all calls of a trace file.
+
+    Args:
+        path (str): Trace file.
+
+    Returns:
+        list of (header, blobs) tuples.
+    """
+    calls = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        (size,) = HEADER_SIZE.unpack_from(data, offset)
+        offset += HEADER_SIZE.size
+        header = json.loads(data[offset:offset + size])
+        offset += size
+        blobs = []
+        for _, blob_size in header['o'] + ([header['p']] if 'p' in header else []):
+            blobs.append(data[offset:offset + blob_size])
+            offset += blob_size
+        calls.append((header, blobs))
+    return calls
+
+
+class TraceReplayLibrary(object):
+    """Driver stand-in replaying a recorded trace.
+
+    Args:
+        path (str): Trace file recorded by TracingLibrary.
+        timing (bool): Take the recorded duration for every call.
+        strict (bool): Raise RuntimeError when a call does not match
+            the trace, otherwise log it and leave the output
+            arguments untouched.
+    """
+
+    def __init__(self, path, timing=False, strict=True):
+        self.path = path
+        self.calls = read_trace(path)
+        self.timing = timing
+        self.strict = strict
+        self.position = 0
+        self.mismatches = 0
+        # Keep pointer targets alive while the caller may use them
+        self.pointer_buffers = {}
+
+    def __len__(self):
+        return len(self.calls)
+
+    def __getattr__(self, name):
+        if not name.startswith('WFS_'):
+            raise AttributeError(name)
+
+        def replayed(*args):
+            return self.call(name, args)
+        replayed.__name__ = name
+        setattr(self, name, replayed)
+        return replayed
+
+    @property
+    def finished(self):
+        """Check if every call of the trace has been replayed."""
+        return self.position >= len(self.calls)
+
+    def _mismatch(self, message):
+        """Report a call that does not match the trace."""
+        self.mismatches += 1
+        if self.strict:
+            raise RuntimeError(message)
+        log_trace.warning(message)
+
+    def call(self, name, args):
+        """Replay the next call of the trace.
+
+        Args:
+            name (str): Function name.
+            args (tuple): Arguments.
+
+        Returns:
+            Recorded status code.
+        """
+        start = time.perf_counter()
+        if self.finished:
+            raise RuntimeError(f'{name} called after the end of the trace')
+        header, blobs = self.calls[self.position]
+        self.position += 1
+        if header['f'] != name:
+            self._mismatch(f'Call {self.position - 1}: expected {header["f"]}, got {name}')
+            return header['s']
+        if [describe(arg) for arg in args] != header['a']:
+            self._mismatch(f'Call {self.position - 1}: {name} arguments differ from the trace')
+            return header['s']
+        objects = [deref(arg) for arg in args]
+        for (index, size), blob in zip(header['o'], blobs):
+            ctypes.memmove(ctypes.addressof(objects[index]), blob, size)
+        if 'p' in header:
+            index, size = header['p']
+            buffer = ctypes.create_string_buffer(blobs[-1], size)
+            self.pointer_buffers[name] = buffer
+            address = ctypes.c_void_p(ctypes.addressof(buffer))
+            ctypes.memmove(ctypes.addressof(objects[index]), ctypes.byref(address), ctypes.sizeof(address))
+        if self.timing:
+            end = start + header['ns'] / 1e9
+            remaining = end - time.perf_counter()
+            if remaining > 0.002:
+                time.sleep(remaining - 0.001)
+            while time.perf_counter() < end:
+                pass
+        return header['s']
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Sparse run-length codec for noise-cut spotfield images.
+
+After WFS._cut_image_noise_floor() most pixels of a spotfield image are
+zero and the light sits in the small lenslet spots. encode() stores
+only the runs of non-zero pixels of the row-major image:
+
+    header     SPARSE_HEADER: magic, rows, columns, number of runs
+    starts     uint32[runs] flat index of the first pixel of each run
+    lengths    uint32[runs] number of pixels of each run
+    values     uint8[sum(lengths)] pixel values of all runs
+
+Encoding and decoding are vectorized, and decode(encode(image)) gives
+the image back exactly:
+
+    data = encode(wfs.spotfield_view())
+    image = decode(data)
+
+write() and read() frame the encoded images with their length for
+recording or streaming a sequence of images.
+"""
+import struct
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+SPARSE_MAGIC = b'WFSR'
+# Magic, rows, columns, number of runs
+SPARSE_HEADER = struct.Struct('<4sIII')
+# Length of an encoded image
+FRAME_LENGTH = struct.Struct('<I')
+
+
+def runs(image):
+    """Find the runs of non-zero pixels of an image.
+
+    Args:
+        image (np.ndarray): uint8 image.
+
+    Returns:
+        tuple: uint32 starts and lengths of the runs in the flattened
+            image.
+    """
+    nonzero = np.asarray(image).reshape(-1) != 0
+    # +1 where a run starts, -1 one past its end
+    edges = np.flatnonzero(np.diff(nonzero.view(np.int8), prepend=np.int8(0), append=np.int8(0)))
+    starts = edges[0::2]
+    return starts.astype(np.uint32), (edges[1::2] - starts).astype(np.uint32)
+
+
+def encode(image):
+    """Encode an image into sparse runs.
+
+    Args:
+        image (np.ndarray): uint8 [rows][columns] image.
+
+    Returns:
+        bytes: Encoded image.
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8 or image.ndim != 2:
+        raise ValueError('Only 2D uint8 images can be encoded')
+    starts, lengths = runs(image)
+    values = image.reshape(-1)[image.reshape(-1) != 0]
+    header = SPARSE_HEADER.pack(SPARSE_MAGIC, image.shape[0], image.shape[1], len(starts))
+    return b''.join((header, starts.tobytes(), lengths.tobytes(), values.tobytes()))
+
+
+def decode(data, out=None):
+    """Decode an image encoded with encode().
+
+    Args:
+        data (bytes): Encoded image.
+        out (np.ndarray): uint8 [rows][columns] image to decode into,
+            e.g. to reuse a buffer; allocated if None.
+
+    Returns:
+        np.ndarray: uint8 [rows][columns] image.
+    """
+    magic, rows, columns, count = SPARSE_HEADER.unpack_from(data)
+    if magic != SPARSE_MAGIC:
+        raise ValueError(f'Not a sparse spotfield image: {magic!r}')
+    offset = SPARSE_HEADER.size
+    starts = np.frombuffer(data, dtype=np.uint32, count=count, offset=offset)
+    lengths = np.frombuffer(data, dtype=np.uint32, count=count, offset=offset + 4 * count)
+    values = np.frombuffer(data, dtype=np.uint8, offset=offset + 8 * count)
+    if len(values) != lengths.sum(dtype=np.int64):
+        raise ValueError('Sparse spotfield image is truncated')
+    if out is None:
+        out = np.zeros((rows, columns), dtype=np.uint8)
+    elif out.shape != (rows, columns):
+        raise ValueError(f'Output shape {out.shape} does not match the image {(rows, columns)}')
+    else:
+        out.fill(0)
+    # Flat index of every value: its run start plus its position within the run
+    first = np.cumsum(lengths, dtype=np.int64) - lengths
+    index = np.repeat(starts.astype(np.int64) - first, lengths) + np.arange(len(values))
+    # np.put() also writes through a non-contiguous out, where reshape() would copy
+    np.put(out, index, values)
+    return out
+
+
+def write(f, image):
+    """Write an encoded image with its length to a binary file.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    data = encode(image)
+    f.write(FRAME_LENGTH.pack(len(data)))
+    f.write(data)
+    return FRAME_LENGTH.size + len(data)
+
+
+def read(f):
+    """Read an image written with write().
+
+    Returns:
+        np.ndarray: uint8 [rows][columns] image, or None at the end of
+            the file.
+    """
+    length = f.read(FRAME_LENGTH.size)
+    if len(length) < FRAME_LENGTH.size:
+        return None
+    data = f.read(FRAME_LENGTH.unpack(length)[0])
+    return decode(data)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures of the tests running WFS on a simulated driver."""
+import pytest
+
+from backend import StubLibrary
+from wfs import WFS
+
+
+@pytest.fixture
+def make_wfs():
+    """Factory of connected WFS sessions, disconnected after the test.
+
+    The factory takes the driver library, default a new StubLibrary,
+    and config=False to skip the default configuration.
+    """
+    sessions = []
+
+    def _make_wfs(lib=None, config=True):
+        _wfs = WFS(lib=StubLibrary() if lib is None else lib)
+        _wfs.connect()
+        if config:
+            _wfs.config()
+        sessions.append(_wfs)
+        return _wfs
+    yield _make_wfs
+    for session in sessions:
+        session.disconnect()
+
+
+@pytest.fixture
+def wfs(make_wfs):
+    """Connected and configured WFS on a StubLibrary."""
+    return make_wfs()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""NumPy helpers for the live GUI views, independent of Qt.
+
+The acquisition thread copies the values shown by the GUI into a
+FrameSnapshot right after WFS.update(), so the GUI can render the
+latest frame at its own rate without reading the WFS arrays while the
+next frame is being analysed. RingBuffer keeps a fixed-length history,
+e.g. of the RoC, in a preallocated array. WavefrontSurface prepares the
+z values and vertex colours of the live 3D wavefront in preallocated
+arrays, at a limited rate. downsample() and overlay_points() prepare the
+live spotfield image with the spot centroids and reference positions.
+"""
+import time
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+# Interval of the GUI display timer in ms, about 30 Hz
+DISPLAY_INTERVAL_MS = 33
+# Number of Zernike modes shown in the bar graph
+DISPLAY_ZERNIKE_MODES = 15
+# Minimum interval of the 3D wavefront surface updates in s
+SURFACE_INTERVAL = 0.1
+# Maximum width of the displayed spotfield image in pixels
+SPOTFIELD_DISPLAY_WIDTH = 480
+# Kinds of the spotfield overlay points
+OVERLAY_CENTROID = 0
+OVERLAY_REFERENCE = 1
+
+
+def gradient_lut(low=(0.2, 0.2, 1.0), high=(1.0, 0.2, 0.2), size=256):
+    """Get an RGBA float32 colour lookup table from low to high."""
+    weight = np.linspace(0, 1, size, dtype=np.float32)[:, None]
+    lut = np.ones((size, 4), dtype=np.float32)
+    lut[:, :3] = (1 - weight) * np.array(low, dtype=np.float32) + weight * np.array(high, dtype=np.float32)
+    return lut
+
+
+def spotfield_lut():
+    """Get a uint8 [256][3] black-red-yellow-white lookup table for the spotfield image."""
+    level = np.arange(256, dtype=np.float32)
+    lut = np.empty((256, 3), dtype=np.float32)
+    lut[:, 0] = level * 3
+    lut[:, 1] = level * 3 - 255
+    lut[:, 2] = level * 3 - 510
+    return np.clip(lut, 0, 255).astype(np.uint8)
+
+
+def display_factor(columns, width=SPOTFIELD_DISPLAY_WIDTH):
+    """Get the downsampling factor to show an image at most width pixels wide."""
+    return max(1, -(-columns // width))
+
+
+def downsample(image, factor):
+    """Downsample an image by the maximum of factor x factor blocks.
+
+    The maximum keeps the spots visible, a few pixels wide spots would
+    vanish from a strided subsample.
+
+    Args:
+        image (np.ndarray): [rows][columns] image, e.g. the spotfield view.
+        factor (int): Block size.
+
+    Returns:
+        np.ndarray: New [rows // factor][columns // factor] image.
+    """
+    if factor == 1:
+        return image.copy()
+    rows = image.shape[0] // factor
+    columns = image.shape[1] // factor
+    blocks = image[:rows * factor, :columns * factor].reshape(rows, factor, columns, factor)
+    return blocks.max(axis=(1, 3))
+
+
+def overlay_points(snapshot, factor=1):
+    """Get the spot centroids and reference positions for one scatter item.
+
+    Args:
+        snapshot (FrameSnapshot): Frame with centroids and references.
+        factor (int): Downsampling factor of the shown image.
+
+    Returns:
+        tuple: float32 [points][2] (x, y) positions in display pixels and
+            uint8 [points] kinds, OVERLAY_CENTROID or OVERLAY_REFERENCE.
+            Undetected spots (NaN) are left out.
+    """
+    x = np.concatenate((snapshot.centroid_x.ravel(), snapshot.reference_x.ravel()))
+    y = np.concatenate((snapshot.centroid_y.ravel(), snapshot.reference_y.ravel()))
+    kinds = np.repeat(np.array([OVERLAY_CENTROID, OVERLAY_REFERENCE], dtype=np.uint8),
+                      (snapshot.centroid_x.size, snapshot.reference_x.size))
+    valid = np.isfinite(x) & np.isfinite(y)
+    positions = np.column_stack((x[valid], y[valid])).astype(np.float32)
+    positions /= factor
+    return positions, kinds[valid]
+
+
+class RingBuffer(object):
+    """Fixed-length history of values in a preallocated array.
+
+    Args:
+        size (int): Number of values kept.
+        fill (float): Value of the history before anything is added.
+    """
+
+    def __init__(self, size, fill=0.0):
+        self.size = int(size)
+        self.values = np.full(self.size, fill, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+        self._ordered = np.empty(self.size, dtype=np.float64)
+
+    def append(self, value):
+        """Add a value, replacing the oldest one."""
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count += 1
+
+    def ordered(self):
+        """Get the history from the oldest to the newest value.
+
+        Returns:
+            np.ndarray: Reused array of size values, valid until the
+                next call.
+        """
+        tail = self.size - self.index
+        self._ordered[:tail] = self.values[self.index:]
+        self._ordered[tail:] = self.values[:self.index]
+        return self._ordered
+
+
+class FrameSnapshot(object):
+    """Copy of the values of one frame shown by the GUI.
+
+    Args:
+        wfs (WFS): WFS right after update().
+    """
+
+    def __init__(self, wfs):
+        self.frame = wfs.frame_number
+        self.stamps = wfs.frame_stamps
+        self.roc_mm = wfs.roc_mm.value
+        self.zernike_um = np.ctypeslib.as_array(wfs.array_zernike_um)[1:DISPLAY_ZERNIKE_MODES + 1].copy()
+        columns = wfs.cam_resolution_x.value or len(wfs.array_line_min)
+        self.line_min = np.ctypeslib.as_array(wfs.array_line_min)[:columns].copy()
+        self.line_max = np.ctypeslib.as_array(wfs.array_line_max)[:columns].copy()
+        spots_x = wfs.spots_x.value
+        spots_y = wfs.spots_y.value
+        # [spots_y][spots_x] wavefront in µm, NaN for undetected spots
+        self.wavefront = np.ctypeslib.as_array(wfs.array_wavefront)[:spots_y, :spots_x].copy()
+        # Lenslet positions in mm, from WFS._get_xy_scale()
+        self.scale_x = np.ctypeslib.as_array(wfs.array_scale_x)[:spots_x].copy()
+        self.scale_y = np.ctypeslib.as_array(wfs.array_scale_y)[:spots_y].copy()
+        # Spot centroids and reference positions in pixels
+        self.centroid_x = np.ctypeslib.as_array(wfs.array_centroid_x)[:spots_y, :spots_x].copy()
+        self.centroid_y = np.ctypeslib.as_array(wfs.array_centroid_y)[:spots_y, :spots_x].copy()
+        self.reference_x = np.ctypeslib.as_array(wfs.array_reference_x)[:spots_y, :spots_x].copy()
+        self.reference_y = np.ctypeslib.as_array(wfs.array_reference_y)[:spots_y, :spots_x].copy()
+        # Downsampled spotfield image, if requested from the acquisition
+        self.image = None
+        self.image_factor = 1
+
+
+class WavefrontSurface(object):
+    """Vertex data of a live 3D wavefront surface.
+
+    The x and y vertex positions are the lenslet positions and only
+    change with the spot grid. Every update writes the z values and the
+    colours from a lookup table into preallocated [spots_x][spots_y]
+    arrays, the layout of pyqtgraph's GLSurfacePlotItem. Undetected
+    spots (NaN) get z = 0 and a transparent colour.
+
+    Args:
+        interval (float): Minimum time between updates in s.
+        lut (np.ndarray): [levels][4] RGBA float colour lookup table.
+    """
+
+    def __init__(self, interval=SURFACE_INTERVAL, lut=None):
+        self.interval = interval
+        self.lut = gradient_lut() if lut is None else np.asarray(lut, dtype=np.float32)
+        self.x = None
+        self.y = None
+        self.z = None
+        self.colors = None
+        self.last_update = None
+        self._mask = None
+        self._scaled = None
+        self._levels = None
+
+    def due(self, now=None):
+        """Check if the minimum interval since the last update has passed."""
+        if now is None:
+            now = time.perf_counter()
+        return self.last_update is None or now - self.last_update >= self.interval
+
+    def update(self, wavefront, scale_x, scale_y, now=None):
+        """Write the z values and colours of a wavefront.
+
+        Args:
+            wavefront (np.ndarray): [spots_y][spots_x] wavefront.
+            scale_x (np.ndarray): X positions of the spot columns.
+            scale_y (np.ndarray): Y positions of the spot rows.
+            now (float): time.perf_counter() of the update.
+
+        Returns:
+            bool: True if the grid changed, so x and y must be set too.
+        """
+        self.last_update = time.perf_counter() if now is None else now
+        shape = (wavefront.shape[1], wavefront.shape[0])
+        resized = self.z is None or self.z.shape != shape
+        if resized:
+            self.z = np.zeros(shape, dtype=np.float32)
+            self.colors = np.zeros(shape + (4,), dtype=np.float32)
+            self._mask = np.zeros(shape, dtype=bool)
+            self._scaled = np.zeros(shape, dtype=np.float32)
+            self._levels = np.zeros(shape, dtype=np.intp)
+        if resized or not (np.array_equal(self.x, scale_x) and np.array_equal(self.y, scale_y)):
+            self.x = np.array(scale_x, dtype=np.float32)
+            self.y = np.array(scale_y, dtype=np.float32)
+            resized = True
+        z, mask = self.z, self._mask
+        np.copyto(z, wavefront.T)
+        np.isnan(z, out=mask)
+        z[mask] = 0
+        valid = ~mask
+        low, high = (z[valid].min(), z[valid].max()) if valid.any() else (0, 0)
+        scale = (len(self.lut) - 1) / (high - low) if high > low else 0
+        np.subtract(z, low, out=self._scaled)
+        self._scaled *= scale
+        np.copyto(self._levels, self._scaled, casting='unsafe')
+        np.clip(self._levels, 0, len(self.lut) - 1, out=self._levels)
+        np.take(self.lut, self._levels, axis=0, out=self.colors)
+        self.colors[mask, 3] = 0
+        return resized
@@ -52,11 +52,14 @@ class Ui_main_window(object):
         self.action_debug.setObjectName("action_debug")
         self.action_test = QtWidgets.QAction(main_window)
         self.action_test.setObjectName("action_test")
+        self.action_profile = QtWidgets.QAction(main_window)
+        self.action_profile.setObjectName("action_profile")
         self.menu_file.addAction(self.action_connect)
         self.menu_file.addAction(self.action_disconnect)
         self.menu_file.addSeparator()
         self.menu_file.addAction(self.action_settings)
         self.menu_file.addAction(self.action_debug)
+        self.menu_file.addAction(self.action_profile)
         self.menu_file.addSeparator()
         self.menu_file.addAction(self.action_quit)
         self.menubar.addAction(self.menu_file.menuAction())
@@ -92,4 +95,6 @@ class Ui_main_window(object):
         self.action_debug.setToolTip(QtWidgets.QApplication.translate("main_window", "Debug command window", None, -1))
         self.action_test.setText(QtWidgets.QApplication.translate("main_window", "Test", None, -1))
         self.action_test.setToolTip(QtWidgets.QApplication.translate("main_window", "Test Function", None, -1))
+        self.action_profile.setText(QtWidgets.QApplication.translate("main_window", "&Profile", None, -1))
+        self.action_profile.setToolTip(QtWidgets.QApplication.translate("main_window", "Profile 100 frames of the WFS update", None, -1))
 
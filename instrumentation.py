@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Timing and counters for every call into the WFS driver.
+
+InstrumentedLibrary wraps the loaded WFS .dll (or a stand-in from
+backend.py) and counts every WFS_* call, its latency and the returned
+error codes. WFS wraps its library automatically; the data is read
+with WFS.driver_statistics() and cleared with
+WFS.reset_driver_statistics().
+
+Latencies are kept in LatencyHistogram, a log-linear histogram in the
+style of HdrHistogram: constant memory, constant time recording and
+percentiles with a bounded relative error.
+"""
+import math
+import time
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+
+class LatencyHistogram(object):
+    """Log-linear histogram of integer values, e.g. latencies in ns.
+
+    Values below 2 * 2**significant_bits are counted exactly, larger
+    values in buckets with a relative width of 2**-significant_bits.
+
+    Args:
+        significant_bits (int): Precision of the buckets, 5 gives a
+            relative error below 3.2 %.
+        max_value (int): Largest distinguishable value, larger values
+            are counted as max_value.
+    """
+
+    def __init__(self, significant_bits=5, max_value=2 ** 40):
+        self.significant_bits = significant_bits
+        self.sub_buckets = 1 << significant_bits
+        self.max_value = max_value
+        self.counts = [0] * (self._index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        """Get the bucket index of a value."""
+        shift = max(0, value.bit_length() - self.significant_bits - 1)
+        return shift * self.sub_buckets + (value >> shift)
+
+    def _highest_value(self, index):
+        """Get the largest value counted in a bucket."""
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        return ((index - shift * self.sub_buckets + 1) << shift) - 1
+
+    def record(self, value):
+        """Count a value.
+
+        Args:
+            value (int): Value to count, negative values count as 0.
+        """
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Get the value below which a percentage of values fall.
+
+        Args:
+            percent (float): Percentile, 0 to 100.
+
+        Returns:
+            int: Highest value of the percentile's bucket, limited to
+                the largest recorded value, or None without values.
+        """
+        if self.count == 0:
+            return None
+        target = max(1, math.ceil(percent / 100 * self.count))
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """Get the mean value, None without values."""
+        return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        """Add the counts of a histogram with the same precision."""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def reset(self):
+        """Remove all values."""
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+
+class CallStatistics(object):
+    """Counters of one driver function."""
+
+    def __init__(self):
+        self.latency_ns = LatencyHistogram()
+        self.errors = {}
+
+    def record(self, duration_ns, status):
+        """Count a call.
+
+        Args:
+            duration_ns (int): Call duration in ns.
+            status (int): Status code returned by the call.
+        """
+        self.latency_ns.record(duration_ns)
+        if status != 0:
+            self.errors[status] = self.errors.get(status, 0) + 1
+
+    def summary(self):
+        """Get the counters as dict with latencies in µs."""
+        histogram = self.latency_ns
+        return {'count': histogram.count,
+                'total_ms': histogram.total / 1e6,
+                'mean_us': histogram.mean / 1e3 if histogram.count else None,
+                'p50_us': _us(histogram.percentile(50)),
+                'p90_us': _us(histogram.percentile(90)),
+                'p99_us': _us(histogram.percentile(99)),
+                'max_us': _us(histogram.max),
+                'errors': dict(self.errors)}
+
+
+def _us(value_ns):
+    """Convert ns to µs, keeping None."""
+    return None if value_ns is None else value_ns / 1e3
+
+
+class InstrumentedLibrary(object):
+    """Driver library proxy timing and counting every WFS_* call.
+
+    Attributes other than WFS_* functions are read from the wrapped
+    library, so the proxy is transparent to stand-in libraries.
+
+    Args:
+        lib: Loaded driver library, or None to load it on the first
+            WFS_* call.
+        loader: Function returning the driver library when lib is None.
+    """
+
+    def __init__(self, lib, loader=None):
+        self.lib = lib
+        self.loader = loader
+        self.statistics = {}
+        self.driver_ns = 0
+        self.update = CallStatistics()
+        self.update_driver_ns = 0
+
+    def __getattr__(self, name):
+        if self.lib is None and self.loader is not None and name.startswith('WFS_'):
+            self.lib = self.loader()
+        function = getattr(self.lib, name)
+        if not name.startswith('WFS_'):
+            return function
+        statistics = self.statistics.setdefault(name, CallStatistics())
+
+        def instrumented(*args):
+            start = time.perf_counter_ns()
+            status = function(*args)
+            duration = time.perf_counter_ns() - start
+            self.driver_ns += duration
+            statistics.record(duration, status)
+            return status
+        instrumented.__name__ = name
+        setattr(self, name, instrumented)
+        return instrumented
+
+    def record_update(self, duration_ns, driver_ns):
+        """Count one WFS.update().
+
+        Args:
+            duration_ns (int): Duration of update() in ns.
+            driver_ns (int): Time spent in the driver during update().
+        """
+        self.update.record(duration_ns, 0)
+        self.update_driver_ns += driver_ns
+
+    def summary(self):
+        """Get the counters of every called function.
+
+        Returns:
+            dict: 'functions' with the counters of each WFS_* function
+                called, sorted by total time, and 'update' with the
+                counters of WFS.update() and the time spent in the
+                driver and in Python during update().
+        """
+        functions = sorted(((name, statistics.summary()) for name, statistics in self.statistics.items()
+                            if statistics.latency_ns.count), key=lambda item: -item[1]['total_ms'])
+        update = self.update.summary()
+        del update['errors']
+        update['driver_ms'] = self.update_driver_ns / 1e6
+        update['python_ms'] = update['total_ms'] - update['driver_ms']
+        return {'functions': dict(functions), 'update': update}
+
+    def reset(self):
+        """Reset all counters."""
+        for statistics in self.statistics.values():
+            statistics.latency_ns.reset()
+            statistics.errors.clear()
+        self.driver_ns = 0
+        self.update = CallStatistics()
+        self.update_driver_ns = 0
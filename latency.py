@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Per-frame latency stamps from capture to delivery.
+
+Every WFS.update() creates a FrameStamps with monotonic
+time.perf_counter_ns() timestamps of capture start, capture return and
+analysis done, available as WFS.frame_stamps. Consumers of the frame
+mark its delivery:
+
+    roc = wfs.update()
+    wfs.frame_stamps.delivered('gui')
+
+LatencyMonitor keeps a LatencyHistogram and the jitter of every
+latency:
+    capture: capture start to capture return
+    analysis: capture return to analysis done
+    total: capture start to analysis done
+    delivery.<consumer>: capture start to delivery to the consumer
+    period: capture start to the next capture start
+
+Jitter is the interarrival jitter estimator of RFC 3550: the mean
+absolute difference between consecutive latencies, smoothed with a gain
+of 1/16.
+"""
+import threading
+import time
+
+from instrumentation import LatencyHistogram
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+
+class FrameStamps(object):
+    """Monotonic timestamps in ns of one frame.
+
+    Args:
+        frame (int): Frame number.
+        monitor (LatencyMonitor): Monitor counting the deliveries.
+    """
+    __slots__ = ('frame', 'capture_start', 'capture_return', 'analysis_done', 'deliveries', 'monitor')
+
+    def __init__(self, frame, monitor=None):
+        self.frame = frame
+        self.capture_start = None
+        self.capture_return = None
+        self.analysis_done = None
+        self.deliveries = {}
+        self.monitor = monitor
+
+    def delivered(self, consumer):
+        """Stamp the delivery of the frame to a consumer.
+
+        Args:
+            consumer (str): Name of the consumer, e.g. 'gui'.
+
+        Returns:
+            int: Latency from capture start to delivery in ns.
+        """
+        now = time.perf_counter_ns()
+        self.deliveries[consumer] = now
+        if self.monitor is not None:
+            self.monitor.delivered(self, consumer)
+        return now - self.capture_start
+
+    @property
+    def capture_ns(self):
+        """Get the capture latency in ns."""
+        return self.capture_return - self.capture_start
+
+    @property
+    def analysis_ns(self):
+        """Get the analysis latency in ns."""
+        return self.analysis_done - self.capture_return
+
+    @property
+    def total_ns(self):
+        """Get the latency from capture start to analysis done in ns."""
+        return self.analysis_done - self.capture_start
+
+    def as_dict(self):
+        """Get the timestamps as dict."""
+        return {'frame': self.frame,
+                'capture_start': self.capture_start,
+                'capture_return': self.capture_return,
+                'analysis_done': self.analysis_done,
+                'deliveries': dict(self.deliveries)}
+
+
+class LatencyMonitor(object):
+    """Live latency percentiles and jitter of a frame stream.
+
+    The acquisition thread records while e.g. the GUI thread reads the
+    summary, so all access goes through a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.jitter_ns = {}
+        self.previous_ns = {}
+        self.last_capture_start = None
+
+    def record(self, name, latency_ns):
+        """Count a latency.
+
+        Args:
+            name (str): Latency name.
+            latency_ns (int): Latency in ns.
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+                self.jitter_ns[name] = 0.0
+            histogram.record(latency_ns)
+            previous = self.previous_ns.get(name)
+            if previous is not None:
+                self.jitter_ns[name] += (abs(latency_ns - previous) - self.jitter_ns[name]) / 16
+            self.previous_ns[name] = latency_ns
+
+    def frame_done(self, stamps):
+        """Count the capture and analysis latencies of a frame.
+
+        Args:
+            stamps (FrameStamps): Timestamps of the analysed frame.
+        """
+        self.record('capture', stamps.capture_ns)
+        self.record('analysis', stamps.analysis_ns)
+        self.record('total', stamps.total_ns)
+        if self.last_capture_start is not None:
+            self.record('period', stamps.capture_start - self.last_capture_start)
+        self.last_capture_start = stamps.capture_start
+
+    def delivered(self, stamps, consumer):
+        """Count the delivery latency of a frame to a consumer."""
+        self.record(f'delivery.{consumer}', stamps.deliveries[consumer] - stamps.capture_start)
+
+    def summary(self):
+        """Get the latency percentiles and jitter.
+
+        Returns:
+            dict: {name: {count, mean_us, p50_us, p90_us, p99_us,
+                max_us, jitter_us}}
+        """
+        summary = {}
+        with self.lock:
+            for name, histogram in self.histograms.items():
+                summary[name] = {'count': histogram.count,
+                                 'mean_us': histogram.mean / 1e3,
+                                 'p50_us': histogram.percentile(50) / 1e3,
+                                 'p90_us': histogram.percentile(90) / 1e3,
+                                 'p99_us': histogram.percentile(99) / 1e3,
+                                 'max_us': histogram.max / 1e3,
+                                 'jitter_us': self.jitter_ns[name] / 1e3}
+        return summary
+
+    def reset(self):
+        """Remove all latencies."""
+        with self.lock:
+            self.histograms = {}
+            self.jitter_ns = {}
+            self.previous_ns = {}
+            self.last_capture_start = None
@@ -5,41 +5,19 @@ GUI for Thorlabs Shack-Hartmann Wavefront Sensor Wrapper
 """
 
 import logging
-import logging.config
 import os
 import sys
 
 import numpy as np
-import yaml
 
-from wfs import WFS
+from acquisition import AcquisitionWorker, FrameMailbox
+from display import (DISPLAY_INTERVAL_MS, OVERLAY_CENTROID, OVERLAY_REFERENCE, SPOTFIELD_DISPLAY_WIDTH,
+                     WavefrontSurface, overlay_points, spotfield_lut)
+from ui_compiler import compile_ui
+from wfs import WFS, setup_logging
 
 __version__ = '0.2.3'
 
-
-def setup_logging(path='logging.yaml', level=logging.INFO, env_key='LOG_CFG'):
-    """Setup logging configuration
-
-    Uses logging.yaml for the default configuration
-
-    Args:
-        path:
-        level:
-        env_key:
-    """
-    path = path
-    value = os.getenv(env_key, None)
-    if value:
-        path = value
-    if os.path.exists(path):
-        with open(path, 'rt') as f:
-            config = yaml.load(f.read())
-        logging.config.dictConfig(config)
-    else:
-        logging.basicConfig(level=level)
-
-
-setup_logging()
 log_ui = logging.getLogger('UI')
 
 abs_path = os.path.dirname(os.path.abspath(__file__))
@@ -47,10 +25,11 @@ gui_path = os.path.join(abs_path, 'gui')
 design_path = os.path.join(gui_path, 'design.ui')
 debug_path = os.path.join(gui_path, 'debug.ui')
 if '-pyqt' in sys.argv:
-    from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
+    from PyQt5.QtCore import QThread, QTimer, pyqtSignal, pyqtSlot
     from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget
     from PyQt5 import uic
 
+    QT_BINDING = 'PyQt5'
     Signal = pyqtSignal
     Slot = pyqtSlot
 
@@ -66,10 +45,12 @@ if '-pyqt' in sys.argv:
     # design_form, design_base = uic.loadUiType(design_path)
     # debug_form, debug_base = uic.loadUiType(debug_path)
 elif '-pyside' in sys.argv:
-    from PySide2.QtCore import QThread, Signal, Slot
+    from PySide2.QtCore import QThread, QTimer, Signal, Slot
     from PySide2.QtWidgets import QApplication, QMainWindow, QWidget
     import pyside2uic as uic
 
+    QT_BINDING = 'PySide2'
+
     # External Tools to compile .ui files to .py
     # import subprocess
     # try:
@@ -81,34 +62,116 @@ elif '-pyside' in sys.argv:
     # Direct loading ui without compiling
     # TODO
 
-uic.compileUiDir(gui_path, from_imports=True)
+
+compile_ui(gui_path, QT_BINDING, uic.compileUi)
 # noinspection PyPep8
 import gui
-# noinspection PyPep8
-import pyqtgraph as pg
-# noinspection PyPep8
-import pyqtgraph.opengl as gl
+
+# Plotting modules, imported on first use by load_pyqtgraph() and load_opengl()
+pg = None
+gl = None
+# The WFS session of the GUI, created on first use by get_wfs()
+_wfs = None
+
+
+def load_pyqtgraph():
+    """Import pyqtgraph on first use"""
+    global pg
+    if pg is None:
+        import pyqtgraph
+        pg = pyqtgraph
+    return pg
+
+
+def load_opengl():
+    """Import pyqtgraph.opengl on first use"""
+    global gl
+    if gl is None:
+        load_pyqtgraph()
+        import pyqtgraph.opengl
+        gl = pyqtgraph.opengl
+    return gl
+
+
+def get_wfs(lib=None):
+    """Get the WFS session of the GUI, creating it on the first call
+
+    Args:
+        lib: Driver backend of a new session, see WFS
+
+    Returns:
+        WFS: The one WFS session
+    """
+    global _wfs
+    if _wfs is None:
+        _wfs = WFS(lib=lib)
+    return _wfs
+
 
 design_form, design_base = gui.design.Ui_main_window, QMainWindow
 debug_form, debug_base = gui.debug.Ui_Form, QWidget
 
 
 class WFSThread(QThread):
-    """Separate thread for WFS updating"""
-    roc_ready = Signal(str)
+    """Long-lived thread running the WFS acquisition loop
+
+    Every frame goes into the mailbox, which the GUI polls for the latest one.
+    """
+    acquisition_failed = Signal(str)
 
-    def __init__(self, parent=None, wfs=WFS()):
+    def __init__(self, parent=None, wfs=None, mailbox=None, spotfield_width=None):
         super(WFSThread, self).__init__(parent)
+        wfs = get_wfs() if wfs is None else wfs
         self.wfs = wfs
+        self.mailbox = FrameMailbox() if mailbox is None else mailbox
+        self.worker = AcquisitionWorker(wfs, self.mailbox, spotfield_width=spotfield_width)
+
+    def run(self):
+        """Update the WFS until stopped"""
+        self.worker.run()
+        if self.worker.error is not None:
+            # noinspection PyUnresolvedReferences
+            self.acquisition_failed.emit(str(self.worker.error))
+
+    def resume(self):
+        """Start the loop, or continue it if paused"""
+        self.worker.resume()
+        if not self.isRunning():
+            self.start()
+
+    def pause(self, timeout=None):
+        """Pause the loop after the current frame
+
+        Args:
+            timeout (float): Time in s to wait for the current frame, None to wait without limit
+
+        Returns:
+            bool: True if the loop is idle
+        """
+        return self.worker.pause(timeout)
 
-    def __del__(self):
+    def shutdown(self):
+        """End the loop and wait for the thread to finish"""
+        self.worker.stop()
         self.wait()
 
+
+class ProfileThread(QThread):
+    """Separate thread for profiling the WFS update"""
+    profile_ready = Signal(str)
+
+    def __init__(self, parent=None, wfs=None, frames=100, mode='sampling'):
+        super(ProfileThread, self).__init__(parent)
+        self.wfs = wfs
+        self.frames = frames
+        self.mode = mode
+
     def run(self):
-        """Run and update on the WFS"""
-        roc = str(self.wfs.update())
-        # noinspection PyUnresolvedReferences
-        self.roc_ready.emit(roc)
+        """Profile the WFS update and emit the summary table"""
+        result = self.wfs.profile(frames=self.frames, mode=self.mode)
+        with open(result['summary'], encoding='utf-8') as f:
+            # noinspection PyUnresolvedReferences
+            self.profile_ready.emit(f.read())
 
 
 class WFSApp(design_base, design_form):
@@ -116,10 +179,10 @@ class WFSApp(design_base, design_form):
     Main GUI for the WFS
     """
 
-    def __init__(self, parent=None, wfs=WFS()):
+    def __init__(self, parent=None, wfs=None):
         super(WFSApp, self).__init__(parent)
         self.setupUi(self)
-        self.wfs = wfs
+        self.wfs = get_wfs() if wfs is None else wfs
 
         self.debug_window = None
         self.settings_window = None
@@ -130,42 +193,79 @@ class WFSApp(design_base, design_form):
         self.action_settings.triggered.connect(lambda: self.on_settings_click('Settings'))
         self.action_debug.triggered.connect(self.on_debug_click)
         self.action_test.triggered.connect(self.on_test_click)
+        self.action_profile.triggered.connect(self.on_profile_click)
         self.action_start.triggered.connect(self.on_start_click)
         self.action_stop.triggered.connect(self.on_stop_click)
 
+        # Plots are created on the first frame, the 3D view on the first wavefront
+        self.plots_ready = False
+        self.roc_history_x = np.arange(-100, 0)
+        self.wavefront_surface = WavefrontSurface()
+        self.gl_widget = None
+
+        # Frames arrive at the sensor rate, the display timer renders the latest one
+        self.display_timer = QTimer(self)
+        self.display_timer.setInterval(DISPLAY_INTERVAL_MS)
+        # noinspection PyUnresolvedReferences
+        self.display_timer.timeout.connect(self.on_display_timer)
+
+        self.wfs_thread = WFSThread(wfs=self.wfs, mailbox=FrameMailbox(history=len(self.roc_history_x)),
+                                    spotfield_width=SPOTFIELD_DISPLAY_WIDTH)
+        # noinspection PyUnresolvedReferences
+        self.wfs_thread.acquisition_failed.connect(self.on_acquisition_failed)
+        self.profile_thread = ProfileThread(wfs=self.wfs)
+        # noinspection PyUnresolvedReferences
+        self.profile_thread.profile_ready.connect(self.on_profile_ready)
+        # self.on_connect_click()
+
+    def setup_plots(self):
+        """Create the plot items, updated with setData() afterwards"""
+        load_pyqtgraph()
         self.zernike_plot = pg.PlotWidget()
         # self.grid_central.addWidget(self.zernike_plot)
         self.zernike_plot.setXRange(0, 16)
         self.zernike_plot_xrange = np.linspace(0.5, 15.5, 16)
+        self.zernike_bars = self.zernike_plot.plot(self.zernike_plot_xrange, np.zeros(15), stepMode=True,
+                                                   fillLevel=0, brush=(0, 0, 255, 150))
 
         self.roc_plot = pg.PlotWidget()
         # self.grid_central.addWidget(self.roc_plot)
-        self.roc_list = [0] * 100
-        self.roc_list_X = [x for x in range(-100, 0)]
+        self.roc_curve = self.roc_plot.plot(x=self.roc_history_x, y=np.zeros(100))
 
         self.line_view_plot = pg.PlotWidget()
         # self.grid_central.addWidget(self.line_view_plot)
-
-        self.wavefront_grid_X = np.linspace(-2.4, 2.4, 33)
-        self.wavefront_grid_Y = np.linspace(-3, 3, 41)
+        self.line_min_curve = self.line_view_plot.plot()
+        self.line_max_curve = self.line_view_plot.plot()
+
+        # Live spotfield image with one scatter item for the centroids and reference positions
+        self.spotfield_plot = pg.PlotWidget()
+        self.grid_central.addWidget(self.spotfield_plot, 0, 1, 1, 1)
+        self.spotfield_plot.setAspectLocked(True)
+        self.spotfield_plot.invertY(True)
+        self.spotfield_image = pg.ImageItem()
+        self.spotfield_image.setOpts(axisOrder='row-major')
+        self.spotfield_image.setLookupTable(spotfield_lut())
+        self.spotfield_plot.addItem(self.spotfield_image)
+        self.spotfield_overlay = pg.ScatterPlotItem(size=5, pen=None)
+        self.spotfield_plot.addItem(self.spotfield_overlay)
+        self.overlay_brushes = np.empty(2, dtype=object)
+        self.overlay_brushes[OVERLAY_CENTROID] = pg.mkBrush(0, 255, 0, 200)
+        self.overlay_brushes[OVERLAY_REFERENCE] = pg.mkBrush(0, 128, 255, 200)
+        self.plots_ready = True
+
+    def setup_wavefront_view(self):
+        """Create the 3D wavefront view, its grid is set from the lenslet positions of the first frame"""
+        load_opengl()
         self.gl_widget = gl.GLViewWidget()
         self.gl_grid = gl.GLGridItem()
         self.gl_grid.scale(.5, .5, .05)
         self.gl_grid.setDepthValue(10)
         self.gl_widget.addItem(self.gl_grid)
-        self.wavefront_plot = gl.GLSurfacePlotItem(x=self.wavefront_grid_X, y=self.wavefront_grid_Y,
-                                                   shader='heightColor')
-        self.wavefront_plot.shader()['colorMap'] = np.array([0.2, 2, 0.5, 0.2, 1, 1, 0.2, 0, 2])
+        self.wavefront_plot = gl.GLSurfacePlotItem(smooth=False)
         self.gl_widget.addItem(self.wavefront_plot)
-        # self.gl_widget.show()
-
-        self.running = False
-        self.wfs_thread = WFSThread(wfs=self.wfs)
-        # noinspection PyUnresolvedReferences
-        self.wfs_thread.roc_ready.connect(self.on_wfs_thread_update)
-        # noinspection PyUnresolvedReferences
-        self.wfs_thread.finished.connect(self.on_wfs_thread_finished)
-        # self.on_connect_click()
+        # Below the text and the spotfield image
+        self.gl_widget.setMinimumHeight(250)
+        self.grid_central.addWidget(self.gl_widget, 1, 0, 1, 2)
 
     # noinspection PyPep8Naming
     def closeEvent(self, event):
@@ -174,60 +274,100 @@ class WFSApp(design_base, design_form):
         Args:
             event:
         """
-        self.running = False
-        self.wfs_thread.wait()
+        self.display_timer.stop()
+        self.wfs_thread.shutdown()
         self.wfs.disconnect()
         event.accept()
 
-    @Slot(str)
-    def on_wfs_thread_update(self, roc):
-        """Update the GUI when the WFS Thread updates
+    @Slot()
+    def on_display_timer(self):
+        """Render the latest frame, skipping the frames in between"""
+        snapshot = self.wfs_thread.mailbox.take()
+        if snapshot is None:
+            return
+        if not self.plots_ready:
+            self.setup_plots()
+        if snapshot.stamps is not None:
+            snapshot.stamps.delivered('gui')
+        self.text_browser.append(str(snapshot.roc_mm))
+        self.plot_zernike_coefficients(snapshot)
+        self.plot_roc()
+        self.plot_line_view(snapshot)
+        self.plot_spotfield(snapshot)
+        if self.wavefront_surface.due():
+            self.plot_wavefront(snapshot)
+        self.show_latency()
+
+    def show_latency(self):
+        """Show the frame latencies in the status bar"""
+        latency = self.wfs.latency_statistics()
+        if 'delivery.gui' in latency:
+            total = latency['total']
+            gui = latency['delivery.gui']
+            self.statusbar.showMessage(f'Analysis p50/p99: {total["p50_us"] / 1e3:.1f}/{total["p99_us"] / 1e3:.1f} ms'
+                                       f' | GUI p50/p99: {gui["p50_us"] / 1e3:.1f}/{gui["p99_us"] / 1e3:.1f} ms'
+                                       f' | Jitter: {gui["jitter_us"] / 1e3:.2f} ms')
+
+    def plot_line_view(self, snapshot):
+        """Plot the min and max lines
 
         Args:
-            roc (str): Radius of Curvature in mm
+            snapshot (FrameSnapshot): Frame to show
         """
-        self.text_browser.append(roc)
-        self.plot_zernike_coefficients()
-        self.plot_roc()
-        self.plot_line_view()
-        # self.plot_wavefront()
+        self.line_min_curve.setData(y=snapshot.line_min)
+        self.line_max_curve.setData(y=snapshot.line_max)
+
+    def plot_spotfield(self, snapshot):
+        """Show the downsampled spotfield image with the centroids and reference positions
+
+        Args:
+            snapshot (FrameSnapshot): Frame to show
+        """
+        if snapshot.image is None:
+            return
+        self.spotfield_image.setImage(snapshot.image, autoLevels=False, levels=(0, 255))
+        positions, kinds = overlay_points(snapshot, snapshot.image_factor)
+        self.spotfield_overlay.setData(pos=positions, brush=self.overlay_brushes[kinds])
 
-    def plot_line_view(self):
-        """Plot the min and max lines"""
-        line_min = np.ctypeslib.as_array(self.wfs.array_line_min)
-        line_max = np.ctypeslib.as_array(self.wfs.array_line_max)
-        self.line_view_plot.plot(y=line_min, clear=True)
-        self.line_view_plot.plot(y=line_max)
+    def plot_wavefront(self, snapshot):
+        """Plot a 3D wavefront, only updating the z values unless the spot grid changed
 
-    def plot_wavefront(self):
-        """Plot a 3D wavefront"""
-        z = np.ctypeslib.as_array(self.wfs.array_wavefront)
-        self.wavefront_plot.setData(z=z)
+        Args:
+            snapshot (FrameSnapshot): Frame to show
+        """
+        if self.gl_widget is None:
+            self.setup_wavefront_view()
+        surface = self.wavefront_surface
+        if surface.update(snapshot.wavefront, snapshot.scale_x, snapshot.scale_y):
+            self.wavefront_plot.setData(x=surface.x, y=surface.y, z=surface.z, colors=surface.colors)
+        else:
+            self.wavefront_plot.setData(z=surface.z, colors=surface.colors)
 
     def plot_roc(self):
         """Plot the last 100 RoC measurements in mm"""
-        self.roc_list.pop(0)
-        self.roc_list.append(self.wfs.roc_mm.value)
-        self.roc_plot.plot(x=self.roc_list_X, y=self.roc_list, clear=True)
+        self.roc_curve.setData(x=self.roc_history_x, y=self.wfs_thread.mailbox.history())
 
-    def plot_zernike_coefficients(self):
-        """Plot the Zernike coefficients as a bar graph"""
-        z = np.ctypeslib.as_array(self.wfs.array_zernike_um)
-        self.zernike_plot.plot(self.zernike_plot_xrange, z[1:16], stepMode=True, fillLevel=0,
-                               brush=(0, 0, 255, 150), clear=True)
+    def plot_zernike_coefficients(self, snapshot):
+        """Plot the Zernike coefficients as a bar graph
 
-    @Slot()
-    def on_wfs_thread_finished(self):
-        """Restart WFS Thread when finished"""
-        if self.running:
-            self.wfs_thread.start()
+        Args:
+            snapshot (FrameSnapshot): Frame to show
+        """
+        self.zernike_bars.setData(self.zernike_plot_xrange, snapshot.zernike_um)
+
+    @Slot(str)
+    def on_acquisition_failed(self, error):
+        """Show an error that stopped the acquisition loop
+
+        Args:
+            error (str): Error message
+        """
+        self.text_browser.append(f'Acquisition stopped: {error}')
+        self.on_stop_click()
 
     @Slot()
     def on_quit_trigger(self):
         """Exit the program"""
-        self.running = False
-        self.wfs_thread.wait()
-        self.wfs.disconnect()
         self.close()
 
     @Slot()
@@ -243,7 +383,7 @@ class WFSApp(design_base, design_form):
     def on_disconnect_click(self):
         """Disconnect from the WFS"""
         self.on_stop_click()
-        self.wfs_thread.wait()
+        self.wfs_thread.shutdown()
         if self.wfs.disconnect() == 0:
             self.action_connect.setEnabled(True)
             self.action_disconnect.setEnabled(False)
@@ -252,15 +392,16 @@ class WFSApp(design_base, design_form):
     def on_start_click(self):
         """Start the thread to update the WFS"""
         if self.wfs.instrument_handle.value != 0:
-            self.running = True
-            self.wfs_thread.start()
+            self.wfs_thread.resume()
+            self.display_timer.start()
             self.action_stop.setEnabled(True)
             self.action_start.setEnabled(False)
 
     @Slot()
     def on_stop_click(self):
-        """Stop the thread to update the WFS"""
-        self.running = False
+        """Pause the thread to update the WFS"""
+        self.wfs_thread.pause(timeout=0)
+        self.display_timer.stop()
         self.action_start.setEnabled(True)
         self.action_stop.setEnabled(False)
 
@@ -280,6 +421,27 @@ class WFSApp(design_base, design_form):
         """Run a test function"""
         pass
 
+    @Slot()
+    def on_profile_click(self):
+        """Profile the WFS update, stopping the update thread"""
+        if self.wfs.instrument_handle.value != 0 and not self.profile_thread.isRunning():
+            self.on_stop_click()
+            self.wfs_thread.pause()
+            self.action_start.setEnabled(False)
+            self.action_profile.setEnabled(False)
+            self.profile_thread.start()
+
+    @Slot(str)
+    def on_profile_ready(self, summary):
+        """Show the profile summary
+
+        Args:
+            summary (str): Summary table of the profile
+        """
+        self.text_browser.append(summary)
+        self.action_start.setEnabled(True)
+        self.action_profile.setEnabled(True)
+
     @Slot()
     def on_debug_click(self):
         """Show the debug command window"""
@@ -291,20 +453,20 @@ class WFSApp(design_base, design_form):
 class WFSSettingsApp(debug_base, debug_form):
     """GUI for easy configuration of the WFS"""
 
-    def __init__(self, parent=None, wfs=WFS()):
+    def __init__(self, parent=None, wfs=None):
         super(WFSSettingsApp, self).__init__(parent)
         self.setupUi(self)
-        self.wfs = wfs
+        self.wfs = get_wfs() if wfs is None else wfs
 
 
 # noinspection PyProtectedMember,PyMissingOrEmptyDocstring
 class WFSDebugApp(debug_base, debug_form):
     """GUI with all WFS commands and arguments"""
 
-    def __init__(self, parent=None, wfs=WFS()):
+    def __init__(self, parent=None, wfs=None):
         super(WFSDebugApp, self).__init__(parent)
         self.setupUi(self)
-        self.wfs = wfs
+        self.wfs = get_wfs() if wfs is None else wfs
 
         self.btn_get_instrument_info.clicked.connect(self.on_get_instrument_info_click)
         self.btn_configure_cam.clicked.connect(self.on_configure_cam_click)
@@ -834,5 +996,22 @@ def main(wfs):
 
 
 if __name__ == '__main__':
-    _wfs = WFS()
-    main(_wfs)
+    setup_logging()
+    _lib = None
+    if '-replay' in sys.argv:
+        # Play back a recorded session instead of a connected sensor
+        from replay import ReplayLibrary
+        _lib = ReplayLibrary(sys.argv[sys.argv.index('-replay') + 1], realtime=True, loop=True)
+    session = get_wfs(_lib)
+    _trace = None
+    if '-trace' in sys.argv:
+        # Record every driver call for replay with calltrace.TraceReplayLibrary
+        from calltrace import TracingLibrary
+        _trace = TracingLibrary(sys.argv[sys.argv.index('-trace') + 1], session.lib)
+        session.lib = _trace
+    try:
+        main(session)
+    finally:
+        # main() leaves through sys.exit(), close the trace file on the way out
+        if _trace is not None:
+            _trace.close()
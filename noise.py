@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Adaptive noise floor of the spotfield image.
+
+WFS._cut_image_noise_floor() sets every pixel below one global
+intensity_limit to zero. AdaptiveNoiseFloor instead estimates the
+background level and RMS of every tile of the image and sets the pixels
+below background + sigma * RMS of their tile to zero:
+
+    wfs.noise_floor = AdaptiveNoiseFloor(tile=64, sigma=3)
+
+With WFS.noise_floor set, update() applies it after the image stages
+in place of _cut_image_noise_floor().
+
+The estimate is robust against the spots: on a subsample of each tile
+the background is the median and the RMS the distance from the 16th
+percentile to the median, both taken in one np.partition() call over
+all tiles. Each frame only refreshes a band of tile rows, so all tiles
+are refreshed every `refresh` frames.
+"""
+import logging
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+# Percentile of a normal distribution one standard deviation below the median
+LOWER_SIGMA_PERCENTILE = 15.87
+
+log_noise = logging.getLogger('WFS.noise')
+
+
+def tile_size(length, tile):
+    """Get the largest divisor of an image length not above a tile size."""
+    for size in range(min(tile, length), 0, -1):
+        if length % size == 0:
+            return size
+
+
+class AdaptiveNoiseFloor(object):
+    """Per-tile background, RMS and noise floor of the spotfield image.
+
+    Args:
+        tile (int): Maximum tile size in pixels. The tile height and
+            width are the largest divisors of the image height and width
+            not above it.
+        sigma (float): Threshold above the background in RMS.
+        subsample (int): Step between the sampled pixels of a tile.
+        refresh (int): Number of frames to refresh all tiles.
+        minimum (int): Lowest threshold, like intensity_limit.
+    """
+
+    def __init__(self, tile=64, sigma=3.0, subsample=4, refresh=4, minimum=1):
+        if refresh < 1:
+            raise ValueError('refresh must be at least 1')
+        self.tile = tile
+        self.sigma = sigma
+        self.subsample = subsample
+        self.refresh = refresh
+        self.minimum = minimum
+        self.shape = None
+        self.tiles = None
+        self.background = None
+        self.rms = None
+        self.threshold = None
+        self._band = 0
+        self._mask = None
+
+    def _start(self, shape):
+        """Allocate the tile maps for an image shape."""
+        rows, columns = shape
+        self.shape = shape
+        self.tiles = (tile_size(rows, self.tile), tile_size(columns, self.tile))
+        grid = (rows // self.tiles[0], columns // self.tiles[1])
+        self.background = np.zeros(grid, dtype=np.float32)
+        self.rms = np.zeros(grid, dtype=np.float32)
+        self.threshold = np.full(grid, self.minimum, dtype=np.uint8)
+        self._mask = np.empty((grid[0], self.tiles[0], grid[1], self.tiles[1]), dtype=bool)
+        self._band = 0
+        log_noise.info(f'Noise floor tiles: {grid[0]} x {grid[1]} of {self.tiles[0]} x {self.tiles[1]} pixels')
+
+    def _tiled(self, image):
+        """Get a [tile row][y][tile column][x] view of an image."""
+        grid = self.threshold.shape
+        return image.reshape(grid[0], self.tiles[0], grid[1], self.tiles[1])
+
+    def estimate(self, image, rows=None):
+        """Estimate the background and RMS of tile rows.
+
+        Args:
+            image (np.ndarray): uint8 [rows][columns] image.
+            rows (slice): Tile rows to estimate, default all.
+        """
+        if image.shape != self.shape:
+            self._start(image.shape)
+        if rows is None:
+            rows = slice(None)
+        step = self.subsample
+        samples = self._tiled(image)[rows, ::step, :, ::step]
+        # [tile row][tile column][samples] of every tile
+        samples = samples.transpose(0, 2, 1, 3).reshape(samples.shape[0], samples.shape[2], -1)
+        count = samples.shape[-1]
+        lower = int(count * LOWER_SIGMA_PERCENTILE / 100)
+        median = count // 2
+        parted = np.partition(samples, (lower, median), axis=-1)
+        self.background[rows] = parted[..., median]
+        self.rms[rows] = parted[..., median] - parted[..., lower].astype(np.float32)
+        threshold = np.ceil(self.background[rows] + self.sigma * np.maximum(self.rms[rows], 1))
+        self.threshold[rows] = np.clip(threshold, self.minimum, 255)
+
+    def update(self, image):
+        """Refresh the next band of tile rows, all of them on a new shape."""
+        if image.shape != self.shape:
+            self.estimate(image)
+            return
+        grid_rows = self.threshold.shape[0]
+        band = -(-grid_rows // self.refresh)
+        start = self._band * band
+        self.estimate(image, slice(start, start + band))
+        self._band = (self._band + 1) % -(-grid_rows // band)
+
+    def apply(self, image):
+        """Set the pixels below the threshold of their tile to zero in place."""
+        tiled = self._tiled(image)
+        np.greater_equal(tiled, self.threshold[:, None, :, None], out=self._mask)
+        np.multiply(tiled, self._mask, out=tiled)
+
+    def __call__(self, image, wfs=None):
+        """Update the estimate and cut the noise floor of an image.
+
+        Args:
+            image (np.ndarray): Spotfield view.
+            wfs (WFS): Ignored.
+        """
+        self.update(image)
+        self.apply(image)
+
+    def reset(self):
+        """Estimate all tiles from the next frame."""
+        self.shape = None
+
+    def summary(self):
+        """Get the tile maps.
+
+        Returns:
+            dict: tiles (height, width) and [tile row][tile column]
+                background, rms and threshold arrays.
+        """
+        return {'tiles': self.tiles,
+                'background': self.background.copy(),
+                'rms': self.rms.copy(),
+                'threshold': self.threshold.copy()}
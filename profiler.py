@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""Profile the WFS acquisition loop.
+
+Profiler runs WFS.update() for a number of frames and splits the time
+into the categories
+    DLL: calls into the driver, measured by InstrumentedLibrary
+    logging: the logging module
+    NumPy: NumPy functions
+    ctypes: ctypes and the Vi type helpers
+    Python: everything else, i.e. the wrapper glue code
+
+Two modes are available:
+    deterministic: sys.setprofile() hook seeing every Python and
+        builtin call; exact, but slows down Python code
+    sampling: a thread samples the stack of the acquisition thread at
+        a fixed interval; low overhead, statistical
+
+Each run writes a collapsed-stack file (<output>.collapsed, one
+"frame;frame;frame value" line per stack, readable by flamegraph.pl and
+speedscope) and a summary table (<output>.txt). Self time is in µs for
+the deterministic mode and in samples for the sampling mode.
+
+    wfs.profile(frames=100, mode='sampling')
+
+or from the command line:
+
+    python profiler.py --frames 100 --mode sampling --output profile
+"""
+import argparse
+import collections
+import ctypes
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import instrumentation
+import vi
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+MODES = ('deterministic', 'sampling')
+# Categories by priority, a frame inside a DLL call is counted as DLL
+CATEGORIES = ('DLL', 'logging', 'NumPy', 'ctypes', 'Python')
+PRIORITY = {category: priority for priority, category in enumerate(CATEGORIES)}
+
+_LOGGING_PATH = os.path.dirname(os.path.abspath(logging.__file__))
+_NUMPY_PATH = os.path.dirname(os.path.abspath(np.__file__))
+_CTYPES_PATHS = (os.path.dirname(os.path.abspath(ctypes.__file__)), os.path.abspath(vi.__file__))
+_INSTRUMENTATION_PATH = os.path.abspath(instrumentation.__file__)
+
+log_profiler = logging.getLogger('WFS.profiler')
+
+
+def frame_label(code):
+    """Get the 'module.function' label of a code object."""
+    directory, filename = os.path.split(code.co_filename)
+    module = os.path.splitext(filename)[0]
+    if module == '__init__':
+        module = os.path.basename(directory)
+    return f'{module}.{code.co_name}'
+
+
+def frame_category(code):
+    """Get the category of a Python code object."""
+    path = os.path.abspath(code.co_filename)
+    if path == _INSTRUMENTATION_PATH and code.co_name == 'instrumented':
+        return 'DLL'
+    if path.startswith(_LOGGING_PATH):
+        return 'logging'
+    if path.startswith(_NUMPY_PATH):
+        return 'NumPy'
+    if path.startswith(_CTYPES_PATHS):
+        return 'ctypes'
+    return 'Python'
+
+
+def builtin_label(function):
+    """Get the label and category of a builtin function."""
+    module = getattr(function, '__module__', None) or type(getattr(function, '__self__', None)).__name__
+    category = 'Python'
+    if module in ('_ctypes', 'ctypes'):
+        category = 'ctypes'
+    elif module.startswith('numpy'):
+        category = 'NumPy'
+    return f'{module}.{getattr(function, "__name__", "?")}', category
+
+
+def combine(parent, category):
+    """Get the category of a frame called from a parent category."""
+    return parent if PRIORITY[parent] < PRIORITY[category] else category
+
+
+class Profiler(object):
+    """Profile a function called repeatedly.
+
+    Args:
+        mode (str): 'deterministic' or 'sampling'.
+        interval (float): Sampling interval in seconds.
+    """
+
+    def __init__(self, mode='deterministic', interval=0.001):
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiling mode {mode!r}, use one of {MODES}')
+        self.mode = mode
+        self.interval = interval
+        # Self time in ns (deterministic) or samples (sampling) per collapsed stack
+        self.stacks = collections.Counter()
+        self.categories = collections.Counter()
+        self.calls = 0
+        self.wall_time = 0.0
+        self._stack = []
+        self._last = 0
+
+    # Deterministic mode
+    def _charge(self, now):
+        """Charge the time since the last event to the current stack."""
+        if self._stack:
+            key, category = self._stack[-1]
+            elapsed = now - self._last
+            self.stacks[key] += elapsed
+            self.categories[category] += elapsed
+
+    def _push(self, label, category):
+        """Enter a function."""
+        if self._stack:
+            parent_key, parent_category = self._stack[-1]
+            self._stack.append((f'{parent_key};{label}', combine(parent_category, category)))
+        else:
+            self._stack.append((label, category))
+
+    def _event(self, frame, event, arg):
+        """sys.setprofile() hook."""
+        self._charge(time.perf_counter_ns())
+        if event == 'call':
+            self._push(frame_label(frame.f_code), frame_category(frame.f_code))
+        elif event == 'c_call':
+            self._push(*builtin_label(arg))
+        elif self._stack:
+            # return, c_return and c_exception
+            self._stack.pop()
+        self._last = time.perf_counter_ns()
+
+    def _run_deterministic(self, function, calls):
+        """Run a function under the sys.setprofile() hook."""
+        sys.setprofile(self._event)
+        try:
+            for _ in range(calls):
+                self._stack = []
+                function()
+        finally:
+            sys.setprofile(None)
+
+    # Sampling mode
+    def _sample(self, thread_id, root, stop):
+        """Sample the stack of a thread until stopped."""
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            codes = []
+            while frame is not None and frame.f_code is not root:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if frame is None or not codes:
+                continue
+            category = 'Python'
+            labels = []
+            for code in reversed(codes):
+                category = combine(category, frame_category(code))
+                labels.append(frame_label(code))
+            self.stacks[';'.join(labels)] += 1
+            self.categories[category] += 1
+
+    def _run_sampling(self, function, calls):
+        """Run a function while sampling its stack."""
+        stop = threading.Event()
+        root = sys._getframe().f_code
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), root, stop),
+                                   name='ProfilerSampler', daemon=True)
+        # Let the sampler take the GIL from running Python code, not only at I/O and DLL calls
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 10))
+        sampler.start()
+        try:
+            for _ in range(calls):
+                function()
+        finally:
+            stop.set()
+            sampler.join()
+            sys.setswitchinterval(switch_interval)
+
+    def run(self, function, calls):
+        """Profile repeated calls of a function.
+
+        Args:
+            function: Function called without arguments.
+            calls (int): Number of calls.
+        """
+        start = time.perf_counter()
+        if self.mode == 'deterministic':
+            self._run_deterministic(function, calls)
+        else:
+            self._run_sampling(function, calls)
+        self.wall_time += time.perf_counter() - start
+        self.calls += calls
+
+    def category_times(self):
+        """Get the share of each category.
+
+        Returns:
+            dict: {category: (ms, percent)}; in sampling mode the time
+                is the wall time times the share of samples.
+        """
+        total = sum(self.categories.values())
+        result = {}
+        for category in CATEGORIES:
+            share = self.categories[category] / total if total else 0.0
+            if self.mode == 'deterministic':
+                ms = self.categories[category] / 1e6
+            else:
+                ms = share * self.wall_time * 1e3
+            result[category] = (ms, share * 100)
+        return result
+
+    def _value(self, value):
+        """Convert a stack value to µs (deterministic) or samples (sampling)."""
+        return value // 1000 if self.mode == 'deterministic' else value
+
+    def self_times(self):
+        """Get the self time (µs or samples) of every function, largest first."""
+        functions = collections.Counter()
+        for key, value in self.stacks.items():
+            functions[key.rsplit(';', 1)[-1]] += value
+        return [(label, self._value(value)) for label, value in functions.most_common()]
+
+    def write_collapsed(self, path):
+        """Write the collapsed-stack file."""
+        with open(path, 'w') as f:
+            for key, value in sorted(self.stacks.items()):
+                if self._value(value) > 0:
+                    f.write(f'{key} {self._value(value)}\n')
+
+    def summary(self, top=20):
+        """Get the summary table as text."""
+        unit = 'µs' if self.mode == 'deterministic' else 'samples'
+        per_call = self.wall_time / self.calls * 1e3 if self.calls else 0.0
+        lines = [f'WFS profile: {self.calls} frames, {self.mode}, {self.wall_time:.3f} s wall time '
+                 f'({per_call:.2f} ms/frame)',
+                 '',
+                 f'{"Category":<12}{"Time (ms)":>12}{"Share":>9}']
+        for category, (ms, percent) in self.category_times().items():
+            lines.append(f'{category:<12}{ms:>12.2f}{percent:>8.1f}%')
+        lines += ['', f'Top {top} functions by self time ({unit})']
+        for label, value in self.self_times()[:top]:
+            lines.append(f'{value:>12} {label}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, output):
+        """Write <output>.collapsed and <output>.txt.
+
+        Returns:
+            tuple: Paths of the collapsed-stack file and the summary.
+        """
+        collapsed_path = f'{output}.collapsed'
+        summary_path = f'{output}.txt'
+        self.write_collapsed(collapsed_path)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary())
+        log_profiler.info(f'Profile written to {collapsed_path} and {summary_path}')
+        return collapsed_path, summary_path
+
+
+def profile_wfs(wfs, frames=100, mode='deterministic', output=None, interval=0.001):
+    """Profile WFS.update() for a number of frames.
+
+    Args:
+        wfs (WFS): Connected and configured WFS.
+        frames (int): Number of frames.
+        mode (str): 'deterministic' or 'sampling'.
+        output (str): Path without extension of the output files,
+            default wfs_profile_<date>_<time>.
+        interval (float): Sampling interval in seconds.
+
+    Returns:
+        dict: frames, mode, wall_s, categories {category: (ms, %)},
+            collapsed and summary paths.
+    """
+    if output is None:
+        output = time.strftime('wfs_profile_%Y%m%d_%H%M%S')
+    profiler = Profiler(mode, interval)
+    profiler.run(wfs.update, frames)
+    collapsed_path, summary_path = profiler.save(output)
+    return {'frames': frames,
+            'mode': mode,
+            'wall_s': profiler.wall_time,
+            'categories': profiler.category_times(),
+            'collapsed': collapsed_path,
+            'summary': summary_path}
+
+
+def main(argv=None):
+    """Profile a WFS from the command line."""
+    from wfs import WFS, setup_logging
+
+    parser = argparse.ArgumentParser(description='Profile N frames of WFS.update()')
+    parser.add_argument('--frames', type=int, default=100, help='number of frames')
+    parser.add_argument('--mode', choices=MODES, default='deterministic', help='profiling mode')
+    parser.add_argument('--interval', type=float, default=0.001, help='sampling interval in s')
+    parser.add_argument('--output', help='output path without extension')
+    parser.add_argument('--replay', help='profile a recorded session instead of the connected WFS')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    lib = None
+    if args.replay:
+        from replay import ReplayLibrary
+        lib = ReplayLibrary(args.replay, loop=True)
+    wfs = WFS(lib=lib)
+    wfs.connect()
+    wfs.config()
+    try:
+        result = wfs.profile(args.frames, args.mode, args.output, args.interval)
+    finally:
+        wfs.disconnect()
+    with open(result['summary'], encoding='utf-8') as f:
+        print(f.read())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
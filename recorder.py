@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""Append-only binary recording of WFS measurement sessions.
+
+A session is a directory containing:
+    header.json    Instrument, geometry and record layout of every
+                   configuration epoch. A new epoch starts whenever the
+                   spot grid or camera resolution changes.
+    index.bin      Append-only table of INDEX_DTYPE rows, one per
+                   flushed batch of records.
+    epoch<E>_chunk<C>.rec
+                   Fixed-size records of the epoch's record dtype.
+
+Raw spotfield images can be recorded next to the measurement records:
+    spotfield.json         Image geometry and frame count.
+    spotfield.npy          Pre-sized [capacity][rows][columns] uint8
+                           images, filled in place by the driver.
+    spotfield_frames.npy   RAW_FRAME_DTYPE row per image slot.
+
+Records only ever get appended and a batch is listed in the index after
+its data has been written, so a session stays readable after a crash
+and every chunk can be opened with np.memmap without parsing.
+"""
+import ctypes
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+RECORD_VERSION = 1
+ZERNIKE_COUNT = 67  # WFS.MAX_ZERNIKE_MODES + 1, index 0 is unused by the driver
+HEADER_FILE = 'header.json'
+INDEX_FILE = 'index.bin'
+INDEX_DTYPE = np.dtype([('epoch', '<i4'),
+                        ('chunk', '<i4'),
+                        ('first_frame', '<i8'),
+                        ('chunk_offset', '<i8'),
+                        ('count', '<i8')])
+
+RAW_HEADER_FILE = 'spotfield.json'
+RAW_IMAGE_FILE = 'spotfield.npy'
+RAW_FRAME_FILE = 'spotfield_frames.npy'
+RAW_FRAME_DTYPE = np.dtype([('timestamp', '<f8'),
+                            ('status', '<i4'),
+                            ('exposure', '<f8'),
+                            ('gain', '<f8'),
+                            ('valid', 'u1'),
+                            # Number of the capture() call, dropped frames included
+                            ('frame', '<i8')])
+
+log_recorder = logging.getLogger('WFS.recorder')
+
+
+def record_dtype(spots_x, spots_y):
+    """Create the fixed-size record layout for a spot grid.
+
+    Args:
+        spots_x (int): Number of spots in X.
+        spots_y (int): Number of spots in Y.
+
+    Returns:
+        np.dtype: Structured little-endian record dtype. Spot arrays
+            are trimmed to [spots_y][spots_x].
+    """
+    grid = (int(spots_y), int(spots_x))
+    return np.dtype([('timestamp', '<f8'),
+                     ('status', '<i4'),
+                     ('exposure', '<f8'),
+                     ('gain', '<f8'),
+                     ('roc', '<f8'),
+                     ('zernike', '<f4', (ZERNIKE_COUNT,)),
+                     ('wavefront', '<f4', grid),
+                     ('deviations_x', '<f4', grid),
+                     ('deviations_y', '<f4', grid),
+                     ('centroid_x', '<f4', grid),
+                     ('centroid_y', '<f4', grid)])
+
+
+def chunk_name(epoch, chunk):
+    """Get the file name of a chunk.
+
+    Args:
+        epoch (int): Configuration epoch.
+        chunk (int): Chunk number within the epoch.
+    """
+    return f'epoch{epoch:03d}_chunk{chunk:05d}.rec'
+
+
+def geometry(wfs):
+    """Get the configuration that defines the record layout.
+
+    Args:
+        wfs (WFS): Configured WFS session.
+
+    Returns:
+        dict: Spot grid and camera configuration.
+    """
+    return {'spots_x': wfs.spots_x.value,
+            'spots_y': wfs.spots_y.value,
+            'cam_resolution_index': wfs.cam_resolution_index.value,
+            'cam_resolution_x': wfs.cam_resolution_x.value,
+            'cam_resolution_y': wfs.cam_resolution_y.value,
+            'mla_name': wfs.mla_name.value.decode(),
+            'lenslet_pitch_um': wfs.lenslet_pitch_um.value,
+            'wavelength': wfs.wavelength.value}
+
+
+class SessionRecorder(object):
+    """Record the results of WFS.update() into a session directory.
+
+    Records are collected in a preallocated batch and written with one
+    write call per batch_size frames.
+
+    Args:
+        path (str): Session directory, created if it does not exist.
+        wfs (WFS): Session to record from.
+        batch_size (int): Frames per write.
+        chunk_frames (int): Frames per chunk file.
+    """
+
+    def __init__(self, path, wfs, batch_size=64, chunk_frames=4096):
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f'Session already exists: {path}')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.wfs = wfs
+        self.batch_size = int(batch_size)
+        self.chunk_frames = int(chunk_frames)
+        self.header = {'version': RECORD_VERSION,
+                       'created': time.time(),
+                       'instrument_name': wfs.instrument_name_wfs.value.decode(),
+                       'serial_number_wfs': wfs.serial_number_wfs.value.decode(),
+                       'serial_number_camera': wfs.serial_number_camera.value.decode(),
+                       'epochs': []}
+        self.frame_count = 0
+        self.epoch = -1
+        self.geometry = None
+        self.batch = None
+        self.batch_count = 0
+        self.chunk = 0
+        self.chunk_count = 0
+        self.index_file = open(os.path.join(path, INDEX_FILE), 'ab')
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write_header(self):
+        """Write the header atomically."""
+        header_path = os.path.join(self.path, HEADER_FILE)
+        with open(header_path + '.tmp', 'w') as f:
+            json.dump(self.header, f, indent=2)
+        os.replace(header_path + '.tmp', header_path)
+
+    def _start_epoch(self, current_geometry):
+        """Flush pending records and start a new configuration epoch.
+
+        Args:
+            current_geometry (dict): Geometry of the new epoch.
+        """
+        self.flush()
+        self.epoch += 1
+        self.geometry = current_geometry
+        dtype = record_dtype(current_geometry['spots_x'], current_geometry['spots_y'])
+        self.batch = np.zeros(self.batch_size, dtype=dtype)
+        self.chunk = 0
+        self.chunk_count = 0
+        self.header['epochs'].append(dict(current_geometry,
+                                          epoch=self.epoch,
+                                          first_frame=self.frame_count,
+                                          record_size=dtype.itemsize,
+                                          dtype=np.lib.format.dtype_to_descr(dtype)))
+        self._write_header()
+        log_recorder.info(f'Epoch {self.epoch}: {current_geometry["spots_x"]} x {current_geometry["spots_y"]} spots')
+
+    def record(self):
+        """Append the current results of the WFS to the session.
+
+        Call after WFS.update().
+
+        Returns:
+            int: Frame number of the record.
+        """
+        wfs = self.wfs
+        current_geometry = geometry(wfs)
+        if current_geometry != self.geometry:
+            self._start_epoch(current_geometry)
+        rows = current_geometry['spots_y']
+        columns = current_geometry['spots_x']
+        record = self.batch[self.batch_count]
+        record['timestamp'] = time.time()
+        record['status'] = wfs.device_status.value
+        record['exposure'] = wfs.exposure_time_actual.value
+        record['gain'] = wfs.master_gain_actual.value
+        record['roc'] = wfs.roc_mm.value
+        record['zernike'] = np.ctypeslib.as_array(wfs.array_zernike_um)[:ZERNIKE_COUNT]
+        for field, array in (('wavefront', wfs.array_wavefront),
+                             ('deviations_x', wfs.array_deviations_x),
+                             ('deviations_y', wfs.array_deviations_y),
+                             ('centroid_x', wfs.array_centroid_x),
+                             ('centroid_y', wfs.array_centroid_y)):
+            record[field] = np.ctypeslib.as_array(array)[:rows, :columns]
+        self.batch_count += 1
+        frame = self.frame_count
+        self.frame_count += 1
+        stamps = getattr(wfs, 'frame_stamps', None)
+        if stamps is not None:
+            stamps.delivered('recorder')
+        if self.batch_count == self.batch_size:
+            self.flush()
+        return frame
+
+    def flush(self):
+        """Write all pending records and index them."""
+        written = 0
+        while written < self.batch_count:
+            if self.chunk_count == self.chunk_frames:
+                self.chunk += 1
+                self.chunk_count = 0
+            count = min(self.batch_count - written, self.chunk_frames - self.chunk_count)
+            with open(os.path.join(self.path, chunk_name(self.epoch, self.chunk)), 'ab') as f:
+                f.write(self.batch[written:written + count].tobytes())
+            first_frame = self.frame_count - self.batch_count + written
+            entry = np.array([(self.epoch, self.chunk, first_frame, self.chunk_count, count)], dtype=INDEX_DTYPE)
+            self.index_file.write(entry.tobytes())
+            self.chunk_count += count
+            written += count
+        self.index_file.flush()
+        self.batch_count = 0
+
+    def close(self):
+        """Flush pending records and close the session."""
+        if self.closed:
+            return
+        self.flush()
+        self.index_file.close()
+        self.closed = True
+        log_recorder.info(f'Recorded {self.frame_count} frames to {self.path}')
+
+
+class SessionReader(object):
+    """Read a recorded session through memory maps.
+
+    Opening a session only parses the header and the index; chunk
+    files are mapped on demand and never copied.
+
+    Args:
+        path (str): Session directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+        if self.header['version'] != RECORD_VERSION:
+            raise ValueError(f'Unsupported record version: {self.header["version"]}')
+        self.epochs = self.header['epochs']
+        self.dtypes = [np.lib.format.descr_to_dtype(_descr(epoch['dtype'])) for epoch in self.epochs]
+        self.index = None
+        self.chunk_counts = {}
+        self._chunks = {}
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the index to pick up records appended since opening."""
+        self.index = np.fromfile(os.path.join(self.path, INDEX_FILE), dtype=INDEX_DTYPE)
+        self.chunk_counts = {}
+        for entry in self.index:
+            key = (int(entry['epoch']), int(entry['chunk']))
+            self.chunk_counts[key] = self.chunk_counts.get(key, 0) + int(entry['count'])
+
+    def __len__(self):
+        return int(self.index['count'].sum())
+
+    def __getitem__(self, frame):
+        """Get a single record by its frame number."""
+        if frame < 0:
+            frame += len(self)
+        row = np.searchsorted(self.index['first_frame'], frame, side='right') - 1
+        if row < 0 or frame >= self.index['first_frame'][row] + self.index['count'][row]:
+            raise IndexError(f'Frame {frame} not recorded')
+        entry = self.index[row]
+        chunk = self.chunk(int(entry['epoch']), int(entry['chunk']))
+        return chunk[int(entry['chunk_offset'] + frame - entry['first_frame'])]
+
+    def epoch_of(self, frame):
+        """Get the configuration epoch a frame was recorded in."""
+        row = np.searchsorted(self.index['first_frame'], frame, side='right') - 1
+        return int(self.index['epoch'][row])
+
+    def chunk(self, epoch, chunk):
+        """Memory map the indexed records of one chunk.
+
+        Args:
+            epoch (int): Configuration epoch.
+            chunk (int): Chunk number within the epoch.
+
+        Returns:
+            np.memmap: Read-only structured array of records.
+        """
+        key = (epoch, chunk)
+        count = self.chunk_counts.get(key, 0)
+        mapped = self._chunks.get(key)
+        if mapped is None or len(mapped) != count:
+            mapped = np.memmap(os.path.join(self.path, chunk_name(epoch, chunk)), dtype=self.dtypes[epoch],
+                               mode='r', shape=(count,))
+            self._chunks[key] = mapped
+        return mapped
+
+    def chunks(self, epoch=0):
+        """Memory map every chunk of an epoch in order.
+
+        Args:
+            epoch (int): Configuration epoch.
+
+        Returns:
+            list of np.memmap.
+        """
+        return [self.chunk(epoch, number) for number in sorted(chunk for e, chunk in self.chunk_counts if e == epoch)]
+
+    def read(self, epoch=0, field=None):
+        """Read all records of an epoch into one array.
+
+        Args:
+            epoch (int): Configuration epoch.
+            field (str, optional): Only read this field.
+
+        Returns:
+            np.ndarray: Records or field values. A single chunk is
+                returned as a memory map without copying.
+        """
+        chunks = self.chunks(epoch)
+        if field is not None:
+            chunks = [chunk[field] for chunk in chunks]
+        if len(chunks) == 1:
+            return chunks[0]
+        if not chunks:
+            dtype = self.dtypes[epoch] if field is None else self.dtypes[epoch][field]
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(chunks)
+
+
+class RawImageRecorder(object):
+    """Record raw spotfield images straight into a memory-mapped file.
+
+    The image file is allocated for capacity frames up front. Every
+    capture passes the next image slot to
+    WFS._get_spotfield_image_copy() so the driver copies the image
+    directly into the mapped pages, without an intermediate buffer. A
+    background thread flushes written pages to disk. When more than
+    max_pending frames are waiting to be flushed the disk is falling
+    behind and new frames are dropped instead of blocking acquisition.
+
+    Args:
+        path (str): Session directory, created if it does not exist.
+        wfs (WFS): Configured session to record from.
+        capacity (int): Maximum number of frames.
+        max_pending (int): Maximum number of captured but not yet
+            flushed frames before frames are dropped.
+        flush_interval (float): Maximum time between flushes in s.
+    """
+
+    def __init__(self, path, wfs, capacity, max_pending=32, flush_interval=0.05):
+        if os.path.exists(os.path.join(path, RAW_HEADER_FILE)):
+            raise FileExistsError(f'Spotfield recording already exists: {path}')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.wfs = wfs
+        self.capacity = int(capacity)
+        self.max_pending = int(max_pending)
+        self.flush_interval = flush_interval
+        self.rows = wfs.cam_resolution_y.value
+        self.columns = wfs.cam_resolution_x.value
+        self.header = {'version': RECORD_VERSION,
+                       'created': time.time(),
+                       'instrument_name': wfs.instrument_name_wfs.value.decode(),
+                       'serial_number_wfs': wfs.serial_number_wfs.value.decode(),
+                       'cam_resolution_index': wfs.cam_resolution_index.value,
+                       'rows': self.rows,
+                       'columns': self.columns,
+                       'capacity': self.capacity,
+                       'count': 0,
+                       'dropped': 0}
+        self.images = np.lib.format.open_memmap(os.path.join(path, RAW_IMAGE_FILE), mode='w+', dtype=np.uint8,
+                                                shape=(self.capacity, self.rows, self.columns))
+        self.frames = np.lib.format.open_memmap(os.path.join(path, RAW_FRAME_FILE), mode='w+',
+                                                dtype=RAW_FRAME_DTYPE, shape=(self.capacity,))
+        self.count = 0
+        self.captures = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.running = True
+        self.closed = False
+        self._write_header()
+        self.flusher = threading.Thread(target=self._flush_loop, name='RawImageFlusher', daemon=True)
+        self.flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write_header(self):
+        """Write the header atomically."""
+        self.header['count'] = self.count
+        self.header['dropped'] = self.dropped
+        header_path = os.path.join(self.path, RAW_HEADER_FILE)
+        with open(header_path + '.tmp', 'w') as f:
+            json.dump(self.header, f, indent=2)
+        os.replace(header_path + '.tmp', header_path)
+
+    def slot(self, index):
+        """Get an image slot as a ctypes buffer sharing the mapped pages.
+
+        Args:
+            index (int): Frame slot.
+
+        Returns:
+            ctypes.c_ubyte array of Rows * Columns bytes.
+        """
+        return (ctypes.c_ubyte * (self.rows * self.columns)).from_buffer(self.images[index])
+
+    def capture(self):
+        """Copy the current spotfield image into the next slot.
+
+        Call after an image has been taken, e.g. after WFS.update(),
+        and once per frame of a SessionRecorder of the same session:
+        the capture number stored with the image is the index of the
+        matching session record, also if frames were dropped.
+
+        Returns:
+            int: Frame number, or None if the frame was dropped.
+        """
+        capture = self.captures
+        self.captures += 1
+        if self.count >= self.capacity or self.count - self.flushed >= self.max_pending:
+            self.dropped += 1
+            if self.dropped == 1:
+                log_recorder.warning(f'Dropping spotfield images after frame {self.count}')
+            return None
+        index = self.count
+        wfs = self.wfs
+        status, _, rows, columns = wfs._get_spotfield_image_copy(self.slot(index))
+        if (rows, columns) != (self.rows, self.columns):
+            log_recorder.error(f'Spotfield image {columns} x {rows} does not match the recording')
+            self.dropped += 1
+            return None
+        frame = self.frames[index]
+        frame['timestamp'] = time.time()
+        frame['status'] = status
+        frame['exposure'] = wfs.exposure_time_actual.value
+        frame['gain'] = wfs.master_gain_actual.value
+        frame['valid'] = 1
+        frame['frame'] = capture
+        self.count += 1
+        self.flush_event.set()
+        stamps = getattr(wfs, 'frame_stamps', None)
+        if stamps is not None:
+            stamps.delivered('raw_recorder')
+        return index
+
+    def flush(self):
+        """Write all captured images to disk."""
+        with self.flush_lock:
+            count = self.count
+            if count == self.flushed:
+                return
+            self.images.flush()
+            self.frames.flush()
+            self.flushed = count
+
+    def _flush_loop(self):
+        """Flush captured images in the background until closed."""
+        while self.running:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the flusher, flush the remaining images and close."""
+        if self.closed:
+            return
+        self.running = False
+        self.flush_event.set()
+        self.flusher.join()
+        self.flush()
+        self._write_header()
+        self.closed = True
+        log_recorder.info(f'Recorded {self.count} spotfield images to {self.path}, dropped {self.dropped}')
+
+
+class RawImageReader(object):
+    """Read raw spotfield images through memory maps.
+
+    Args:
+        path (str): Session directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, RAW_HEADER_FILE)) as f:
+            self.header = json.load(f)
+        self.frames = np.load(os.path.join(path, RAW_FRAME_FILE), mmap_mode='r')
+        # Count the valid slots as well in case the recording was not closed
+        self.count = max(self.header['count'], int(np.count_nonzero(self.frames['valid'])))
+        self.images = np.load(os.path.join(path, RAW_IMAGE_FILE), mmap_mode='r')[:self.count]
+        self.frames = self.frames[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, frame):
+        """Get the image of a frame as a read-only [rows][columns] array."""
+        return self.images[frame]
+
+    def slot_of(self, capture):
+        """Find the image of a capture, e.g. of a session record.
+
+        Args:
+            capture (int): Number of the capture() call.
+
+        Returns:
+            int: Image index, or None if the frame was dropped.
+        """
+        if 'frame' not in self.frames.dtype.names:
+            # Recorded without capture numbers, images are in capture order
+            return capture if capture < self.count else None
+        index = int(np.searchsorted(self.frames['frame'], capture))
+        if index < self.count and self.frames['frame'][index] == capture:
+            return index
+        return None
+
+
+def _descr(descr):
+    """Convert a JSON decoded dtype description back to tuples."""
+    if isinstance(descr, str):
+        return descr
+    return [tuple(_descr_field(item) for item in field) for field in descr]
+
+
+def _descr_field(item):
+    """Convert lists in a dtype description field back to tuples."""
+    if isinstance(item, list):
+        return tuple(item)
+    return item
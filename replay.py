@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Replay recorded sessions through the WFS API.
+
+ReplayLibrary stands in for the WFS .dll and answers the driver calls
+made by WFS with the data of a session recorded by
+recorder.SessionRecorder and/or recorder.RawImageRecorder:
+
+    wfs = WFS(lib=ReplayLibrary('session', realtime=True))
+    wfs.connect()
+    wfs.config()
+    while True:
+        roc = wfs.update()
+
+Every call of _take_spotfield_image() or
+_take_spotfield_image_auto_exposure() advances to the next recorded
+frame. A read-ahead thread pages frames in from the memory maps ahead
+of playback. At the end of the recording the capture functions return
+WFS_ERROR_AWAITING_TRIGGER, as a live sensor waiting for a trigger
+would, unless loop is set.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from backend import StubLibrary, deref, set_grid, set_value
+from recorder import HEADER_FILE, RAW_HEADER_FILE, RawImageReader, SessionReader
+from wfs import WFS
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+log_replay = logging.getLogger('WFS.replay')
+
+
+class ReplayLibrary(StubLibrary):
+    """Driver stand-in playing back a recorded session.
+
+    Args:
+        path (str): Session directory with measurement records,
+            raw spotfield images or both.
+        realtime (bool): Play back with the original frame timing
+            instead of as fast as possible.
+        loop (bool): Restart at the first frame after the last one.
+        read_ahead (int): Number of frames loaded ahead of playback.
+    """
+
+    def __init__(self, path, realtime=False, loop=False, read_ahead=16):
+        self.session = SessionReader(path) if os.path.exists(os.path.join(path, HEADER_FILE)) else None
+        self.images = RawImageReader(path) if os.path.exists(os.path.join(path, RAW_HEADER_FILE)) else None
+        if self.session is None and self.images is None:
+            raise FileNotFoundError(f'No recording found in {path}')
+        header = self.session.header if self.session is not None else self.images.header
+        super(ReplayLibrary, self).__init__(instrument_name=header['instrument_name'].encode(),
+                                            serial_number_wfs=header['serial_number_wfs'].encode())
+        if self.session is not None:
+            self.serial_number_camera = header['serial_number_camera'].encode()
+            if self.session.epochs:
+                self.mla_name = self.session.epochs[0]['mla_name'].encode()
+                self.lenslet_pitch_um = self.session.epochs[0]['lenslet_pitch_um']
+        self.frame_count = len(self.session) if self.session is not None else len(self.images)
+        if self.session is not None and self.images is not None:
+            # Session records after the last recorded image
+            last = len(self.images) - 1
+            if last >= 0 and 'frame' in self.images.frames.dtype.names:
+                last = int(self.images.frames['frame'][last])
+            self.frame_count = min(self.frame_count, last + 1)
+        self.realtime = realtime
+        self.loop = loop
+        self.frame_number = -1
+        self.record = None
+        self.image = None
+        self.finished = False
+        self.clock_offset = None
+        self.frames = queue.Queue(maxsize=max(1, int(read_ahead)))
+        self.running = True
+        self.reader = threading.Thread(target=self._read_ahead, name='ReplayReadAhead', daemon=True)
+        self.reader.start()
+
+    def _load(self, frame):
+        """Load a frame from the memory maps into memory.
+
+        Args:
+            frame (int): Frame number.
+
+        Returns:
+            tuple: (frame, record, image, timestamp)
+        """
+        record = None
+        image = None
+        if self.session is not None:
+            record = self.session[frame].copy()
+            timestamp = float(record['timestamp'])
+        if self.images is not None:
+            # The image of a frame dropped by the recorder stays None, the previous image is kept
+            slot = frame if record is None else self.images.slot_of(frame)
+            if slot is not None:
+                image = np.ascontiguousarray(self.images[slot], dtype=np.uint8)
+            if record is None:
+                timestamp = float(self.images.frames[frame]['timestamp'])
+        return frame, record, image, timestamp
+
+    def _read_ahead(self):
+        """Queue frames ahead of playback until stopped."""
+        frame = 0
+        while self.running:
+            if frame >= self.frame_count:
+                if not self.loop or self.frame_count == 0:
+                    self._put(None)
+                    return
+                frame = 0
+            if not self._put(self._load(frame)):
+                return
+            frame += 1
+
+    def _put(self, item):
+        """Queue an item, giving up when playback is stopped."""
+        while self.running:
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        """Stop the read-ahead thread."""
+        self.running = False
+        self.reader.join()
+
+    def next_frame(self):
+        """Advance playback to the next frame.
+
+        Returns:
+            bool: False at the end of the recording.
+        """
+        if self.finished:
+            return False
+        item = self.frames.get()
+        if item is None:
+            self.finished = True
+            log_replay.info(f'End of recording after {self.frame_count} frames')
+            return False
+        self.frame_number, self.record, image, timestamp = item
+        if image is not None:
+            self.image = image
+        if self.realtime:
+            if self.clock_offset is None or self.frame_number == 0:
+                self.clock_offset = time.perf_counter() - timestamp
+            delay = timestamp + self.clock_offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.record is not None:
+            self.device_status = int(self.record['status'])
+        return True
+
+    # Driver functions
+    def WFS_ConfigureCam(self, instrument_handle, pixel_format, cam_resolution_index, spots_x, spots_y):
+        if self.session is None or not self.session.epochs:
+            return super(ReplayLibrary, self).WFS_ConfigureCam(instrument_handle, pixel_format,
+                                                               cam_resolution_index, spots_x, spots_y)
+        epoch = self.session.epochs[self.session.epoch_of(max(self.frame_number, 0))]
+        self.cam_resolution_index = epoch['cam_resolution_index']
+        set_value(spots_x, epoch['spots_x'])
+        set_value(spots_y, epoch['spots_y'])
+        return WFS.WFS_SUCCESS
+
+    def WFS_TakeSpotfieldImage(self, instrument_handle):
+        if not self.next_frame():
+            return WFS.WFS_ERROR_AWAITING_TRIGGER
+        return WFS.WFS_SUCCESS
+
+    def WFS_TakeSpotfieldImageAutoExpos(self, instrument_handle, exposure_time_actual, master_gain_actual):
+        if not self.next_frame():
+            return WFS.WFS_ERROR_AWAITING_TRIGGER
+        if self.record is not None:
+            set_value(exposure_time_actual, float(self.record['exposure']))
+            set_value(master_gain_actual, float(self.record['gain']))
+        elif self.images is not None:
+            set_value(exposure_time_actual, float(self.images.frames[self.frame_number]['exposure']))
+            set_value(master_gain_actual, float(self.images.frames[self.frame_number]['gain']))
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotCentroids(self, instrument_handle, array_centroid_x, array_centroid_y):
+        if self.record is None:
+            return WFS.WFS_ERROR_NO_SPOT_DETECTED
+        set_grid(array_centroid_x, self.record['centroid_x'])
+        set_grid(array_centroid_y, self.record['centroid_y'])
+        return WFS.WFS_SUCCESS
+
+    def WFS_GetSpotDeviations(self, instrument_handle, array_deviations_x, array_deviations_y):
+        if self.record is None:
+            return WFS.WFS_ERROR_NO_SPOT_DETECTED
+        set_grid(array_deviations_x, self.record['deviations_x'])
+        set_grid(array_deviations_y, self.record['deviations_y'])
+        return WFS.WFS_SUCCESS
+
+    def WFS_CalcWavefront(self, instrument_handle, wavefront_type, limit_to_pupil, array_wavefront):
+        if self.record is None:
+            return WFS.WFS_ERROR_NO_SPOT_DETECTED
+        set_grid(array_wavefront, self.record['wavefront'])
+        return WFS.WFS_SUCCESS
+
+    def WFS_CalcWavefrontStatistics(self, instrument_handle, wavefront_min, wavefront_max, wavefront_diff,
+                                    wavefront_mean, wavefront_rms, wavefront_weighted_rms):
+        if self.record is None:
+            return WFS.WFS_ERROR_NO_SPOT_DETECTED
+        wavefront = self.record['wavefront']
+        if np.isnan(wavefront).all():
+            return WFS.WFS_SUCCESS
+        mean = float(np.nanmean(wavefront))
+        rms = float(np.sqrt(np.nanmean((wavefront - mean) ** 2)))
+        set_value(wavefront_min, float(np.nanmin(wavefront)))
+        set_value(wavefront_max, float(np.nanmax(wavefront)))
+        set_value(wavefront_diff, float(np.nanmax(wavefront) - np.nanmin(wavefront)))
+        set_value(wavefront_mean, mean)
+        set_value(wavefront_rms, rms)
+        set_value(wavefront_weighted_rms, rms)  # Spot intensities are not recorded
+        return WFS.WFS_SUCCESS
+
+    def WFS_ZernikeLsf(self, instrument_handle, zernike_orders, array_zernike_um, array_zernike_orders_um, roc_mm):
+        if self.record is None:
+            return WFS.WFS_ERROR_NO_SPOT_DETECTED
+        zernike = self.record['zernike']
+        if deref(zernike_orders).value == WFS.ZERNIKE_ORDERS_AUTO:
+            modes = int(np.flatnonzero(zernike).max(initial=WFS.MIN_ZERNIKE_MODES))
+            set_value(zernike_orders, min(order for order, order_modes in WFS.zernike_modes_per_order.items()
+                                          if order_modes >= modes))
+        np.ctypeslib.as_array(deref(array_zernike_um))[:len(zernike)] = zernike
+        set_value(roc_mm, float(self.record['roc']))
+        return WFS.WFS_SUCCESS
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""Batched command RPC server for remote control of a WFS session.
+
+Requests and responses are single lines of JSON sent over TCP. A
+request holds a batch of WFS method calls that are executed in order
+while the session is locked, so a scripted test station pays one round
+trip per batch instead of one per call.
+
+Request:
+    {"id": 1, "stop_on_error": true,
+     "calls": [{"method": "_set_exposure_time", "args": [1.0]},
+               {"method": "_take_spotfield_image"},
+               {"method": "_zernike_lsf", "kwargs": {"zernike_orders": 4}}]}
+
+Response:
+    {"id": 1, "results": [{"result": [0, 1.0]}, {"result": 0},
+                          {"result": [0, 1234.5, 4, [...], [...]]}]}
+"""
+import argparse
+import ctypes
+import inspect
+import json
+import logging
+import socket
+import socketserver
+import threading
+
+from wfs import WFS, setup_logging
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 50505
+
+log_server = logging.getLogger('WFS.server')
+
+
+def to_json(value):
+    """Convert WFS return values into JSON serializable objects.
+
+    Args:
+        value: Return value of a WFS method. ctypes arrays become
+            (nested) lists, ctypes scalars their value and bytes are
+            decoded.
+
+    Returns:
+        JSON serializable representation of value.
+    """
+    if isinstance(value, (tuple, list)):
+        return [to_json(item) for item in value]
+    if isinstance(value, ctypes.Array):
+        if value._type_ is ctypes.c_char:
+            return to_json(value.value)
+        return [to_json(item) for item in value]
+    if isinstance(value, ctypes._SimpleCData):
+        return to_json(value.value)
+    if isinstance(value, bytes):
+        return value.decode(errors='replace')
+    return value
+
+
+def calls_driver(function):
+    """Check if a method calls a WFS_* function of the driver library.
+
+    Returns:
+        bool: True if the source of function calls self.lib.WFS_*.
+    """
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        return False
+    return 'self.lib.WFS_' in source
+
+
+class WFSRequestHandler(socketserver.StreamRequestHandler):
+    """Handle newline delimited JSON batches on one connection."""
+
+    def handle(self):
+        """Execute every batch received until the client disconnects."""
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            stamps = getattr(self.server.wfs, 'frame_stamps', None)
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'id': None, 'error': f'Invalid JSON: {e}'}
+            else:
+                response = self.server.execute(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+            # Stamp the delivery of a frame updated by this batch
+            updated = getattr(self.server.wfs, 'frame_stamps', None)
+            if updated is not None and updated is not stamps:
+                updated.delivered('server')
+
+
+class WFSServer(socketserver.ThreadingTCPServer):
+    """Expose the methods of one WFS session to local clients.
+
+    Batches from different connections never interleave; each batch
+    holds the session lock from its first to its last call.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+    # Public methods that may be called in addition to the _ driver functions
+    PUBLIC_METHODS = ('connect', 'config', 'update', 'disconnect', 'driver_statistics', 'reset_driver_statistics',
+                      'latency_statistics', 'reset_latency_statistics')
+    # _ driver functions the session calls itself, e.g. after every driver call
+    INTERNAL_METHODS = ('_error_message',)
+
+    def __init__(self, wfs, address=(DEFAULT_HOST, DEFAULT_PORT)):
+        super(WFSServer, self).__init__(address, WFSRequestHandler)
+        self.wfs = wfs
+        self.lock = threading.Lock()
+        self.methods = self.find_methods(wfs)
+
+    @classmethod
+    def find_methods(cls, wfs):
+        """Get the names of all methods callable through the server.
+
+        These are PUBLIC_METHODS and the _ methods wrapping a WFS_*
+        driver function. Other _ helpers, e.g. _allocate_buffers, and
+        INTERNAL_METHODS are not exposed.
+
+        Args:
+            wfs (WFS): Session to expose.
+
+        Returns:
+            frozenset of method names.
+        """
+        names = set()
+        for name, function in inspect.getmembers(type(wfs), inspect.isfunction):
+            if name in cls.PUBLIC_METHODS:
+                names.add(name)
+            elif (name.startswith('_') and not name.startswith('__') and name not in cls.INTERNAL_METHODS and
+                  calls_driver(function)):
+                names.add(name)
+        return frozenset(names)
+
+    def check_call(self, call):
+        """Check the shape of one call of a batch.
+
+        Returns:
+            str: Error message, or None if the call can be executed.
+        """
+        if not isinstance(call, dict):
+            return f'Call must be a JSON object: {call!r}'
+        if call.get('method') not in self.methods:
+            return f'Unknown method: {call.get("method")}'
+        if not isinstance(call.get('args', []), list):
+            return 'args must be a JSON array'
+        if not isinstance(call.get('kwargs', {}), dict):
+            return 'kwargs must be a JSON object'
+        return None
+
+    def execute(self, request):
+        """Execute a batch of calls and collect all results.
+
+        Args:
+            request (dict): Batch with 'calls' and optional 'id' and
+                'stop_on_error'.
+
+        Returns:
+            dict: Response with one result or error entry per call.
+                Calls skipped after an error are reported as skipped.
+        """
+        if not isinstance(request, dict):
+            return {'id': None, 'error': 'Request must be a JSON object'}
+        calls = request.get('calls', [])
+        if not isinstance(calls, list):
+            return {'id': request.get('id'), 'error': 'calls must be a JSON array'}
+        stop_on_error = request.get('stop_on_error', True)
+        results = []
+        with self.lock:
+            for index, call in enumerate(calls):
+                error = self.check_call(call)
+                if error is not None:
+                    results.append({'error': error})
+                else:
+                    method = call['method']
+                    try:
+                        value = getattr(self.wfs, method)(*call.get('args', []), **call.get('kwargs', {}))
+                    except Exception as e:
+                        log_server.exception(f'{method} failed')
+                        results.append({'error': f'{type(e).__name__}: {e}'})
+                    else:
+                        results.append({'result': to_json(value)})
+                        continue
+                if stop_on_error:
+                    results.extend({'skipped': True} for _ in calls[index + 1:])
+                    break
+        log_server.debug(f'Batch {request.get("id")}: {len(calls)} calls')
+        return {'id': request.get('id'), 'results': results}
+
+
+class WFSClient(object):
+    """Client for a WFSServer.
+
+    Calls can be sent one at a time with call() or queued on a batch
+    and sent together:
+
+        with WFSClient() as client:
+            batch = client.batch()
+            batch._set_exposure_time(1.0)
+            batch._set_pupil(0, 0, 5.4, 5.4)
+            batch._take_spotfield_image()
+            batch._zernike_lsf()
+            results = batch.send()
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.rfile = self.sock.makefile('rb')
+        self.request_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the connection to the server."""
+        self.rfile.close()
+        self.sock.close()
+
+    def execute(self, calls, stop_on_error=True):
+        """Send a batch of calls and wait for all results.
+
+        Args:
+            calls (list): (method, args, kwargs) tuples.
+            stop_on_error (bool): Skip the remaining calls after the
+                first failing call.
+
+        Returns:
+            list: One response entry per call.
+        """
+        self.request_id += 1
+        request = {'id': self.request_id,
+                   'stop_on_error': stop_on_error,
+                   'calls': [{'method': method, 'args': list(args), 'kwargs': kwargs}
+                             for method, args, kwargs in calls]}
+        self.sock.sendall(json.dumps(request).encode() + b'\n')
+        response = json.loads(self.rfile.readline())
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['results']
+
+    def call(self, method, *args, **kwargs):
+        """Call a single WFS method.
+
+        Returns:
+            Result of the method.
+
+        Raises:
+            RuntimeError: The method failed on the server.
+        """
+        response = self.execute([(method, args, kwargs)])[0]
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def batch(self):
+        """Create a new batch of calls for this client."""
+        return Batch(self)
+
+
+class Batch(object):
+    """Queue of WFS method calls sent to the server in one request."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, method):
+        def queue(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self.calls)
+
+    def send(self, stop_on_error=True):
+        """Send all queued calls and clear the queue.
+
+        Args:
+            stop_on_error (bool): Skip the remaining calls after the
+                first failing call.
+
+        Returns:
+            list: One response entry per queued call.
+        """
+        calls, self.calls = self.calls, []
+        return self.client.execute(calls, stop_on_error=stop_on_error)
+
+
+def main():
+    """Connect to the WFS and serve it until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--no-connect', action='store_true', help='do not connect and configure the WFS')
+    args = parser.parse_args()
+    setup_logging()
+    wfs = WFS()
+    if not args.no_connect:
+        wfs.connect()
+        wfs.config()
+    with WFSServer(wfs, (args.host, args.port)) as server:
+        log_server.info(f'Serving WFS on {args.host}:{args.port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    if not args.no_connect:
+        wfs.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Checked zero-copy view of the driver's spotfield image.
+
+The driver keeps the spotfield image in its own buffer and replaces it
+on the next capture. WFS.spotfield_view() returns a plain NumPy view of
+that buffer, which silently shows the next image (or freed memory after
+disconnect()) when kept. WFS.spotfield() returns a SpotfieldView, which
+knows the capture it belongs to and refuses access once the WFS has
+taken another image, reconfigured the camera or averaged into the
+buffer:
+
+    wfs.update()
+    view = wfs.spotfield()
+    peak = view.array.max()
+    kept = view.copy()  # Retain the image beyond the next capture
+"""
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+
+class SpotfieldView(object):
+    """Zero-copy view of one captured spotfield image.
+
+    Args:
+        wfs (WFS): WFS owning the image buffer.
+        array (np.ndarray): uint8 [rows][columns] view of the buffer.
+    """
+    __slots__ = ('wfs', 'capture', '_array')
+
+    def __init__(self, wfs, array):
+        self.wfs = wfs
+        self.capture = wfs.capture_count
+        self._array = array
+
+    @property
+    def valid(self):
+        """Check if the WFS has not taken another image since."""
+        return self.capture == self.wfs.capture_count
+
+    @property
+    def array(self):
+        """Get the uint8 [rows][columns] view of the driver buffer.
+
+        Raises:
+            RuntimeError: If the image was replaced by a new capture.
+        """
+        if not self.valid:
+            raise RuntimeError(f'Spotfield view of capture {self.capture} is invalid, '
+                               f'the driver buffer now holds capture {self.wfs.capture_count}')
+        return self._array
+
+    @property
+    def shape(self):
+        """Get (rows, columns) of the image."""
+        return self._array.shape
+
+    def copy(self):
+        """Copy the image to keep it beyond the next capture."""
+        return self.array.copy()
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array
+        return array if dtype is None else array.astype(dtype)
+
+    def __repr__(self):
+        state = 'valid' if self.valid else 'invalid'
+        return f'<SpotfieldView capture {self.capture} {self.shape[1]} x {self.shape[0]} {state}>'
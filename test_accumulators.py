@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from accumulators import LensletStatistics, WelfordAccumulator
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestWelfordAccumulator(object):
+    """Test class for the running per-element statistics."""
+
+    def test_statistics(self):
+        data = np.random.default_rng(1).normal(5, 2, (200, 3, 4))
+        data[10:50, 0, 0] = np.nan
+        accumulator = WelfordAccumulator((3, 4))
+        for frame in data:
+            accumulator.add(frame)
+        assert accumulator.frames == 200
+        assert accumulator.count[0, 0] == 160
+        assert np.allclose(accumulator.mean, np.nanmean(data, axis=0))
+        assert np.allclose(accumulator.variance(), np.nanvar(data, axis=0, ddof=1))
+        assert np.allclose(accumulator.std(ddof=0), np.nanstd(data, axis=0))
+        assert np.array_equal(accumulator.min, np.nanmin(data, axis=0))
+        assert np.array_equal(accumulator.peak_to_valley(), np.nanmax(data, axis=0) - np.nanmin(data, axis=0))
+
+    def test_empty_and_reset(self):
+        accumulator = WelfordAccumulator(2)
+        accumulator.add(np.array([1.0, np.nan]))
+        summary = accumulator.summary()
+        assert np.isnan(summary['mean'][1])
+        assert np.isnan(summary['std']).all()
+        assert summary['min'][0] == 1.0
+        accumulator.reset()
+        assert accumulator.frames == 0
+        assert accumulator.count.sum() == 0
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestLensletStatistics(object):
+    """Test class for statistics fed from WFS.update()."""
+
+    def test_update(self, wfs):
+        statistics = LensletStatistics(wfs)
+        wavefront = np.ctypeslib.as_array(wfs.array_wavefront)
+        for frame in range(4):
+            wavefront[:] = frame
+            wfs.array_zernike_um[4] = 2.0 * frame
+            wfs.update()
+        assert statistics['wavefront'].shape == (35, 47)
+        assert statistics['wavefront'].mean[34, 46] == 1.5
+        assert statistics['wavefront'].peak_to_valley()[0, 0] == 3
+        assert statistics['zernike'].mean[3] == 3.0
+        assert set(statistics.summary()) == {'wavefront', 'deviations_x', 'deviations_y', 'intensity', 'zernike'}
+        statistics.detach()
+        wfs.update()
+        assert statistics['wavefront'].frames == 4
+
+    def test_grid_change(self, wfs):
+        statistics = LensletStatistics(wfs, intensities=False)
+        wfs.update()
+        wfs._configure_cam(cam_resolution_index=4)
+        wfs.update()
+        assert statistics.grid == (wfs.spots_y.value, wfs.spots_x.value)
+        assert statistics['wavefront'].frames == 1
+        assert 'intensity' not in statistics.summary()
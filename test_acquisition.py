@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from acquisition import AcquisitionWorker, FrameMailbox
+from display import FrameSnapshot
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestAcquisitionWorker(object):
+    """Test class for the acquisition loop and the latest-frame mailbox."""
+
+    @staticmethod
+    def wait_for(condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < end
+            time.sleep(0.001)
+
+    def test_mailbox(self, wfs):
+        mailbox = FrameMailbox(history=3)
+        assert mailbox.take() is None
+        snapshots = []
+        for roc in (1.0, 2.0, 3.0, 4.0):
+            wfs.roc_mm.value = roc
+            snapshots.append(FrameSnapshot(wfs))
+            mailbox.put(snapshots[-1])
+        assert mailbox.take() is snapshots[-1]
+        assert mailbox.take() is None
+        assert mailbox.skipped == 3
+        assert mailbox.history().tolist() == [2.0, 3.0, 4.0]
+
+    def test_run_pause_stop(self, wfs):
+        mailbox = FrameMailbox()
+        worker = AcquisitionWorker(wfs, mailbox)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        try:
+            self.wait_for(lambda: mailbox.frames >= 3)
+            assert worker.pause(timeout=5)
+            assert worker.paused
+            frames = mailbox.frames
+            time.sleep(0.02)
+            assert mailbox.frames == frames
+            assert mailbox.take().frame == wfs.frame_number
+            worker.resume()
+            self.wait_for(lambda: mailbox.frames > frames)
+        finally:
+            worker.stop()
+            thread.join(5)
+        assert not thread.is_alive()
+        assert worker.error is None
+
+    def test_stop_before_run(self, wfs):
+        mailbox = FrameMailbox()
+        worker = AcquisitionWorker(wfs, mailbox)
+        worker.resume()
+        worker.stop()
+        # The thread starts after the stop, e.g. Start quickly followed by Close
+        worker.run()
+        assert mailbox.frames == 0
+        worker.resume()
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        try:
+            self.wait_for(lambda: mailbox.frames >= 1)
+        finally:
+            worker.stop()
+            thread.join(5)
+        assert not thread.is_alive()
+
+    def test_error_stops_loop(self, wfs):
+        worker = AcquisitionWorker(wfs, FrameMailbox())
+
+        def fail():
+            raise OSError('Camera lost')
+
+        wfs.update = fail
+        worker.run()
+        assert isinstance(worker.error, OSError)
+        assert worker.pause(timeout=0)
+
+    def test_spotfield_image(self, wfs):
+        mailbox = FrameMailbox()
+        worker = AcquisitionWorker(wfs, mailbox, spotfield_width=480)
+        wfs.lib.image[30:33, 60:63] = 250
+        wfs.update()
+        snapshot = FrameSnapshot(wfs)
+        worker.add_spotfield(snapshot)
+        assert snapshot.image_factor == 3
+        assert snapshot.image.shape == (360, 480)
+        assert snapshot.image[10, 20] == 250
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from averaging import ImageAverager
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestImageAverager(object):
+    """Test class for Python-side spotfield image averaging."""
+
+    @pytest.fixture
+    def frames(self):
+        return np.random.default_rng(2).integers(0, 256, (300, 6, 8), dtype=np.uint8)
+
+    @pytest.mark.parametrize('dtype', [np.uint32, np.float32])
+    def test_boxcar(self, frames, dtype):
+        averager = ImageAverager('boxcar', count=300, dtype=dtype)
+        for frame in frames:
+            average = averager.add(frame)
+        assert averager.ready
+        assert np.allclose(average, frames.mean(axis=0, dtype=np.float64), atol=1e-3)
+        averager.add(frames[0])
+        assert averager.frame_count == 1
+        assert np.array_equal(averager.average, frames[0])
+
+    def test_rolling(self, frames):
+        averager = ImageAverager('rolling', count=10, dtype=np.uint32)
+        for frame in frames[:25]:
+            averager.add(frame)
+        assert np.allclose(averager.average, frames[15:25].mean(axis=0))
+
+    def test_exponential(self, frames):
+        averager = ImageAverager('exponential', count=3, alpha=0.5)
+        for frame in frames[:3]:
+            averager.add(frame)
+        expected = (0.5 * frames[0] + 0.5 * frames[1]) * 0.5 + 0.5 * frames[2]
+        assert np.allclose(averager.average, expected)
+        assert averager.ready
+
+    def test_sigma_clip(self):
+        frames = np.full((10, 4, 4), 100, dtype=np.uint8)
+        frames[:, 0, 0] = [99, 101] * 5
+        frames[3, 0, 0] = 255
+        frames[3, 2, 2] = 101
+        averager = ImageAverager('sigma_clip', count=10, sigma=2)
+        for frame in frames:
+            averager.add(frame)
+        assert averager.average[0, 0] == pytest.approx((5 * 99 + 4 * 101) / 9)
+        assert averager.average[1, 1] == 100
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            ImageAverager('median')
+        with pytest.raises(ValueError):
+            ImageAverager('exponential', dtype=np.uint32)
+        with pytest.raises(ValueError):
+            ImageAverager(count=0)
+
+    def test_image_stage(self, wfs):
+        averager = ImageAverager('boxcar', count=1000)
+        wfs.image_stages.append(averager)
+        for value in (10, 20, 31):
+            wfs.lib.image[:] = value
+            wfs.update()
+            assert np.shares_memory(wfs.spotfield_view(), wfs.lib.image)
+        assert averager.frame_count == 3
+        assert averager.shape == (1080, 1440)
+        # The driver sees the rounded average
+        assert (wfs.lib.image == 20).all()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import json
+
+from benchmark import benchmark_update, compare, connected_wfs, flatten, main
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestBenchmark(object):
+    """Test class for the WFS benchmarks."""
+
+    @staticmethod
+    def results(update_us, method_us=10.0):
+        return {'methods': {'_get_status': {'median_us': method_us}},
+                'update': {'WFS20:0': {'total': {'median_us': update_us},
+                                       'stages': {'_calc_wavefront': {'median_us': update_us / 2}}}},
+                'gui': None}
+
+    def test_update_stages(self):
+        wfs = connected_wfs('WFS10', 4)
+        result = benchmark_update(wfs, repeat=2)
+        assert result['total']['median_us'] > 0
+        assert '_calc_wavefront' in result['stages']
+        assert '_calc_wavefront' not in vars(wfs)
+        assert wfs.cam_resolution_x.value == 180
+
+    def test_compare(self):
+        baseline = self.results(1000.0)
+        assert flatten(baseline) == {'methods/_get_status': 10.0,
+                                     'update/WFS20:0/total': 1000.0,
+                                     'update/WFS20:0/_calc_wavefront': 500.0}
+        assert compare(self.results(1200.0), baseline) == []
+        regressions = compare(self.results(1300.0), baseline)
+        assert [name for name, *_ in regressions] == ['update/WFS20:0/total', 'update/WFS20:0/_calc_wavefront']
+        assert compare(self.results(1300.0), baseline, threshold=0.5) == []
+        baseline['thresholds'] = {'update/WFS20:0/total': 0.1}
+        assert len(compare(self.results(1150.0), baseline)) == 1
+        # Below the timer noise floor
+        assert compare(self.results(1000.0, method_us=14.0), self.results(1000.0)) == []
+
+    def test_baseline(self, tmp_path):
+        path = str(tmp_path / 'benchmarks.json')
+        args = ['--repeat', '1', '--models', 'WFS10', '--baseline', path]
+        assert main(args + ['--update-baseline']) == 0
+        baseline = json.load(open(path))
+        assert baseline['threshold'] == 0.25
+        assert len(baseline['update']) == len(connected_wfs('WFS10').cam_res_WFS10)
+        assert main(args + ['--threshold', '1000']) == 0
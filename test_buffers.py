@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import ctypes
+
+import numpy as np
+import pytest
+
+from backend import StubLibrary
+from wfs import WFS
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestBuffers(object):
+    """Test class for the camera sized image and line buffers."""
+
+    @pytest.fixture
+    def wfs(self, make_wfs):
+        return make_wfs(StubLibrary(instrument_name=b'WFS10-5C'), config=False)
+
+    def test_lazy(self):
+        wfs = WFS(lib=StubLibrary())
+        assert wfs.array_image_buffer is None
+        assert wfs.camera_model() is None
+        # Largest resolution of all models, the WFS40 exceeds CAM_MAX_PIX_X/Y
+        assert wfs.image_size() == (2048, 2048)
+
+    def test_model_size(self, wfs):
+        assert wfs.camera_model() == 'WFS10'
+        assert wfs.image_size() == (640, 480)
+        assert ctypes.sizeof(wfs.array_image_buffer) == 640 * 480
+        assert len(wfs.array_line_min) == 640
+
+    def test_resolution(self, wfs):
+        wfs._configure_cam(2)
+        assert wfs.image_buffer_size == (360, 360)
+        image = wfs.array_image_buffer
+        _, buffer, rows, columns = wfs._get_spotfield_image_copy()
+        assert buffer is image
+        assert np.ctypeslib.as_array(buffer).shape == (rows, columns)
+        # Reused until the resolution changes
+        wfs._configure_cam(2)
+        assert wfs.array_image_buffer is image
+        wfs._configure_cam(0)
+        assert wfs.array_image_buffer is not image
+        assert len(wfs.array_line_selected) == 640
+
+    def test_spot_arrays(self, wfs):
+        wfs._configure_cam(4)
+        assert np.ctypeslib.as_array(wfs.array_centroid_x).shape == (WFS.MAX_SPOTS_Y, WFS.MAX_SPOTS_X)
+
+    def test_memory_report(self, wfs):
+        report = wfs.memory_report()
+        buffers = report['buffers']
+        assert buffers['array_image_buffer'] == 640 * 480
+        assert report['total'] == sum(buffers.values())
+        assert list(buffers.values()) == sorted(buffers.values(), reverse=True)
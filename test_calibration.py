@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from calibration import DarkFrameLibrary, FlatField, HotPixelMask, detect_hot_pixels, settings
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestDarkFrameLibrary(object):
+    """Test class for the dark frame library."""
+
+    def test_interpolation(self):
+        darks = DarkFrameLibrary()
+        darks.add(1.0, 1.0, 0, np.full((2, 2), 4.0))
+        darks.add(3.0, 1.0, 0, np.full((2, 2), 8.5))
+        assert len(darks) == 2
+        assert np.allclose(darks.dark(1.0, 1.0, 0), 4.0)
+        assert np.allclose(darks.dark(2.0, 1.0, 0), 6.25)
+        assert np.allclose(darks.dark(0.5, 1.0, 0), 4.0)
+        assert np.allclose(darks.dark(10.0, 1.0, 0), 8.5)
+        assert darks.dark(1.0, 2.0, 0) is None
+
+    def test_subtract(self):
+        darks = DarkFrameLibrary()
+        darks.add(1.0, 1.0, 0, np.array([[2.0, 10.0], [0.0, 255.0]]))
+        image = np.array([[5, 3], [7, 255]], dtype=np.uint8)
+        assert darks.subtract(image, 1.0, 1.0, 0)
+        assert image.tolist() == [[3, 0], [7, 0]]
+        assert not darks.subtract(image, 1.0, 1.0, 1)
+
+    def test_subtract_auto_exposure(self):
+        darks = DarkFrameLibrary()
+        darks.add(1.0, 1.0, 0, np.full((2, 2), 4.0))
+        darks.add(3.0, 1.0, 0, np.full((2, 2), 68.0))
+        image = np.full((2, 2), 100, dtype=np.uint8)
+        assert darks.subtract(image, 2.0, 1.0, 0)
+        assert (image == 64).all()
+        dark = darks._dark
+        # Exposure changes within one weight step reuse the prepared dark frame
+        for exposure in (2.001, 2.005, 1.999):
+            image[:] = 100
+            darks.subtract(image, exposure, 1.0, 0)
+            assert darks._dark is dark
+            assert (image == 64).all()
+        darks.subtract(image, 2.5, 1.0, 0)
+        assert darks._dark is dark
+        assert (dark == 52).all()
+
+    def test_capture_and_stage(self, wfs, tmp_path):
+        key = settings(wfs)
+        wfs.lib.image[:] = 3
+        wfs.lib.image[0, 0] = 50
+        darks = DarkFrameLibrary()
+        assert darks.capture(wfs, frames=4) == key
+        path = tmp_path / 'darks.npz'
+        darks.save(path)
+        darks = DarkFrameLibrary.load(path)
+        assert np.allclose(darks.dark(*key)[:2, :2], [[50, 3], [3, 3]])
+
+        wfs.image_stages.append(darks)
+        wfs.lib.image[:] = 10
+        wfs.update()
+        assert wfs.lib.image[0, 0] == 0
+        assert (wfs.lib.image[1:] == 7).all()
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestFlatField(object):
+    """Test class for the flat-field correction."""
+
+    def test_gain_map(self):
+        flat = FlatField()
+        gain = flat.add(0, np.array([[100.0, 50.0], [150.0, 0.0]]))
+        assert gain.dtype == np.float32
+        assert np.allclose(gain, [[0.75, 1.5], [0.5, 1.0]])
+        image = np.array([[100, 100], [200, 7]], dtype=np.uint8)
+        assert flat.correct(image, 0)
+        assert image.tolist() == [[75, 150], [100, 7]]
+        assert not flat.correct(image, 1)
+
+    def test_capture_and_stage(self, wfs, tmp_path):
+        rng = np.random.default_rng(3)
+        response = rng.uniform(0.8, 1.2, wfs.lib.image.shape)
+        darks = DarkFrameLibrary()
+        wfs.lib.image[:] = 5
+        darks.capture(wfs, frames=2)
+        wfs.lib.image[:] = np.rint(5 + 100 * response)
+        flat = FlatField()
+        flat.capture(wfs, frames=2, darks=darks)
+        path = tmp_path / 'flat.npz'
+        flat.save(path)
+        flat = FlatField.load(path)
+        assert len(flat) == 1
+
+        wfs.image_stages += [darks, flat]
+        wfs.update()
+        image = wfs.lib.image
+        assert image.std() < 1
+        assert abs(image.mean() - 100 * response.mean()) < 1
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestHotPixelMask(object):
+    """Test class for hot pixel detection and masking."""
+
+    @pytest.fixture
+    def stack(self):
+        stack = np.random.default_rng(4).integers(2, 6, (16, 10, 12), dtype=np.uint8)
+        # Hot pixel
+        stack[:, 2, 3] = 200
+        # Flickering pixel
+        stack[::2, 7, 0] = 120
+        return stack
+
+    def test_detect(self, stack):
+        assert detect_hot_pixels(stack).tolist() == [2 * 12 + 3, 7 * 12]
+
+    def test_apply(self):
+        mask = HotPixelMask()
+        mask.add('CAM', 0, [0, 1, 5])
+        image = np.array([[255, 255, 10],
+                          [20, 30, 255]], dtype=np.uint8)
+        assert mask.apply(image, 'CAM', 0)
+        # (0, 0) has only the good neighbour below, (0, 1) and (1, 2) the neighbours 10 and 30
+        assert image.tolist() == [[20, 20, 10], [20, 30, 20]]
+        assert not mask.apply(image, 'CAM', 1)
+
+    def test_capture_and_stage(self, wfs, tmp_path):
+        wfs.lib.image[:] = 4
+        wfs.lib.image[100, 200] = 255
+        mask = HotPixelMask()
+        assert mask.capture(wfs, frames=3).tolist() == [100 * wfs.lib.image.shape[1] + 200]
+        path = tmp_path / 'hot_pixels.npz'
+        mask.save(path)
+        mask = HotPixelMask.load(path)
+        assert len(mask) == 1
+
+        wfs.image_stages.append(mask)
+        wfs.update()
+        assert (wfs.lib.image == 4).all()
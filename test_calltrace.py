@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import ctypes
+
+import pytest
+
+from backend import StubLibrary
+from calltrace import TraceReplayLibrary, TracingLibrary, buffer_bytes, read_trace
+from vi import Vi
+from wfs import WFS
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestCallTrace(object):
+    """Test class for the call-trace recorder and trace replay."""
+
+    frames = 3
+
+    @staticmethod
+    def run(wfs, frames):
+        results = []
+        for frame in range(frames):
+            results.append(wfs.update())
+            status, image_ref, rows, columns = wfs._get_spotfield_image()
+            pointer = ctypes.cast(image_ref, ctypes.POINTER(ctypes.c_void_p)).contents.value
+            results.append(ctypes.string_at(pointer, rows * columns)[:16])
+            results.append(bytes(wfs.array_wavefront))
+        wfs.disconnect()
+        return results
+
+    def test_record(self, tmp_path):
+        path = str(tmp_path / 'update.trace')
+        stub = StubLibrary()
+        lib = TracingLibrary(path, stub)
+        wfs = WFS(lib=lib)
+        wfs.connect()
+        wfs.config()
+        self.run(wfs, self.frames)
+        lib.close()
+        calls = read_trace(path)
+        assert len(calls) == lib.call_count
+        names = [header['f'] for header, _ in calls]
+        assert names[0] == 'WFS_GetInstrumentListLen'
+        assert names.count('WFS_GetSpotfieldImage') == 2 * self.frames
+        header, blobs = calls[0]
+        assert header['o'] == [[1, ctypes.sizeof(ctypes.c_long)]]
+        assert blobs == [buffer_bytes(Vi.int32(1))]
+        assert header['ns'] >= 0
+        header, blobs = calls[names.index('WFS_GetStatus')]
+        assert header['a'] == [['v', StubLibrary.HANDLE], ['b', ctypes.sizeof(wfs.device_status)]]
+
+    def test_replay_identical(self, tmp_path):
+        path = str(tmp_path / 'update.trace')
+        stub = StubLibrary()
+        lib = TracingLibrary(path, stub)
+        wfs = WFS(lib=lib)
+        wfs.connect()
+        wfs.config()
+        stub.image[:, :] = 7
+        stub.image[0, :4] = [1, 2, 3, 4]
+        live = self.run(wfs, self.frames)
+        lib.close()
+
+        replay = TraceReplayLibrary(path)
+        wfs = WFS(lib=replay)
+        wfs.connect()
+        wfs.config()
+        assert self.run(wfs, self.frames) == live
+        assert live[1][:4] == bytes([1, 2, 3, 4])
+        assert replay.finished
+        assert replay.mismatches == 0
+
+    def test_mismatch(self, tmp_path):
+        path = str(tmp_path / 'update.trace')
+        lib = TracingLibrary(path, StubLibrary())
+        WFS(lib=lib).connect()
+        lib.close()
+        wfs = WFS(lib=TraceReplayLibrary(path))
+        with pytest.raises(RuntimeError):
+            wfs.config()
+        lenient = TraceReplayLibrary(path, strict=False)
+        wfs = WFS(lib=lenient)
+        wfs._get_status()
+        assert lenient.mismatches == 1
+        assert wfs.device_status.value == 0
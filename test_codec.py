@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import io
+
+import numpy as np
+import pytest
+
+import codec
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestCodec(object):
+    """Test class for the sparse spotfield image codec."""
+
+    @pytest.fixture
+    def image(self):
+        rng = np.random.default_rng(6)
+        image = np.zeros((1080, 1440), dtype=np.uint8)
+        for y in range(10, 1080, 33):
+            for x in range(10, 1440, 33):
+                image[y:y + 5, x:x + 5] = rng.integers(1, 256, (5, 5))
+        # Runs across row ends and at the image corners
+        image[0, 0] = 7
+        image[99, 1435:] = 9
+        image[100, :3] = 9
+        image[-1, -1] = 255
+        return image
+
+    def test_round_trip(self, image):
+        data = codec.encode(image)
+        assert len(data) < image.nbytes / 10
+        decoded = codec.decode(data)
+        assert decoded.dtype == np.uint8
+        assert np.array_equal(decoded, image)
+
+    @pytest.mark.parametrize('value', [0, 1])
+    def test_uniform(self, value):
+        image = np.full((4, 6), value, dtype=np.uint8)
+        assert np.array_equal(codec.decode(codec.encode(image)), image)
+
+    def test_runs(self):
+        starts, lengths = codec.runs(np.array([[1, 1, 0], [0, 2, 3]], dtype=np.uint8))
+        assert starts.tolist() == [0, 4]
+        assert lengths.tolist() == [2, 2]
+
+    def test_decode_into(self, image):
+        out = np.full(image.shape, 3, dtype=np.uint8)
+        assert codec.decode(codec.encode(image), out) is out
+        assert np.array_equal(out, image)
+        with pytest.raises(ValueError):
+            codec.decode(codec.encode(image), np.zeros((2, 2), dtype=np.uint8))
+
+    def test_decode_into_view(self, image):
+        # Every other column of a wider buffer, not contiguous
+        buffer = np.full((image.shape[0], 2 * image.shape[1]), 3, dtype=np.uint8)
+        out = buffer[:, ::2]
+        codec.decode(codec.encode(image), out)
+        assert np.array_equal(out, image)
+        assert (buffer[:, 1::2] == 3).all()
+
+    def test_invalid(self, image):
+        with pytest.raises(ValueError):
+            codec.encode(image.astype(np.uint16))
+        with pytest.raises(ValueError):
+            codec.decode(b'XXXX' + codec.encode(image)[4:])
+        with pytest.raises(ValueError):
+            codec.decode(codec.encode(image)[:-1])
+
+    def test_stream(self, image):
+        f = io.BytesIO()
+        codec.write(f, image)
+        codec.write(f, image[:10])
+        f.seek(0)
+        assert np.array_equal(codec.read(f), image)
+        assert np.array_equal(codec.read(f), image[:10])
+        assert codec.read(f) is None
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from display import (DISPLAY_ZERNIKE_MODES, OVERLAY_CENTROID, OVERLAY_REFERENCE, FrameSnapshot, RingBuffer,
+                     WavefrontSurface, display_factor, downsample, overlay_points, spotfield_lut)
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestDisplay(object):
+    """Test class for the GUI display helpers."""
+
+    def test_ring_buffer(self):
+        ring = RingBuffer(4)
+        assert ring.ordered().tolist() == [0, 0, 0, 0]
+        for value in range(1, 7):
+            ring.append(value)
+        assert ring.ordered().tolist() == [3, 4, 5, 6]
+        assert ring.ordered() is ring.ordered()
+        assert ring.count == 6
+
+    def test_snapshot(self, wfs):
+        wfs.update()
+        snapshot = FrameSnapshot(wfs)
+        assert snapshot.frame == wfs.frame_number
+        assert snapshot.stamps is wfs.frame_stamps
+        assert snapshot.roc_mm == wfs.roc_mm.value
+        assert snapshot.zernike_um.shape == (DISPLAY_ZERNIKE_MODES,)
+        assert len(snapshot.line_min) == wfs.cam_resolution_x.value
+        # A copy, not a view of the WFS arrays
+        wfs.array_line_min[0] = -1
+        assert snapshot.line_min[0] != -1
+
+    def test_snapshot_wavefront(self, wfs):
+        wfs.update()
+        wfs._get_xy_scale()
+        snapshot = FrameSnapshot(wfs)
+        assert snapshot.wavefront.shape == (wfs.spots_y.value, wfs.spots_x.value)
+        assert snapshot.scale_x.shape == (wfs.spots_x.value,)
+        assert snapshot.scale_y.shape == (wfs.spots_y.value,)
+        assert snapshot.scale_x[wfs.spots_x.value // 2] == 0
+
+    def test_wavefront_surface(self):
+        surface = WavefrontSurface(interval=0.1)
+        assert surface.due(0)
+        wavefront = np.array([[0.0, 1.0, 2.0],
+                              [np.nan, 3.0, 4.0]])
+        scale_x = np.array([-1.0, 0.0, 1.0])
+        scale_y = np.array([0.0, 1.0])
+        assert surface.update(wavefront, scale_x, scale_y, now=1.0)
+        assert not surface.due(1.05)
+        assert surface.due(1.1)
+        assert surface.z.shape == (3, 2)
+        assert surface.z.tolist() == [[0, 0], [1, 3], [2, 4]]
+        assert surface.colors[0, 1, 3] == 0
+        assert surface.colors[0, 0].tolist() == surface.lut[0].tolist()
+        assert surface.colors[2, 1].tolist() == surface.lut[-1].tolist()
+        z = surface.z
+        assert not surface.update(wavefront * 2, scale_x, scale_y)
+        assert surface.z is z
+        assert surface.z[2, 1] == 8
+        assert surface.update(wavefront, scale_x + 1, scale_y)
+        assert surface.update(wavefront[:, :2], scale_x[:2], scale_y)
+
+    def test_downsample(self):
+        image = np.zeros((7, 9), dtype=np.uint8)
+        image[4, 5] = 200
+        assert display_factor(9, width=4) == 3
+        assert display_factor(9, width=20) == 1
+        small = downsample(image, 3)
+        assert small.shape == (2, 3)
+        assert small[1, 1] == 200
+        assert small.sum() == 200
+        assert not np.shares_memory(downsample(image, 1), image)
+
+    def test_spotfield_lut(self):
+        lut = spotfield_lut()
+        assert lut.shape == (256, 3)
+        assert lut[0].tolist() == [0, 0, 0]
+        assert lut[255].tolist() == [255, 255, 255]
+
+    def test_overlay_points(self, wfs):
+        wfs.update()
+        snapshot = FrameSnapshot(wfs)
+        snapshot.centroid_x[:] = 10
+        snapshot.centroid_y[:] = 20
+        snapshot.centroid_x[0, 0] = np.nan
+        snapshot.reference_x[:] = 4
+        snapshot.reference_y[:] = 8
+        positions, kinds = overlay_points(snapshot, factor=2)
+        spots = snapshot.centroid_x.size
+        assert positions.shape == (2 * spots - 1, 2)
+        assert (kinds == OVERLAY_CENTROID).sum() == spots - 1
+        assert positions[0].tolist() == [5, 10]
+        assert positions[kinds == OVERLAY_REFERENCE][0].tolist() == [2, 4]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from backend import StubLibrary
+from instrumentation import InstrumentedLibrary, LatencyHistogram
+from wfs import WFS
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestLatencyHistogram(object):
+    """Test class for the log-linear latency histogram."""
+
+    def test_exact_small_values(self):
+        histogram = LatencyHistogram(significant_bits=5)
+        for value in range(1, 51):
+            histogram.record(value)
+        assert histogram.count == 50
+        assert histogram.percentile(50) == 25
+        assert histogram.percentile(100) == 50
+        assert histogram.min == 1
+        assert histogram.mean == 25.5
+
+    def test_relative_error(self):
+        histogram = LatencyHistogram(significant_bits=5)
+        values = [int(1.1 ** exponent) for exponent in range(50, 250)]
+        for value in values:
+            histogram.record(value)
+        for percent in (10, 50, 90, 99):
+            exact = values[int(percent / 100 * len(values) + 0.5) - 1]
+            assert histogram.percentile(percent) == pytest.approx(exact, rel=2 ** -5)
+        assert histogram.percentile(100) == max(values)
+
+    def test_clamp_merge_reset(self):
+        histogram = LatencyHistogram(max_value=1000)
+        histogram.record(-5)
+        histogram.record(10 ** 9)
+        assert (histogram.min, histogram.max) == (0, 1000)
+        other = LatencyHistogram(max_value=1000)
+        other.record(500)
+        histogram.merge(other)
+        assert histogram.count == 3
+        assert histogram.percentile(50) == pytest.approx(500, rel=2 ** -5)
+        histogram.reset()
+        assert histogram.count == 0
+        assert histogram.percentile(50) is None
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestInstrumentation(object):
+    """Test class for the driver call instrumentation of WFS."""
+
+    @pytest.fixture
+    def wfs(self, make_wfs):
+        return make_wfs(config=False)
+
+    def test_counts(self, wfs):
+        wfs._get_spotfield_image()
+        wfs.config()
+        for _ in range(3):
+            wfs.update()
+        statistics = wfs.driver_statistics()
+        functions = statistics['functions']
+        assert functions['WFS_ZernikeLsf']['count'] == 3
+        assert functions['WFS_GetSpotfieldImage']['count'] == 4
+        assert functions['WFS_GetSpotfieldImage']['errors'] == {WFS.WFS_ERROR_CAM_NOT_CONFIGURED: 1}
+        assert functions['WFS_init']['count'] == 1
+        assert functions['WFS_ZernikeLsf']['p50_us'] <= functions['WFS_ZernikeLsf']['max_us']
+        totals = [function['total_ms'] for function in functions.values()]
+        assert totals == sorted(totals, reverse=True)
+        update = statistics['update']
+        assert update['count'] == 3
+        assert update['driver_ms'] + update['python_ms'] == pytest.approx(update['total_ms'])
+        assert 0 < update['driver_ms'] < update['total_ms']
+
+    def test_reset(self, wfs):
+        wfs.update()
+        wfs.reset_driver_statistics()
+        assert wfs.driver_statistics()['functions'] == {}
+        assert wfs.driver_statistics()['update']['count'] == 0
+        wfs._get_status()
+        assert wfs.driver_statistics()['functions']['WFS_GetStatus']['count'] == 1
+        wfs.connect()
+        assert 'WFS_GetStatus' in wfs.driver_statistics()['functions']
+        assert wfs.driver_statistics()['functions']['WFS_GetStatus']['count'] == 1
+
+    def test_transparent(self):
+        stub = StubLibrary()
+        lib = InstrumentedLibrary(stub)
+        assert lib.model == 'WFS20'
+        assert lib.HANDLE == StubLibrary.HANDLE
+        with pytest.raises(AttributeError):
+            lib.missing
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from latency import FrameStamps, LatencyMonitor
+from recorder import SessionRecorder
+from server import WFSClient, WFSServer
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestLatencyMonitor(object):
+    """Test class for latency percentiles and jitter."""
+
+    def test_frame_done(self):
+        monitor = LatencyMonitor()
+        for frame in range(4):
+            stamps = FrameStamps(frame, monitor)
+            stamps.capture_start = frame * 10000
+            stamps.capture_return = stamps.capture_start + 1000
+            stamps.analysis_done = stamps.capture_return + 2000 + frame * 160
+            monitor.frame_done(stamps)
+        summary = monitor.summary()
+        assert summary['capture']['count'] == 4
+        assert summary['capture']['p50_us'] == 1.0
+        assert summary['capture']['jitter_us'] == 0
+        assert summary['period']['count'] == 3
+        assert summary['period']['p99_us'] == pytest.approx(10.0, rel=2 ** -5)
+        # Consecutive analysis latencies differ by 160 ns
+        assert summary['analysis']['jitter_us'] == pytest.approx(0.16 * (1 - (15 / 16) ** 3))
+        monitor.reset()
+        assert monitor.summary() == {}
+
+    def test_delivered(self):
+        monitor = LatencyMonitor()
+        stamps = FrameStamps(0, monitor)
+        stamps.capture_start = 0
+        latency = stamps.delivered('gui')
+        assert latency == stamps.deliveries['gui']
+        assert monitor.summary()['delivery.gui']['count'] == 1
+
+    def test_concurrent_summary(self):
+        monitor = LatencyMonitor()
+        done = threading.Event()
+
+        def record():
+            for index in range(2000):
+                monitor.record(f'delivery.{index}', index)
+            done.set()
+        thread = threading.Thread(target=record)
+        thread.start()
+        while not done.is_set():
+            monitor.summary()
+        thread.join()
+        assert len(monitor.summary()) == 2000
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestFrameStamps(object):
+    """Test class for latency stamping of WFS frames."""
+
+    def test_update(self, wfs):
+        assert wfs.frame_stamps is None
+        wfs.update()
+        wfs.update()
+        stamps = wfs.frame_stamps
+        assert stamps.frame == 1
+        assert stamps.capture_start <= stamps.capture_return <= stamps.analysis_done
+        assert stamps.total_ns == stamps.capture_ns + stamps.analysis_ns
+        stamps.delivered('gui')
+        assert stamps.deliveries['gui'] >= stamps.analysis_done
+        latency = wfs.latency_statistics()
+        assert latency['total']['count'] == 2
+        assert latency['delivery.gui']['count'] == 1
+        wfs.connect()
+        assert wfs.latency_statistics() == {}
+
+    def test_recorder(self, tmp_path, wfs):
+        with SessionRecorder(str(tmp_path / 'session'), wfs) as recorder:
+            wfs.update()
+            recorder.record()
+        assert 'recorder' in wfs.frame_stamps.deliveries
+        assert wfs.latency_statistics()['delivery.recorder']['count'] == 1
+
+    def test_server(self, wfs):
+        server = WFSServer(wfs, ('127.0.0.1', 0))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with WFSClient(*server.server_address, timeout=10) as client:
+                client.call('_get_status')
+                assert wfs.frame_stamps is None
+                client.call('update')
+                client.call('_get_status')
+                assert list(wfs.frame_stamps.deliveries) == ['server']
+                assert client.call('latency_statistics')['delivery.server']['count'] == 1
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from noise import AdaptiveNoiseFloor, tile_size
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestAdaptiveNoiseFloor(object):
+    """Test class for the adaptive per-tile noise floor."""
+
+    @pytest.fixture
+    def image(self):
+        rng = np.random.default_rng(5)
+        image = np.empty((120, 160), dtype=np.uint8)
+        image[:, :80] = np.clip(rng.normal(10, 2, (120, 80)), 0, 255)
+        image[:, 80:] = np.clip(rng.normal(40, 5, (120, 80)), 0, 255)
+        # Spots
+        image[20:23, 20:23] = 30
+        image[60:63, 120:123] = 90
+        return image
+
+    def test_tile_size(self):
+        assert tile_size(1080, 64) == 60
+        assert tile_size(1024, 64) == 64
+        assert tile_size(30, 64) == 30
+
+    def test_estimate(self, image):
+        noise_floor = AdaptiveNoiseFloor(tile=40, subsample=2)
+        noise_floor.estimate(image)
+        summary = noise_floor.summary()
+        assert summary['tiles'] == (40, 40)
+        assert summary['background'].shape == (3, 4)
+        assert np.allclose(summary['background'][:, :2], 10, atol=1)
+        assert np.allclose(summary['background'][:, 2:], 40, atol=1)
+        assert np.allclose(summary['rms'][:, :2], 2, atol=1)
+        assert np.allclose(summary['rms'][:, 2:], 5, atol=1.5)
+
+    def test_apply(self, image):
+        noise_floor = AdaptiveNoiseFloor(tile=40, subsample=2)
+        noise_floor(image)
+        assert (image[20:23, 20:23] == 30).all()
+        assert (image[60:63, 120:123] == 90).all()
+        assert (image[:, :80] > 0).mean() < 0.01
+        assert (image[:, 80:] > 0).mean() < 0.01
+
+    def test_refresh(self, image):
+        noise_floor = AdaptiveNoiseFloor(tile=40, refresh=3)
+        noise_floor.update(image)
+        threshold = noise_floor.threshold.copy()
+        image[:] = 100
+        noise_floor.update(image)
+        assert (noise_floor.threshold[0] > threshold[0]).all()
+        assert (noise_floor.threshold[1:] == threshold[1:]).all()
+        noise_floor.update(image)
+        noise_floor.update(image)
+        assert (noise_floor.threshold > threshold).all()
+
+    def test_wfs(self, image, wfs):
+        wfs.noise_floor = AdaptiveNoiseFloor(tile=64)
+        wfs.lib.image[:] = 5
+        wfs.lib.image[500:503, 700:703] = 200
+        wfs.update()
+        assert 'WFS_CutImageNoiseFloor' not in wfs.instrumentation.statistics
+        assert wfs.lib.image.sum() == 9 * 200
+        assert wfs.noise_floor.threshold.shape == (18, 24)
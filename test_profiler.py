@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pytest
+
+from profiler import CATEGORIES, Profiler, frame_label
+from wfs import WFS
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestProfiler(object):
+    """Test class for profiling the WFS update."""
+
+    def test_deterministic(self, tmp_path, wfs):
+        output = str(tmp_path / 'profile')
+        result = wfs.profile(frames=3, mode='deterministic', output=output)
+        assert result['collapsed'] == output + '.collapsed'
+        assert set(result['categories']) == set(CATEGORIES)
+        assert result['categories']['DLL'][0] > 0
+        assert result['categories']['logging'][0] > 0
+        assert sum(percent for _, percent in result['categories'].values()) == pytest.approx(100)
+        with open(result['collapsed']) as f:
+            lines = f.read().splitlines()
+        assert all(line.startswith('wfs.update') for line in lines)
+        assert any(line.startswith('wfs.update;wfs._zernike_lsf;instrumentation.instrumented') for line in lines)
+        stack, value = lines[0].rsplit(' ', 1)
+        assert int(value) > 0
+        with open(result['summary'], encoding='utf-8') as f:
+            summary = f.read()
+        assert summary.startswith('WFS profile: 3 frames, deterministic')
+
+    def test_sampling(self, tmp_path, wfs):
+        profiler = Profiler('sampling', interval=0.0005)
+        profiler.run(wfs.update, 20)
+        assert profiler.calls == 20
+        assert sum(profiler.categories.values()) == sum(profiler.stacks.values())
+        # Other stacks are e.g. finalizers run by the garbage collector between updates
+        update_samples = sum(value for stack, value in profiler.stacks.items() if stack.startswith('wfs.update'))
+        assert update_samples >= 0.9 * sum(profiler.stacks.values())
+        collapsed, summary = profiler.save(str(tmp_path / 'profile'))
+        with open(summary, encoding='utf-8') as f:
+            assert 'samples' in f.read()
+
+    def test_mode(self):
+        with pytest.raises(ValueError):
+            Profiler('tracing')
+
+    def test_frame_label(self):
+        assert frame_label(logging.Logger.info.__code__) == 'logging.info'
+        assert frame_label(WFS.update.__code__) == 'wfs.update'
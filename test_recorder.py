@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from recorder import RawImageReader, RawImageRecorder, SessionReader, SessionRecorder
+from vi import Vi
+
+
+# noinspection PyMissingOrEmptyDocstring
+class FakeWFS(object):
+    """Stand-in for a WFS session with the attributes used by the recorder."""
+    MAX_SPOTS_X = 80
+    MAX_SPOTS_Y = 80
+
+    def __init__(self):
+        self.instrument_name_wfs = Vi.string(256, b'WFS20-5C')
+        self.serial_number_wfs = Vi.string(256, b'M00000001')
+        self.serial_number_camera = Vi.string(256, b'4000000001')
+        self.mla_name = Vi.string(256, b'MLA150-5C')
+        self.lenslet_pitch_um = Vi.real64(150)
+        self.wavelength = Vi.real64(532)
+        self.cam_resolution_index = Vi.int32(0)
+        self.cam_resolution_x = Vi.int32(1440)
+        self.cam_resolution_y = Vi.int32(1080)
+        self.spots_x = Vi.int32(47)
+        self.spots_y = Vi.int32(35)
+        self.device_status = Vi.int32(0)
+        self.exposure_time_actual = Vi.real64(1)
+        self.master_gain_actual = Vi.real64(1)
+        self.roc_mm = Vi.real64(0)
+        self.array_zernike_um = Vi.array_float(67)
+        self.array_wavefront = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
+        self.array_deviations_x = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
+        self.array_deviations_y = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
+        self.array_centroid_x = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
+        self.array_centroid_y = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
+
+    def _get_spotfield_image_copy(self, array_image_buffer=None):
+        rows = self.cam_resolution_y.value
+        columns = self.cam_resolution_x.value
+        image = np.frombuffer(array_image_buffer, dtype=np.uint8).reshape(rows, columns)
+        image[:] = self.roc_mm.value % 256
+        image[0, :4] = [1, 2, 3, 4]
+        return 0, array_image_buffer, rows, columns
+
+    def update(self, frame):
+        self.roc_mm.value = 1000 + frame
+        self.array_zernike_um[5] = frame
+        np.ctypeslib.as_array(self.array_wavefront)[:] = frame
+        self.array_deviations_x[0][self.spots_x.value - 1] = frame
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestRecorder(object):
+    """Test class for the session recorder and reader."""
+
+    @pytest.fixture
+    def wfs(self):
+        return FakeWFS()
+
+    def test_record_read(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        with SessionRecorder(path, wfs, batch_size=4, chunk_frames=10) as recorder:
+            for frame in range(25):
+                wfs.update(frame)
+                assert recorder.record() == frame
+        reader = SessionReader(path)
+        assert len(reader) == 25
+        assert len(reader.chunks(0)) == 3
+        assert isinstance(reader.chunks(0)[0], np.memmap)
+        roc = reader.read(0, 'roc')
+        assert np.array_equal(roc, 1000 + np.arange(25))
+        assert reader[7]['zernike'][5] == 7
+        assert reader[-1]['wavefront'].shape == (35, 47)
+        assert reader[24]['wavefront'][34, 46] == 24
+        assert reader[12]['deviations_x'][0, 46] == 12
+        with pytest.raises(IndexError):
+            reader[25]
+
+    def test_epochs(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        with SessionRecorder(path, wfs, batch_size=8) as recorder:
+            recorder.record()
+            recorder.record()
+            wfs.spots_x.value = 20
+            wfs.spots_y.value = 20
+            recorder.record()
+        reader = SessionReader(path)
+        assert len(reader.epochs) == 2
+        assert reader.epochs[1]['first_frame'] == 2
+        assert reader.epoch_of(1) == 0
+        assert reader.epoch_of(2) == 1
+        assert reader.read(1)['wavefront'].shape == (1, 20, 20)
+        assert reader[2]['wavefront'].shape == (20, 20)
+
+    def test_unflushed_records_not_indexed(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        recorder = SessionRecorder(path, wfs, batch_size=4)
+        for frame in range(6):
+            recorder.record()
+        assert len(SessionReader(path)) == 4
+        recorder.close()
+        assert len(SessionReader(path)) == 6
+
+    def test_existing_session(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        SessionRecorder(path, wfs).close()
+        with pytest.raises(FileExistsError):
+            SessionRecorder(path, wfs)
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestRawImageRecorder(object):
+    """Test class for the raw spotfield image recorder."""
+
+    @pytest.fixture
+    def wfs(self):
+        _wfs = FakeWFS()
+        _wfs.cam_resolution_x.value = 64
+        _wfs.cam_resolution_y.value = 48
+        return _wfs
+
+    def test_capture_read(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        with RawImageRecorder(path, wfs, capacity=10) as recorder:
+            for frame in range(5):
+                wfs.update(frame)
+                assert recorder.capture() == frame
+        reader = RawImageReader(path)
+        assert len(reader) == 5
+        assert reader[3].shape == (48, 64)
+        assert reader[3][10, 10] == 1003 % 256
+        assert list(reader[4][0, :4]) == [1, 2, 3, 4]
+        assert reader.header['dropped'] == 0
+
+    def test_capacity(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        with RawImageRecorder(path, wfs, capacity=2) as recorder:
+            assert recorder.capture() == 0
+            assert recorder.capture() == 1
+            assert recorder.capture() is None
+        assert len(RawImageReader(path)) == 2
+
+    def test_drop_when_flush_behind(self, tmp_path, wfs):
+        path = str(tmp_path / 'session')
+        recorder = RawImageRecorder(path, wfs, capacity=10, max_pending=2)
+        with recorder.flush_lock:
+            results = [recorder.capture() for _ in range(5)]
+        assert results == [0, 1, None, None, None]
+        assert recorder.dropped == 3
+        recorder.close()
+        assert recorder.flushed == 2
+        assert RawImageReader(path).header['dropped'] == 3
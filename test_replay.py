@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+import pytest
+
+from recorder import RawImageRecorder, SessionRecorder
+from replay import ReplayLibrary
+from wfs import WFS
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestReplay(object):
+    """Test class for replaying recorded sessions through WFS."""
+
+    frames = 5
+
+    @pytest.fixture
+    def session(self, tmp_path, make_wfs):
+        path = str(tmp_path / 'session')
+        wfs = make_wfs()
+        rows, columns = wfs.spots_y.value, wfs.spots_x.value
+        with SessionRecorder(path, wfs) as recorder, RawImageRecorder(path, wfs, capacity=self.frames) as raw:
+            for frame in range(self.frames):
+                wfs.update()
+                wfs.roc_mm.value = 1000 + frame
+                wfs.exposure_time_actual.value = 0.5 + frame
+                wfs.array_zernike_um[5] = frame
+                np.ctypeslib.as_array(wfs.array_wavefront)[:rows, :columns] = frame
+                np.ctypeslib.as_array(wfs.array_centroid_x)[:rows, :columns] = np.arange(columns) * 30.0
+                recorder.record()
+                wfs.lib.image[0, 0] = frame
+                raw.capture()
+        return path
+
+    def test_update(self, session):
+        lib = ReplayLibrary(session)
+        wfs = WFS(lib=lib)
+        wfs.connect()
+        wfs.config()
+        assert (wfs.spots_x.value, wfs.spots_y.value) == (47, 35)
+        for frame in range(self.frames):
+            assert wfs.update() == 1000 + frame
+            assert wfs.exposure_time_actual.value == 0.5 + frame
+            assert wfs.array_zernike_um[5] == frame
+            assert wfs.array_wavefront[34][46] == frame
+            assert wfs.wavefront_mean.value == pytest.approx(frame)
+            assert wfs._get_spot_centroids()[1][10][2] == 60.0
+            assert wfs._get_spotfield_image_copy()[1][0][0] == frame
+        assert wfs._take_spotfield_image() == WFS.WFS_ERROR_AWAITING_TRIGGER
+        assert lib.finished
+        lib.stop()
+
+    def test_dropped_frames(self, tmp_path, make_wfs):
+        path = str(tmp_path / 'dropped')
+        wfs = make_wfs()
+        with SessionRecorder(path, wfs) as recorder, RawImageRecorder(path, wfs, capacity=self.frames) as raw:
+            for frame in range(self.frames):
+                wfs.update()
+                wfs.roc_mm.value = 1000 + frame
+                recorder.record()
+                wfs.lib.image[0, 0] = frame
+                # The disk falls behind at frame 2
+                raw.max_pending = 0 if frame == 2 else 32
+                raw.capture()
+        assert raw.dropped == 1
+        lib = ReplayLibrary(path)
+        wfs = WFS(lib=lib)
+        wfs.connect()
+        wfs.config()
+        images = []
+        for frame in range(self.frames):
+            assert wfs.update() == 1000 + frame
+            images.append(int(wfs._get_spotfield_image_copy()[1][0][0]))
+        # Frame 2 keeps the image of frame 1, all later images stay with their records
+        assert images == [0, 1, 1, 3, 4]
+        lib.stop()
+
+    def test_loop(self, session):
+        lib = ReplayLibrary(session, loop=True, read_ahead=2)
+        wfs = WFS(lib=lib)
+        wfs.connect()
+        wfs.config()
+        rocs = [wfs.update() for _ in range(2 * self.frames)]
+        assert rocs == [1000.0 + frame for frame in range(self.frames)] * 2
+        lib.stop()
+
+    def test_realtime(self, session):
+        lib = ReplayLibrary(session, realtime=True)
+        timestamps = lib.session.read(0, 'timestamp')
+        start = time.perf_counter()
+        while lib.next_frame():
+            pass
+        assert time.perf_counter() - start >= timestamps[-1] - timestamps[0] - 0.01
+
+    def test_no_recording(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            ReplayLibrary(str(tmp_path))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import json
+import socket
+import threading
+
+import pytest
+
+from server import WFSClient, WFSServer
+from vi import Vi
+
+
+# noinspection PyMissingOrEmptyDocstring,PyPep8Naming
+class FakeLibrary(object):
+    """Stand-in for the driver library."""
+
+    def WFS_SetExposureTime(self, exposure_time_set):
+        return 0
+
+    def WFS_TakeSpotfieldImage(self):
+        return 0
+
+    def WFS_ZernikeLsf(self):
+        return 0
+
+
+# noinspection PyMissingOrEmptyDocstring
+class FakeWFS(object):
+    """Stand-in for a WFS session that records the calls it receives."""
+
+    def __init__(self):
+        self.lib = FakeLibrary()
+        self.calls = []
+        self.exposure_time_set = Vi.real64(0)
+        self.array_zernike_um = Vi.array_float(4)
+
+    def _set_exposure_time(self, exposure_time_set=None):
+        self.calls.append('_set_exposure_time')
+        self.exposure_time_set = Vi.real64(exposure_time_set)
+        return self.lib.WFS_SetExposureTime(self.exposure_time_set), self.exposure_time_set.value
+
+    def _take_spotfield_image(self):
+        self.calls.append('_take_spotfield_image')
+        return self.lib.WFS_TakeSpotfieldImage()
+
+    def _zernike_lsf(self, zernike_orders=None):
+        self.calls.append('_zernike_lsf')
+        self.array_zernike_um[1] = 0.5
+        return self.lib.WFS_ZernikeLsf(), 1000.0, zernike_orders, self.array_zernike_um
+
+    def _fail(self):
+        self.lib.WFS_TakeSpotfieldImage()
+        raise ValueError('failed')
+
+    def _error_message(self, error_code=None):
+        return self.lib.WFS_TakeSpotfieldImage(), b'No errors'
+
+    def _allocate_buffers(self):
+        self.calls.append('_allocate_buffers')
+
+    def update(self):
+        return 1000.0
+
+    def helper(self):
+        return 'not exposed'
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestServer(object):
+    """Test class for the batched RPC server."""
+
+    @pytest.fixture
+    def server(self):
+        _server = WFSServer(FakeWFS(), ('127.0.0.1', 0))
+        thread = threading.Thread(target=_server.serve_forever, daemon=True)
+        thread.start()
+        yield _server
+        _server.shutdown()
+        _server.server_close()
+
+    @pytest.fixture
+    def client(self, server):
+        with WFSClient(*server.server_address, timeout=5) as _client:
+            yield _client
+
+    def test_find_methods(self, server):
+        assert '_set_exposure_time' in server.methods
+        assert 'update' in server.methods
+        assert 'helper' not in server.methods
+        assert '__init__' not in server.methods
+        assert '_allocate_buffers' not in server.methods
+        assert '_error_message' not in server.methods
+
+    def test_call(self, client):
+        assert client.call('_set_exposure_time', 1.5) == [0, 1.5]
+        assert client.call('update') == 1000.0
+
+    def test_batch(self, server, client):
+        batch = client.batch()
+        batch._set_exposure_time(2.0)._take_spotfield_image()
+        batch._zernike_lsf(zernike_orders=4)
+        assert len(batch) == 3
+        results = batch.send()
+        assert len(batch) == 0
+        assert results == [{'result': [0, 2.0]},
+                           {'result': 0},
+                           {'result': [0, 1000.0, 4, [0.0, 0.5, 0.0, 0.0]]}]
+        assert server.wfs.calls == ['_set_exposure_time', '_take_spotfield_image', '_zernike_lsf']
+
+    def test_batch_stop_on_error(self, server, client):
+        batch = client.batch()
+        batch._fail()._take_spotfield_image()
+        results = batch.send()
+        assert results[0] == {'error': 'ValueError: failed'}
+        assert results[1] == {'skipped': True}
+        assert server.wfs.calls == []
+        batch._fail()._take_spotfield_image()
+        results = batch.send(stop_on_error=False)
+        assert results[1] == {'result': 0}
+
+    def test_unknown_method(self, client):
+        with pytest.raises(RuntimeError):
+            client.call('helper')
+        with pytest.raises(RuntimeError):
+            client.call('__class__')
+
+    def test_internal_helper_rejected(self, server, client):
+        for method in ('_allocate_buffers', '_error_message'):
+            with pytest.raises(RuntimeError):
+                client.call(method)
+        assert server.wfs.calls == []
+
+    def test_malformed_batch(self, server):
+        assert 'error' in server.execute([{'method': 'update'}])
+        assert 'error' in server.execute({'id': 1, 'calls': {'method': 'update'}})
+        results = server.execute({'calls': ['update', 3, {'method': 'update', 'args': 1},
+                                            {'method': 'update', 'kwargs': []}, {'method': 'update'}],
+                                  'stop_on_error': False})['results']
+        assert [list(result) for result in results] == [['error']] * 4 + [['result']]
+
+    def test_malformed_request_keeps_connection(self, server):
+        with socket.create_connection(server.server_address, timeout=5) as sock:
+            rfile = sock.makefile('rb')
+            sock.sendall(b'[1, 2]\n{"calls": ["update"]}\n{"id": 3, "calls": [{"method": "update"}]}\n')
+            assert 'error' in json.loads(rfile.readline())
+            assert 'error' in json.loads(rfile.readline())['results'][0]
+            assert json.loads(rfile.readline()) == {'id': 3, 'results': [{'result': 1000.0}]}
+            rfile.close()
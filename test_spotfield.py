@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from spotfield import SpotfieldView
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestSpotfieldView(object):
+    """Test class for the checked spotfield image view."""
+
+    def test_no_image(self, make_wfs):
+        wfs = make_wfs(config=False)
+        assert wfs.spotfield() is None
+
+    def test_zero_copy(self, wfs):
+        wfs.lib.image[:] = 12
+        wfs.update()
+        view = wfs.spotfield()
+        assert isinstance(view, SpotfieldView)
+        assert view.valid
+        assert view.shape == (wfs.spotfield_rows.value, wfs.spotfield_columns.value)
+        assert np.shares_memory(view.array, wfs.lib.image)
+        assert np.asarray(view).max() == 12
+        view.array[0, 0] = 99
+        assert wfs.lib.image[0, 0] == 99
+
+    def test_invalid_after_capture(self, wfs):
+        wfs.update()
+        view = wfs.spotfield()
+        kept = view.copy()
+        assert not np.shares_memory(kept, wfs.lib.image)
+        wfs.update()
+        assert not view.valid
+        assert 'invalid' in repr(view)
+        with pytest.raises(RuntimeError):
+            view.array
+        with pytest.raises(RuntimeError):
+            view.copy()
+        assert kept.shape == view.shape
+        assert wfs.spotfield().valid
+
+    def test_invalid_after_disconnect(self, wfs):
+        wfs.update()
+        view = wfs.spotfield()
+        wfs.disconnect()
+        with pytest.raises(RuntimeError):
+            np.asarray(view)
+
+    def test_invalid_after_configure_cam(self, wfs):
+        wfs.update()
+        view = wfs.spotfield()
+        wfs._configure_cam(4)
+        assert not view.valid
+        with pytest.raises(RuntimeError):
+            view.array
+
+    def test_invalid_after_average_image(self, wfs):
+        wfs.update()
+        view = wfs.spotfield()
+        wfs._average_image(2)
+        with pytest.raises(RuntimeError):
+            view.array
+        view = wfs.spotfield()
+        wfs._average_image_rolling(2, 1)
+        with pytest.raises(RuntimeError):
+            view.array
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+from backend import StubLibrary
+from wfs import WFS
+
+
+def run_python(code):
+    """Run code in a new interpreter and return its stdout."""
+    return subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestStartup(object):
+    """Test class for the side-effect-free import of the wrapper."""
+
+    def test_import(self):
+        output = run_python('import logging, sys, wfs\n'
+                            'print(len(logging.getLogger().handlers), "yaml" in sys.modules, '
+                            '"profiler" in sys.modules)')
+        assert output == '0 False False'
+
+    def test_setup_logging_once(self):
+        output = run_python('import wfs\n'
+                            'print(wfs.setup_logging(path="missing.yaml"), wfs.setup_logging())')
+        assert output == 'True False'
+
+    def test_lazy_library(self):
+        wfs = WFS()
+        assert wfs.instrumentation.lib is None
+        assert wfs.WFS_SUCCESS == 0
+        assert wfs.image_size() == (2048, 2048)
+
+    def test_load_on_driver_call(self, monkeypatch):
+        wfs = WFS()
+        monkeypatch.setattr(wfs, 'find_wfs_library', StubLibrary)
+        assert wfs._get_instrument_list_len() == (0, 0, 1)
+        assert isinstance(wfs.instrumentation.lib, StubLibrary)
+        assert wfs.driver_statistics()['functions']['WFS_GetInstrumentListLen']['count'] == 1
+
+    def test_driver_call_before_connect(self):
+        wfs = WFS(lib=StubLibrary())
+        assert wfs._get_instrument_list_len() == (0, 0, 1)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from ui_compiler import compile_ui, generated_binding
+
+
+def fake_compiler(binding):
+    """compileUi stand-in writing the import line of a binding."""
+    def compile_function(ui_file, f, from_imports=False):
+        f.write(f'# Form implementation generated from reading ui file {os.path.basename(ui_file)}\n')
+        f.write(f'from {binding} import QtCore, QtGui, QtWidgets\n')
+    return compile_function
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestCompileUi(object):
+    """Test class for compiling the .ui files."""
+
+    @pytest.fixture
+    def gui(self, tmp_path):
+        (tmp_path / 'design.ui').write_text('<ui/>')
+        (tmp_path / 'debug.ui').write_text('<ui/>')
+        (tmp_path / '__init__.py').write_text('')
+        return tmp_path
+
+    def test_missing(self, gui):
+        assert compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5')) == ['debug.ui', 'design.ui']
+        assert generated_binding(str(gui / 'design.py')) == 'PyQt5'
+
+    def test_fresh(self, gui):
+        compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5'))
+        assert compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5')) == []
+
+    def test_stale(self, gui):
+        compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5'))
+        py_time = os.path.getmtime(gui / 'design.py')
+        os.utime(gui / 'design.ui', (py_time + 10, py_time + 10))
+        assert compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5')) == ['design.ui']
+
+    def test_other_binding(self, gui):
+        compile_ui(str(gui), 'PySide2', fake_compiler('PySide2'))
+        assert compile_ui(str(gui), 'PyQt5', fake_compiler('PyQt5')) == ['debug.ui', 'design.ui']
+        assert generated_binding(str(gui / 'debug.py')) == 'PyQt5'
+
+    def test_committed_modules(self):
+        gui_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gui')
+        assert generated_binding(os.path.join(gui_path, 'design.py')) == 'PySide2'
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import wavefront_QA
+from wavefront_QA import LENSLETS_X, LENSLETS_Y, read_export, run_batch, write_text
+
+
+def write_export(path, roc=1234.5, pupil=(4.0, 0.1, -0.2)):
+    """Write a CSV export with the layout read by read_export()."""
+    lines = [f'Header {i}\n' for i in range(136)]
+    lines[32] = f'Pupil Diameter, {pupil[0]}\n'
+    lines[34] = f'Pupil Centroid X, {pupil[1]}\n'
+    lines[35] = f'Pupil Centroid Y, {pupil[2]}\n'
+    for mode in range(15):
+        lines[44 + mode] = f'{mode + 1}, 0, 0, {mode / 100 - 0.05:.3f}\n'
+    lines[86] = f'RoC, {roc}\n'
+    for row in range(LENSLETS_Y):
+        values = ', '.join(f'{row + column / 100:.2f}' for column in range(LENSLETS_X))
+        lines[101 + row] = f'{row}, {values}\n'
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestWavefrontQA(object):
+    """Test class for the wavefront QA exports."""
+
+    @pytest.fixture
+    def export(self, tmp_path):
+        path = tmp_path / 'lens 1.csv'
+        write_export(path)
+        return path
+
+    def test_read_export(self, export):
+        measurement = read_export(str(export))
+        assert measurement.name == 'lens 1'
+        assert (measurement.pupil, measurement.pupil_x, measurement.pupil_y) == (4.0, 0.1, -0.2)
+        assert measurement.roc == 1234.5
+        assert measurement.zernike[0] == -0.05
+        assert len(measurement.zernike) == 15
+        assert measurement.wavefront.shape == (LENSLETS_Y, LENSLETS_X)
+        assert measurement.wavefront[2, 3] == 2.03
+        assert measurement.pupil_in_view()
+        assert np.isfinite(measurement.pupil_height())
+
+    def test_write_text(self, export, tmp_path):
+        measurement = read_export(str(export))
+        imagej, zernike = write_text(measurement, str(tmp_path))
+        with open(imagej) as f:
+            rows = f.read().splitlines()
+        assert len(rows) == LENSLETS_Y
+        assert rows[1].split(', ')[:2] == ['1.00', '1.01']
+        with open(zernike) as f:
+            assert f.readline() == '1, -0.050\n'
+
+    def test_pupil_out_of_view(self, tmp_path):
+        path = tmp_path / 'edge.csv'
+        write_export(path, pupil=(4.0, 3.0, 0.0))
+        assert not read_export(str(path)).pupil_in_view()
+
+    def test_empty_directory(self, tmp_path):
+        assert run_batch(str(tmp_path)) == ({}, {})
+
+    def test_import_without_matplotlib(self):
+        assert wavefront_QA.plt is None
+
+
+# noinspection PyMissingOrEmptyDocstring
+class TestBatch(object):
+    """Test class for the headless batch with reused figures."""
+
+    @pytest.fixture
+    def exports(self, tmp_path, monkeypatch):
+        pytest.importorskip('matplotlib')
+        # Restore the module without matplotlib after the test
+        for name in ('plt', 'Artist', 'AutoMinorLocator', 'art3d', '_templates'):
+            monkeypatch.setattr(wavefront_QA, name, getattr(wavefront_QA, name))
+        write_export(tmp_path / 'lens 1.csv', roc=1000.0)
+        write_export(tmp_path / 'lens 2.csv', roc=2000.0, pupil=(3.0, -0.2, 0.1))
+        yield tmp_path
+        if wavefront_QA.plt is not None:
+            wavefront_QA.plt.close('all')
+
+    @staticmethod
+    def images(directory):
+        return sorted(path.name for path in directory.glob('*.png'))
+
+    def test_reuse_figures(self, exports):
+        results, failed = run_batch(str(exports), workers=1)
+        assert failed == {}
+        assert results == {str(exports / 'lens 1.csv'): 1000.0, str(exports / 'lens 2.csv'): 2000.0}
+        prefixes = ('Wavefront 3d', 'Wavefront flat', 'Zernike')
+        assert self.images(exports) == [f'{prefix} lens {i}.png' for prefix in prefixes for i in (1, 2)]
+        assert len(wavefront_QA.plt.get_fignums()) == 3
+        templates = wavefront_QA._templates
+        # The artists of the first export were replaced, not kept
+        assert len(templates.surface_axes.collections) == 1
+        assert len(templates.surface_axes.patches) == 1
+        assert len(templates.flat_axes.collections) == 2
+        assert len(templates.flat_axes.patches) == 1
+        assert templates.zernike_axes.get_title() == 'Zernike lens 2'
+        assert [bar.get_height() for bar in templates.bars] == pytest.approx(read_export(
+            str(exports / 'lens 2.csv')).zernike)
+
+    def test_process_pool(self, exports):
+        results, failed = run_batch(str(exports), workers=2)
+        assert failed == {}
+        assert sorted(results.values()) == [1000.0, 2000.0]
+        assert len(self.images(exports)) == 6
+        assert wavefront_QA.plt is None
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Compile the Qt Designer .ui files of the GUI when needed.
+
+A compiled module is reused while it is newer than its .ui file and was
+generated for the Qt binding in use. The binding is read from the
+import line the compilers write, e.g. "from PyQt5 import QtCore, ..."
+by pyuic5 and "from PySide2 import ..." by pyside2-uic. File times
+alone are not enough, e.g. on a fresh checkout the committed modules
+may be newer than the .ui files but generated for another binding.
+
+    compile_ui('gui', 'PyQt5', uic.compileUi)
+"""
+import logging
+import os
+import re
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+log_ui = logging.getLogger('UI')
+
+_BINDING_IMPORT = re.compile(r'^from (\w+) import ')
+
+
+def generated_binding(py_file):
+    """Get the Qt binding a compiled .ui module imports.
+
+    Returns:
+        str: Module name of the binding, e.g. 'PyQt5', or None.
+    """
+    with open(py_file, encoding='utf-8') as f:
+        for line in f:
+            match = _BINDING_IMPORT.match(line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def is_fresh(ui_file, py_file, binding):
+    """Check if a compiled module is up to date for a binding."""
+    return (os.path.exists(py_file) and os.path.getmtime(py_file) >= os.path.getmtime(ui_file) and
+            generated_binding(py_file) == binding)
+
+
+def compile_ui(path, binding, compile_function):
+    """Compile the .ui files of a directory whose .py module is missing, older or of another binding.
+
+    Args:
+        path (str): Directory of the .ui files.
+        binding (str): Module name of the Qt binding in use, e.g. 'PyQt5'.
+        compile_function: compileUi(ui_file, py_file_object, from_imports=True)
+            of the binding's uic module.
+
+    Returns:
+        list: Names of the compiled .ui files.
+    """
+    compiled = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.ui'):
+            continue
+        ui_file = os.path.join(path, name)
+        py_file = os.path.splitext(ui_file)[0] + '.py'
+        if is_fresh(ui_file, py_file, binding):
+            continue
+        with open(py_file, 'w', encoding='utf-8') as f:
+            compile_function(ui_file, f, from_imports=True)
+        compiled.append(name)
+    if compiled:
+        log_ui.info(f'Compiled {", ".join(compiled)} for {binding}')
+    return compiled
@@ -1,42 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Quality assurance plots of wavefront measurements exported as CSV.
+
+For every *.csv export of a directory the script writes
+    imagej <name>.txt           wavefront for ImageJ
+    Z <name>.txt                Zernike coefficients
+    Zernike <name>.png          Zernike bar graph
+    Wavefront 3d <name>.png     3D wavefront with the pupil
+    Wavefront flat <name>.png   contour plot with the pupil
+
+Without arguments a directory dialog opens and the plots of every
+measurement are shown. With a directory the exports are processed
+headless with the Agg backend in a process pool. Each worker creates
+the figures once and reuses them for all its measurements:
+
+    python wavefront_QA.py exports --workers 8
+"""
+import argparse
+import concurrent.futures
 import glob
 import logging
 import os
 import sys
-from tkinter.filedialog import askdirectory
 
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
-from mpl_toolkits.mplot3d import art3d
-
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
-
-wave_folder = askdirectory()
-try:
-    os.chdir(wave_folder)
-except OSError as e:
-    print(e)
-    sys.exit()
-
-lenslets_x = 47
-lenslets_y = 35
-lenslet_pitch = 0.15
-x_offset = np.round((lenslets_x - 1) * lenslet_pitch / 2, 2)
-y_offset = np.round((lenslets_y - 1) * lenslet_pitch / 2, 2)
-X_dim = np.linspace(-x_offset, x_offset, lenslets_x)
-Y_dim = np.linspace(-y_offset, y_offset, lenslets_y)
-X, Y = np.meshgrid(X_dim, Y_dim)
-roc = []
-pupil = 0
-pupil_x = 0
-pupil_y = 0
-zernike_x = np.arange(15)
-zernike_keys = ['Piston',
+
+__version__ = '0.1.0'
+__author__ = 'David Amrhein'
+__email__ = 'davea50@gmail.com'
+
+log_qa = logging.getLogger('WFS.wavefront_QA')
+
+# matplotlib modules, imported by load_matplotlib() with the backend of the mode
+plt = None
+Artist = None
+AutoMinorLocator = None
+art3d = None
+
+LENSLETS_X = 47
+LENSLETS_Y = 35
+LENSLET_PITCH = 0.15
+X_OFFSET = np.round((LENSLETS_X - 1) * LENSLET_PITCH / 2, 2)
+Y_OFFSET = np.round((LENSLETS_Y - 1) * LENSLET_PITCH / 2, 2)
+X_DIM = np.linspace(-X_OFFSET, X_OFFSET, LENSLETS_X)
+Y_DIM = np.linspace(-Y_OFFSET, Y_OFFSET, LENSLETS_Y)
+X, Y = np.meshgrid(X_DIM, Y_DIM)
+ZERNIKE_X = np.arange(15)
+ZERNIKE_KEYS = ['Piston',
                 'Tip y',
                 'Tilt x',
                 'Astigm.\n+/-45°',
@@ -52,112 +61,359 @@ zernike_keys = ['Piston',
                 'Astigm. x',
                 'Tetrafoil x']
 
-for filename in glob.glob("*.csv"):
-    with open(filename, 'r') as csv:
-        logger.info(f'Open: {filename}')
-        with open("imagej " + filename[:-3] + 'txt', 'w') as imj_outfile:
-            with open("Z " + filename[:-3] + 'txt', 'w') as zernike_outfile:
-                z = []
-                zernike = []
-                for i, line in enumerate(csv):
-                    if i == 32:
-                        line = [x.strip() for x in line.split(',')]
-                        pupil = float(line[1])
-                    if i == 34:
-                        line = [x.strip() for x in line.split(',')]
-                        pupil_x = float(line[1])
-                    if i == 35:
-                        line = [x.strip() for x in line.split(',')]
-                        pupil_y = float(line[1])
-                    if 44 <= i <= 58:
-                        line = [x.strip() for x in line.split(',')]
-                        line = [line[0], line[3]]
-                        zernike.append(float(line[1]))
-                        zernike_outfile.write(', '.join(line) + '\n')
-                    if i == 86:
-                        line = [x.strip() for x in line.split(',')]
-                        current_roc = float(line[1])
-                        roc.append(current_roc)
-                    if 101 <= i <= 135:
-                        line = [x.strip(',') for x in line.split()]
-                        z.append([float(x) for x in line[1:]])
-                        imj_outfile.write(', '.join(line[1:]) + '\n')
-                logger.info(f'Radius of Curvature: {current_roc:.1f}mm')
-                logger.info(f'Zernike Coefficient: {zernike}')
-                for i in range(len(zernike)):
-                    z_name = zernike_keys[i].replace('\n', '')
-                    logger.debug(f'{z_name}: {zernike[i]}')
-
-                # Zernike Plot
-                fig = plt.figure(1)
-                ax = fig.add_subplot(111)
-                ax.yaxis.set_minor_locator(AutoMinorLocator(4))
-                plt.bar(zernike_x + 0.5, zernike, align='edge')
-                plt.xticks(range(1, 16), zernike_keys, rotation=40, size=8)
-                plt.xlim([0, 16])
-                for i, j in zip(zernike_x, zernike):
-                    if j >= 0:
-                        plt.annotate(str(j), xy=(i, j), xytext=(13, 2), textcoords='offset points', size=8)
-                    elif j < 0:
-                        plt.annotate(str(j), xy=(i, j), xytext=(13, -8), textcoords='offset points', size=8)
-                plt.xlabel('Zernike Mode')
-                plt.ylabel('Coefficient / micron')
-                plt.title(f'Zernike {filename[:-4]}')
-                plt.savefig(f'Zernike {filename[:-4]}.png')
-                plt.show()
-                plt.close()
-
-                # 3D Surface Plot
-                Z = np.array(z)
-                fig = plt.figure(2)
-                ax = fig.gca(projection='3d')
-                ax.plot_surface(X, Y, Z, rstride=1, cstride=1, linewidth=0.5, alpha=0.9, cmap='jet', antialiased=True)
-                ax.view_init(30, 60)
-
-                # Only plot the aperture if it is entirely within the field of view
-                if pupil_x + (pupil / 2) < x_offset and \
-                        pupil_x - (pupil / 2) > -x_offset and \
-                        pupil_y + (pupil / 2) < y_offset and \
-                        pupil_y - (pupil / 2) > -y_offset:
-
-                    pupil_contour = plt.Circle((pupil_x, pupil_y), pupil/2,
-                                               fill=False, alpha=0.5, edgecolor='Black', linestyle='dashed')
-                    pupil_y_0_offset = np.searchsorted(Y_dim, 0)
-                    pupil_x_0_offset = np.searchsorted(X_dim, 0 - lenslet_pitch)
-                    pupil_y_pos_offset = np.searchsorted(Y_dim, pupil_x + (pupil / 2) - (lenslet_pitch / 2))
-                    pupil_y_neg_offset = np.searchsorted(Y_dim, pupil_x - (pupil / 2) - (lenslet_pitch / 2))
-                    pupil_x_pos_offset = np.searchsorted(X_dim, pupil_x + (pupil / 2) - (lenslet_pitch / 2))
-                    pupil_x_neg_offset = np.searchsorted(X_dim, pupil_x - (pupil / 2) - (lenslet_pitch / 2))
-                    pupil_z = 0
-                    pupil_z += Z[pupil_y_0_offset][pupil_x_pos_offset]
-                    pupil_z += Z[pupil_y_0_offset][pupil_x_neg_offset]
-                    pupil_z += Z[pupil_y_pos_offset][pupil_x_0_offset]
-                    pupil_z += Z[pupil_y_neg_offset][pupil_x_0_offset]
-                    pupil_z /= 4
-                    ax.add_patch(pupil_contour)
-                    art3d.pathpatch_2d_to_3d(pupil_contour, z=pupil_z, zdir="z")
-                plt.xlabel('mm')
-                plt.ylabel('mm')
-                plt.title(f'Radius of Curvature: {current_roc:.1f} mm')
-                plt.savefig(f'Wavefront 3d {filename[:-4]}.png')
-                plt.show()
-                plt.close()
-
-                # Flat Contour Plot
-                pupil_plt = plt.Circle((pupil_x, pupil_y), pupil/2,
+# Lines of the CSV export
+LINE_PUPIL = 32
+LINE_PUPIL_X = 34
+LINE_PUPIL_Y = 35
+LINES_ZERNIKE = (44, 58)
+LINE_ROC = 86
+LINES_WAVEFRONT = (101, 135)
+
+
+def load_matplotlib(headless):
+    """Import matplotlib once, with the Agg backend if headless."""
+    global plt, Artist, AutoMinorLocator, art3d
+    if plt is not None:
+        return
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
+    import matplotlib.artist
+    import matplotlib.pyplot
+    import matplotlib.ticker
+    from mpl_toolkits.mplot3d import art3d as _art3d
+    plt = matplotlib.pyplot
+    Artist = matplotlib.artist.Artist
+    AutoMinorLocator = matplotlib.ticker.AutoMinorLocator
+    art3d = _art3d
+
+
+class Measurement(object):
+    """Values of one exported wavefront measurement.
+
+    Args:
+        name (str): File name of the export without extension.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pupil = 0.0
+        self.pupil_x = 0.0
+        self.pupil_y = 0.0
+        self.roc = None
+        # Zernike coefficients in µm and the [mode, coefficient] text fields
+        self.zernike = []
+        self.zernike_fields = []
+        # [LENSLETS_Y][LENSLETS_X] wavefront text fields and values in µm
+        self.wavefront_fields = []
+        self.wavefront = None
+
+    def pupil_in_view(self):
+        """Check if the pupil is entirely within the field of view."""
+        radius = self.pupil / 2
+        return (self.pupil_x + radius < X_OFFSET and self.pupil_x - radius > -X_OFFSET and
+                self.pupil_y + radius < Y_OFFSET and self.pupil_y - radius > -Y_OFFSET)
+
+    def pupil_height(self):
+        """Get the mean wavefront at four points of the pupil edge."""
+        radius = self.pupil / 2
+        y_0 = np.searchsorted(Y_DIM, 0)
+        x_0 = np.searchsorted(X_DIM, 0 - LENSLET_PITCH)
+        y_pos = np.searchsorted(Y_DIM, self.pupil_x + radius - (LENSLET_PITCH / 2))
+        y_neg = np.searchsorted(Y_DIM, self.pupil_x - radius - (LENSLET_PITCH / 2))
+        x_pos = np.searchsorted(X_DIM, self.pupil_x + radius - (LENSLET_PITCH / 2))
+        x_neg = np.searchsorted(X_DIM, self.pupil_x - radius - (LENSLET_PITCH / 2))
+        z = self.wavefront
+        return (z[y_0][x_pos] + z[y_0][x_neg] + z[y_pos][x_0] + z[y_neg][x_0]) / 4
+
+
+def read_export(path):
+    """Read a wavefront measurement exported as CSV.
+
+    Args:
+        path (str): Path of the CSV export.
+
+    Returns:
+        Measurement: Values of the measurement.
+    """
+    measurement = Measurement(os.path.splitext(os.path.basename(path))[0])
+    with open(path, 'r') as csv:
+        for i, line in enumerate(csv):
+            if i in (LINE_PUPIL, LINE_PUPIL_X, LINE_PUPIL_Y, LINE_ROC):
+                value = float(line.split(',')[1].strip())
+                if i == LINE_PUPIL:
+                    measurement.pupil = value
+                elif i == LINE_PUPIL_X:
+                    measurement.pupil_x = value
+                elif i == LINE_PUPIL_Y:
+                    measurement.pupil_y = value
+                else:
+                    measurement.roc = value
+            elif LINES_ZERNIKE[0] <= i <= LINES_ZERNIKE[1]:
+                fields = [x.strip() for x in line.split(',')]
+                measurement.zernike_fields.append([fields[0], fields[3]])
+                measurement.zernike.append(float(fields[3]))
+            elif LINES_WAVEFRONT[0] <= i <= LINES_WAVEFRONT[1]:
+                measurement.wavefront_fields.append([x.strip(',') for x in line.split()][1:])
+    measurement.wavefront = np.array(measurement.wavefront_fields, dtype=float)
+    return measurement
+
+
+def write_text(measurement, directory):
+    """Write the ImageJ wavefront and the Zernike coefficients.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    paths = [os.path.join(directory, f'imagej {measurement.name}.txt'),
+             os.path.join(directory, f'Z {measurement.name}.txt')]
+    with open(paths[0], 'w') as imj_outfile:
+        imj_outfile.writelines(', '.join(fields) + '\n' for fields in measurement.wavefront_fields)
+    with open(paths[1], 'w') as zernike_outfile:
+        zernike_outfile.writelines(', '.join(fields) + '\n' for fields in measurement.zernike_fields)
+    return paths
+
+
+def remove_artist(artist):
+    """Remove an artist from its axes.
+
+    Before matplotlib 3.8 a ContourSet is no Artist and its remove()
+    only removes the labels, so its collections are removed instead.
+    """
+    if isinstance(artist, Artist):
+        artist.remove()
+    else:
+        for collection in artist.collections:
+            collection.remove()
+
+
+class FigureTemplates(object):
+    """Zernike, 3D and contour figures reused for every measurement.
+
+    Axes, ticks, labels and the Zernike bars are created once. plot()
+    only updates the bars and replaces the surface, contours and pupil
+    of the previous measurement. Requires load_matplotlib().
+    """
+
+    def __init__(self):
+        self.zernike_figure = plt.figure()
+        ax = self.zernike_figure.add_subplot(111)
+        ax.yaxis.set_minor_locator(AutoMinorLocator(4))
+        self.bars = ax.bar(ZERNIKE_X + 0.5, np.zeros(len(ZERNIKE_X)), align='edge')
+        ax.set_xticks(range(1, 16))
+        ax.set_xticklabels(ZERNIKE_KEYS, rotation=40, size=8)
+        ax.set_xlim([0, 16])
+        ax.set_xlabel('Zernike Mode')
+        ax.set_ylabel('Coefficient / micron')
+        self.annotations = [ax.annotate('', xy=(i, 0), xytext=(13, 2), textcoords='offset points', size=8)
+                            for i in ZERNIKE_X]
+        self.zernike_axes = ax
+
+        self.surface_figure = plt.figure()
+        ax = self.surface_figure.add_subplot(111, projection='3d')
+        ax.view_init(30, 60)
+        ax.set_xlabel('mm')
+        ax.set_ylabel('mm')
+        self.surface_axes = ax
+        self.surface_artists = []
+
+        self.flat_figure = plt.figure()
+        ax = self.flat_figure.add_subplot(111)
+        ax.xaxis.set_minor_locator(AutoMinorLocator(10))
+        ax.yaxis.set_minor_locator(AutoMinorLocator(10))
+        ax.set_xlabel('mm')
+        ax.set_ylabel('mm')
+        self.flat_axes = ax
+        self.flat_artists = []
+
+    def plot(self, measurement):
+        """Plot a measurement into the three figures."""
+        ax = self.zernike_axes
+        for i, bar, annotation, value in zip(ZERNIKE_X, self.bars, self.annotations, measurement.zernike):
+            bar.set_height(value)
+            annotation.set_text(str(value))
+            annotation.xy = (i, value)
+            annotation.set_position((13, 2) if value >= 0 else (13, -8))
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        ax.set_title(f'Zernike {measurement.name}')
+
+        title = f'Radius of Curvature: {measurement.roc:.1f} mm'
+        ax = self.surface_axes
+        for artist in self.surface_artists:
+            remove_artist(artist)
+        self.surface_artists = [ax.plot_surface(X, Y, measurement.wavefront, rstride=1, cstride=1, linewidth=0.5,
+                                                alpha=0.9, cmap='jet', antialiased=True)]
+        if measurement.pupil_in_view():
+            pupil_contour = plt.Circle((measurement.pupil_x, measurement.pupil_y), measurement.pupil / 2,
                                        fill=False, alpha=0.5, edgecolor='Black', linestyle='dashed')
-                fig = plt.figure(3)
-                ax = fig.add_subplot(111)
-                ax.add_artist(pupil_plt)
-                ax.xaxis.set_minor_locator(AutoMinorLocator(10))
-                ax.yaxis.set_minor_locator(AutoMinorLocator(10))
-                plt.contour(X, Y, Z, colors='black', linewidths=1)
-                plt.contourf(X, Y, Z, cmap='jet')
-                plt.xlabel('mm')
-                plt.ylabel('mm')
-                plt.title(f'Radius of Curvature: {current_roc:.1f} mm')
-                plt.savefig(f'Wavefront flat {filename[:-4]}.png')
-                plt.show()
-                plt.close()
-
-sys.exit(0)
+            ax.add_patch(pupil_contour)
+            art3d.pathpatch_2d_to_3d(pupil_contour, z=measurement.pupil_height(), zdir='z')
+            self.surface_artists.append(pupil_contour)
+        ax.set_title(title)
+
+        ax = self.flat_axes
+        for artist in self.flat_artists:
+            remove_artist(artist)
+        pupil_plt = plt.Circle((measurement.pupil_x, measurement.pupil_y), measurement.pupil / 2,
+                               fill=False, alpha=0.5, edgecolor='Black', linestyle='dashed')
+        ax.add_artist(pupil_plt)
+        self.flat_artists = [pupil_plt,
+                             ax.contour(X, Y, measurement.wavefront, colors='black', linewidths=1),
+                             ax.contourf(X, Y, measurement.wavefront, cmap='jet')]
+        ax.set_title(title)
+
+    def save(self, measurement, directory):
+        """Plot a measurement and save the figures as PNG.
+
+        Returns:
+            list: Paths of the written images.
+        """
+        self.plot(measurement)
+        paths = []
+        for figure, prefix in ((self.zernike_figure, 'Zernike'),
+                               (self.surface_figure, 'Wavefront 3d'),
+                               (self.flat_figure, 'Wavefront flat')):
+            paths.append(os.path.join(directory, f'{prefix} {measurement.name}.png'))
+            figure.savefig(paths[-1])
+        return paths
+
+
+def find_exports(directory):
+    """Get the sorted paths of the CSV exports of a directory."""
+    return sorted(glob.glob(os.path.join(directory, '*.csv')))
+
+
+def process_export(path, templates):
+    """Read an export and write its text files and plots.
+
+    Returns:
+        Measurement: Values of the measurement.
+    """
+    log_qa.info(f'Open: {path}')
+    measurement = read_export(path)
+    log_qa.info(f'Radius of Curvature: {measurement.roc:.1f}mm')
+    log_qa.info(f'Zernike Coefficient: {measurement.zernike}')
+    for key, value in zip(ZERNIKE_KEYS, measurement.zernike):
+        z_name = key.replace('\n', '')
+        log_qa.debug(f'{z_name}: {value}')
+    directory = os.path.dirname(path)
+    write_text(measurement, directory)
+    templates.save(measurement, directory)
+    return measurement
+
+
+# Figures of a batch worker process
+_templates = None
+
+
+def _init_worker(log_level=None):
+    """Create the figures of a headless worker.
+
+    Args:
+        log_level (int): Level of the logging set up in a worker
+            process, whose messages are lost under spawn otherwise.
+            None keeps the logging of this process.
+    """
+    global _templates
+    if log_level is not None:
+        logging.basicConfig(level=log_level)
+    load_matplotlib(headless=True)
+    _templates = FigureTemplates()
+
+
+def _process_in_worker(path):
+    """Process an export with the figures of the worker.
+
+    Returns:
+        tuple: File name and radius of curvature in mm.
+    """
+    measurement = process_export(path, _templates)
+    return measurement.name, measurement.roc
+
+
+def run_batch(directory, workers=None):
+    """Process the exports of a directory headless in parallel.
+
+    Args:
+        directory (str): Directory of the CSV exports, also receives
+            the outputs.
+        workers (int): Number of worker processes, default the number
+            of CPUs. 1 processes the exports in this process.
+
+    Returns:
+        tuple: {path: radius of curvature in mm} of the processed
+            exports and {path: exception} of the failed ones.
+    """
+    paths = find_exports(directory)
+    results = {}
+    failed = {}
+    if not paths:
+        log_qa.warning(f'No *.csv exports in {directory}')
+        return results, failed
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    log_qa.info(f'Processing {len(paths)} exports with {workers} workers')
+    if workers == 1:
+        _init_worker()
+        for path in paths:
+            try:
+                results[path] = _process_in_worker(path)[1]
+            except Exception as e:
+                failed[path] = e
+                log_qa.exception(f'Failed: {path}')
+        return results, failed
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(logging.getLogger().getEffectiveLevel(),)) as executor:
+        futures = {executor.submit(_process_in_worker, path): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()[1]
+            except Exception as e:
+                failed[path] = e
+                log_qa.error(f'Failed: {path}: {e!r}')
+    return results, failed
+
+
+def show_directory(directory):
+    """Process the exports of a directory and show the plots of each."""
+    load_matplotlib(headless=False)
+    for path in find_exports(directory):
+        process_export(path, FigureTemplates())
+        plt.show()
+        plt.close('all')
+
+
+def main(argv=None):
+    """Run the QA plots from the command line.
+
+    Returns:
+        int: 1 if an export failed or the directory is invalid, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description='Plot wavefront measurements exported as CSV')
+    parser.add_argument('directory', nargs='?',
+                        help='process the *.csv exports of the directory headless; without a directory '
+                             'a dialog opens and the plots are shown')
+    parser.add_argument('--workers', type=int, help='worker processes, default: number of CPUs')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.directory is None:
+        from tkinter.filedialog import askdirectory
+        directory = askdirectory()
+        if not os.path.isdir(directory):
+            log_qa.error(f'No directory selected: {directory!r}')
+            return 1
+        show_directory(directory)
+        return 0
+    if not os.path.isdir(args.directory):
+        log_qa.error(f'Not a directory: {args.directory}')
+        return 1
+    results, failed = run_batch(args.directory, args.workers)
+    log_qa.info(f'{len(results)} exports processed, {len(failed)} failed')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
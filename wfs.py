@@ -1,43 +1,74 @@
 # -*- coding: utf-8 -*-
-"""Wrapper for interfacing with the Thorlabs Wavefront Sensor (WFS)."""
+"""Wrapper for interfacing with the Thorlabs Wavefront Sensor (WFS).
+
+Importing the module has no side effects: the driver library is loaded
+by the first connect() and logging is only configured by
+setup_logging(), which applications call once at startup:
+
+    setup_logging()
+    wfs = WFS()
+    wfs.connect()
+"""
 import ctypes
-from ctypes.util import find_library
-import logging.config
+import logging
 import os
+import time
 
-import yaml
+import numpy as np
 
+from instrumentation import InstrumentedLibrary
+from latency import FrameStamps, LatencyMonitor
+from spotfield import SpotfieldView
 from vi import Vi
 
 __version__ = '0.5.0'
 __author__ = 'David Amrhein'
 __email__ = 'davea50@gmail.com'
 
+_logging_configured = False
+
 
 def setup_logging(path='logging.yaml', level=logging.INFO, env_key='LOG_CFG'):
-    """Setup logging configuration.
+    """Setup logging configuration once per process.
 
-    Uses logging.yaml for the default configuration.
+    Uses logging.yaml for the default configuration. Later calls do
+    nothing, so every entry point can call it.
 
     Args:
-        path:
-        level:
-        env_key:
+        path (str): Path of the YAML logging configuration.
+        level (int): Level of the basic configuration if there is no
+            configuration file.
+        env_key (str): Environment variable overriding the path.
+
+    Returns:
+        bool: True if logging was configured by this call.
     """
-    path = path
+    global _logging_configured
+    if _logging_configured:
+        return False
     value = os.getenv(env_key, None)
     if value:
         path = value
     if os.path.exists(path):
+        from logging.config import dictConfig
+        import yaml
         with open(path, 'rt') as f:
-            config = yaml.load(f.read())
-        logging.config.dictConfig(config)
+            config = yaml.safe_load(f.read())
+        dictConfig(config)
     else:
         logging.basicConfig(level=level)
+    _logging_configured = True
+    return True
 
 
 class WFS(object):
-    """Thorlabs Shack-Hartmann Wavefront Sensor Interface."""
+    """Thorlabs Shack-Hartmann Wavefront Sensor Interface.
+
+    Args:
+        lib (optional): Driver library to use instead of loading the
+            WFS .dll, e.g. a backend.StubLibrary or replay.ReplayLibrary.
+            The .dll is loaded by the first connect().
+    """
     # Constants declared in WFS.h header file
     # Buffers
     WFS_BUFFER_SIZE = 256  # General buffer size
@@ -313,10 +344,82 @@ class WFS(object):
     NOT_CENTERED = 0
     CENTERED = 1
 
-    def __init__(self):
-        setup_logging()
+    # NAME = {Index: (x_res, y_res, sub_factor)}
+    cam_res_WFS150 = {0: (1280, 1024, 1),
+                      1: (1024, 1024, 1),
+                      2: (768, 768, 1),
+                      3: (512, 512, 1),
+                      4: (320, 320, 1)}
+    cam_res_WFS10 = {0: (640, 480, 1),
+                     1: (480, 480, 1),
+                     2: (360, 360, 1),
+                     3: (260, 260, 1),
+                     4: (180, 180, 1)}
+    cam_res_WFS20 = {0: (1440, 1080, 1),
+                     1: (1080, 1080, 1),
+                     2: (768, 768, 1),
+                     3: (512, 512, 1),
+                     4: (360, 360, 1),
+                     5: (720, 540, 2),
+                     6: (540, 540, 2),
+                     7: (384, 384, 2),
+                     8: (256, 256, 2),
+                     9: (180, 180, 2)}
+    cam_res_WFS30 = {0: (1936, 1216, 1),
+                     1: (1216, 1216, 1),
+                     2: (1024, 1024, 1),
+                     3: (768, 768, 1),
+                     4: (512, 512, 1),
+                     5: (360, 360, 1),
+                     6: (968, 968, 2),
+                     7: (608, 608, 2),
+                     8: (512, 512, 2),
+                     9: (384, 384, 2),
+                     10: (256, 256, 2),
+                     11: (180, 180, 2)}
+    cam_res_WFS40 = {0: (2048, 2048, 1),
+                     1: (1536, 1536, 1),
+                     2: (1024, 1024, 1),
+                     3: (768, 768, 1),
+                     4: (512, 512, 1),
+                     5: (360, 360, 1),
+                     6: (1024, 1024, 2),
+                     7: (768, 768, 2),
+                     8: (512, 512, 2),
+                     9: (384, 384, 2),
+                     10: (256, 256, 2),
+                     11: (180, 180, 2)}
+    cam_res_id = {'WFS150': cam_res_WFS150,
+                  'WFS10': cam_res_WFS10,
+                  'WFS20': cam_res_WFS20,
+                  'WFS30': cam_res_WFS30,
+                  'WFS40': cam_res_WFS40}
+    # Zernike Order: Zernike Modes
+    zernike_modes_per_order = {2: 6,
+                               3: 10,
+                               4: 15,
+                               5: 21,
+                               6: 28,
+                               7: 36,
+                               8: 45,
+                               9: 55,
+                               10: 66}
+
+    def __init__(self, lib=None):
         self.log_wfs = logging.getLogger('WFS')
-        self.lib = self.find_wfs_library()
+        self.instrumentation = InstrumentedLibrary(lib, loader=self.load_library)
+        self.lib = self.instrumentation
+        self.latency = LatencyMonitor()
+        self.frame_stamps = None
+        self.frame_number = 0
+        # Counts the changes of the image buffer, a SpotfieldView is invalid once it changes
+        self.capture_count = 0
+        # Called with the spotfield image view and the WFS before the spots are calculated
+        self.image_stages = []
+        # Called with the WFS after every update()
+        self.frame_listeners = []
+        # Called with the spotfield image view and the WFS instead of _cut_image_noise_floor()
+        self.noise_floor = None
         self.adapt_centroids = Vi.int32(0)
         self.allow_auto_exposure = Vi.int32(1)
         self.array_centroid_x = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
@@ -325,12 +428,15 @@ class WFS(object):
         self.array_deviations_y = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
         self.array_diameter_x = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
         self.array_diameter_y = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
-        self.array_image_buffer = Vi.array_uint8(self.CAM_MAX_PIX_X, self.CAM_MAX_PIX_Y)
-        self.array_image_buffer_ref = Vi.array_uint8(self.WFS_BUFFER_SIZE)
+        # Image and line buffers are sized for the camera by _allocate_buffers()
+        self.array_image_buffer = None
+        # Receives the address of the driver's image buffer
+        self.array_image_buffer_ref = Vi.array_uint8(ctypes.sizeof(ctypes.c_void_p))
         self.array_intensity = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
-        self.array_line_max = Vi.array_float(self.CAM_MAX_PIX_X)
-        self.array_line_min = Vi.array_float(self.CAM_MAX_PIX_X)
-        self.array_line_selected = Vi.array_float(self.CAM_MAX_PIX_X)
+        self.array_line_max = None
+        self.array_line_min = None
+        self.array_line_selected = None
+        self.image_buffer_size = None
         self.array_reference_x = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
         self.array_reference_y = Vi.array_float(self.MAX_SPOTS_X, self.MAX_SPOTS_Y)
         self.array_scale_x = Vi.array_float(self.MAX_SPOTS_X)
@@ -462,75 +568,15 @@ class WFS(object):
         self.window_start_position_x = Vi.array_float(self.MAX_SPOTS_X)
         self.window_start_position_y = Vi.array_float(self.MAX_SPOTS_Y)
 
-        # NAME = {Index: (x_res, y_res, sub_factor)}
-        self.cam_res_WFS150 = {0: (1280, 1024, 1),
-                               1: (1024, 1024, 1),
-                               2: (768, 768, 1),
-                               3: (512, 512, 1),
-                               4: (320, 320, 1)}
-        self.cam_res_WFS10 = {0: (640, 480, 1),
-                              1: (480, 480, 1),
-                              2: (360, 360, 1),
-                              3: (260, 260, 1),
-                              4: (180, 180, 1)}
-        self.cam_res_WFS20 = {0: (1440, 1080, 1),
-                              1: (1080, 1080, 1),
-                              2: (768, 768, 1),
-                              3: (512, 512, 1),
-                              4: (360, 360, 1),
-                              5: (720, 540, 2),
-                              6: (540, 540, 2),
-                              7: (384, 384, 2),
-                              8: (256, 256, 2),
-                              9: (180, 180, 2)}
-        self.cam_res_WFS30 = {0: (1936, 1216, 1),
-                              1: (1216, 1216, 1),
-                              2: (1024, 1024, 1),
-                              3: (768, 768, 1),
-                              4: (512, 512, 1),
-                              5: (360, 360, 1),
-                              6: (968, 968, 2),
-                              7: (608, 608, 2),
-                              8: (512, 512, 2),
-                              9: (384, 384, 2),
-                              10: (256, 256, 2),
-                              11: (180, 180, 2)}
-        self.cam_res_WFS40 = {0: (2048, 2048, 1),
-                              1: (1536, 1536, 1),
-                              2: (1024, 1024, 1),
-                              3: (768, 768, 1),
-                              4: (512, 512, 1),
-                              5: (360, 360, 1),
-                              6: (1024, 1024, 2),
-                              7: (768, 768, 2),
-                              8: (512, 512, 2),
-                              9: (384, 384, 2),
-                              10: (256, 256, 2),
-                              11: (180, 180, 2)}
-        self.cam_res_id = {'WFS150': self.cam_res_WFS150,
-                           'WFS10': self.cam_res_WFS10,
-                           'WFS20': self.cam_res_WFS20,
-                           'WFS30': self.cam_res_WFS30,
-                           'WFS40': self.cam_res_WFS40}
-        # Zernike Order: Zernike Modes
-        self.zernike_modes_per_order = {2: 6,
-                                        3: 10,
-                                        4: 15,
-                                        5: 21,
-                                        6: 28,
-                                        7: 36,
-                                        8: 45,
-                                        9: 55,
-                                        10: 66}
-
     def find_wfs_library(self):
         """Find and load the WFS .dll in the system.
     
         Returns:
             ctypes.windll.LoadLibrary(WFS_32/64.dll)
         """
+        from ctypes.util import find_library
         bitness = ctypes.sizeof(ctypes.c_void_p) * 8  # =32 on x86, =64 on x64
-        if bitness is 64:
+        if bitness == 64:
             self.log_wfs.critical('64 bit Windows has OSError Access Violations')
             raise ImportError('64 bit Windows has OSError Access Violations')
         lib = find_library(f'WFS_{bitness}')
@@ -541,6 +587,19 @@ class WFS(object):
         self.log_wfs.debug(f'{lib} loaded')
         return _lib_wfs
 
+    def load_library(self):
+        """Load the WFS .dll unless a driver library is set.
+
+        Called by connect() and by the first driver call of a method
+        used before connect().
+
+        Returns:
+            Driver library wrapped by the instrumentation.
+        """
+        if self.instrumentation.lib is None:
+            self.instrumentation.lib = self.find_wfs_library()
+        return self.instrumentation.lib
+
     # WFS Functions
     def _init(self, resource_name=None, id_query=None, reset_device=None):
         """Initializes the instrument driver session.
@@ -647,6 +706,7 @@ class WFS(object):
                 returned by the function call. For Status Codes see
                 function _error_message.
         """
+        self.capture_count += 1
         status = self.lib.WFS_close(self.instrument_handle)
         self.log_wfs.info(f'Close: {self.instrument_handle.value}')
         self.instrument_handle.value = Vi.NULL
@@ -697,6 +757,7 @@ class WFS(object):
         self.log_wfs.info(f'Serial Number WFS: {self.serial_number_wfs.value.decode()}')
         self.log_wfs.info(f'Serial Number Camera: {self.serial_number_camera.value.decode()}')
         self._error_message(status)
+        self._allocate_buffers()
         return (status, self.manufacturer_name.value, self.instrument_name_wfs.value,
                 self.serial_number_wfs.value, self.serial_number_camera.value)
 
@@ -796,6 +857,7 @@ class WFS(object):
                 self.pixel_format = Vi.int32(pixel_format)
             except ValueError:
                 self.pixel_format = pixel_format
+        self.capture_count += 1
         status = self.lib.WFS_ConfigureCam(self.instrument_handle,
                                            self.pixel_format,
                                            self.cam_resolution_index,
@@ -814,6 +876,7 @@ class WFS(object):
         self.log_wfs.info(f'Spots X: {self.spots_x.value}')
         self.log_wfs.info(f'Spots Y: {self.spots_y.value}')
         self._error_message(status)
+        self._allocate_buffers()
         return status, self.spots_x.value, self.spots_y.value
 
     def _set_highspeed_mode(self, highspeed_mode=None, adapt_centroids=None, subtract_offset=None,
@@ -1813,6 +1876,7 @@ class WFS(object):
                 returned by the function call. For Status Codes see
                 function _error_message.
         """
+        self.capture_count += 1
         status = self.lib.WFS_TakeSpotfieldImage(self.instrument_handle)
         self.log_wfs.debug(f'Take Spotfield Image: {self.instrument_handle.value}')
         self._error_message(status)
@@ -1856,6 +1920,7 @@ class WFS(object):
                 returns the automatically selected actual master gain
                 the camera image was taken with.
         """
+        self.capture_count += 1
         status = self.lib.WFS_TakeSpotfieldImageAutoExpos(self.instrument_handle,
                                                           ctypes.byref(self.exposure_time_actual),
                                                           ctypes.byref(self.master_gain_actual))
@@ -1899,7 +1964,7 @@ class WFS(object):
         self._error_message(status)
         return status, self.array_image_buffer_ref, self.spotfield_rows.value, self.spotfield_columns.value
 
-    def _get_spotfield_image_copy(self):
+    def _get_spotfield_image_copy(self, array_image_buffer=None):
         """Get a copy of the spotfield image as an array.
 
         This function returns a copy of the spotfield image taken by
@@ -1908,6 +1973,12 @@ class WFS(object):
         buffer array_image_buffer. It returns also the image size.
         Note: This function is not available in Highspeed Mode!
 
+        Args:
+            array_image_buffer (ctypes.c_ubyte array): This parameter
+                accepts an user provided image buffer the image is
+                copied into, e.g. a slot of a memory-mapped recording.
+                It must hold at least Rows * Columns bytes.
+
         Returns:
             status (Vi.status(int)): This value shows the status code
                 returned by the function call. For Status Codes see
@@ -1915,23 +1986,27 @@ class WFS(object):
             array_image_buffer (Vi.array_uint8(int, int)): This
                 parameter accepts an user provided image buffer. Note:
                 This buffer needs to be allocated by the user. The
-                required size is CAM_MAX_PIX_X * CAM_MAX_PIX_Y bytes.
+                required size is the product of image_size() in bytes.
             spotfield_rows (Vi.int32(int)): This parameter returns the
                 image height (rows) in pixels.
             spotfield_columns (Vi.int32(int)): This parameter returns
                 the image width (columns) in pixels.
         """
+        if array_image_buffer is None:
+            self._allocate_buffers()
+            array_image_buffer = self.array_image_buffer
         status = self.lib.WFS_GetSpotfieldImageCopy(self.instrument_handle,
-                                                    self.array_image_buffer,
+                                                    array_image_buffer,
                                                     ctypes.byref(self.spotfield_rows),
                                                     ctypes.byref(self.spotfield_columns))
         self.log_wfs.debug(f'Get Spotfield Image Copy: {self.instrument_handle.value}')
         self.log_wfs.info(f'Rows: {self.spotfield_rows.value}')
         self.log_wfs.info(f'Columns: {self.spotfield_columns.value}')
-        self.log_wfs.debug('Image Buffer Copy:\n' +
-                           '\n'.join([' '.join([f'{item:3}' for item in row]) for row in self.array_image_buffer]))
+        # Logging every pixel takes longer than the copy itself, only log the start of the buffer
+        self.log_wfs.debug('Image Buffer Copy: ' + ' '.join(
+            [f'{item:3}' for item in ctypes.string_at(array_image_buffer, 8)]))
         self._error_message(status)
-        return status, self.array_image_buffer, self.spotfield_rows.value, self.spotfield_columns.value
+        return status, array_image_buffer, self.spotfield_rows.value, self.spotfield_columns.value
 
     def _average_image(self, average_count=None):
         """Generate an averaged image from a number of images in buffer.
@@ -1963,6 +2038,7 @@ class WFS(object):
                 self.average_count = Vi.int32(average_count)
             except ValueError:
                 self.average_count = average_count
+        self.capture_count += 1
         status = self.lib.WFS_AverageImage(self.instrument_handle,
                                            self.average_count,
                                            ctypes.byref(self.average_data_ready))
@@ -2007,6 +2083,7 @@ class WFS(object):
                 self.rolling_reset = Vi.int32(rolling_reset)
             except ValueError:
                 self.rolling_reset = rolling_reset
+        self.capture_count += 1
         status = self.lib.WFS_AverageImageRolling(self.instrument_handle,
                                                   self.average_count,
                                                   self.rolling_reset)
@@ -2137,6 +2214,7 @@ class WFS(object):
                 self.line = Vi.int32(line)
             except ValueError:
                 self.line = line
+        self._allocate_buffers()
         status = self.lib.WFS_GetLine(self.instrument_handle,
                                       self.line,
                                       self.array_line_selected)
@@ -2175,6 +2253,7 @@ class WFS(object):
                 max.  640 for WFS10
                 max. 1440 for WFS20
         """
+        self._allocate_buffers()
         status = self.lib.WFS_GetLineView(self.instrument_handle,
                                           self.array_line_min,
                                           self.array_line_max)
@@ -3386,7 +3465,14 @@ class WFS(object):
         return status
 
     def connect(self):
-        """Connect to the WFS automatically."""
+        """Connect to the WFS automatically.
+
+        Loads the driver library on the first call and resets the
+        driver and latency statistics for the new session.
+        """
+        self.load_library()
+        self.reset_driver_statistics()
+        self.reset_latency_statistics()
         self._get_instrument_list_len()
         self._get_instrument_list_info()
         self._init(id_query=1, reset_device=1)
@@ -3429,15 +3515,38 @@ class WFS(object):
         return self.device_status.value
 
     def update(self):
-        """Update the WFS and calculate values and RoC."""
+        """Update the WFS and calculate values and RoC.
+
+        The timestamps of the frame are available as frame_stamps.
+        Every function in image_stages is called with the spotfield
+        image view and the WFS before the spots are calculated, and may
+        change the image in place. If noise_floor is set, it is called
+        the same way after the image stages instead of
+        _cut_image_noise_floor(). Every function in frame_listeners is
+        called with the WFS once the frame is analysed.
+        """
+        stamps = FrameStamps(self.frame_number, self.latency)
+        self.frame_number += 1
+        driver_start = self.instrumentation.driver_ns
+        stamps.capture_start = start = time.perf_counter_ns()
         if self.allow_auto_exposure.value == 1:
             self._take_spotfield_image_auto_exposure()
         else:
             self._take_spotfield_image()
+        stamps.capture_return = time.perf_counter_ns()
         self._get_status()
-        self._cut_image_noise_floor()
         self._get_spotfield_image()
         # self._get_spotfield_image_copy()  # Takes a significant amount of time to run
+        image = None
+        if self.image_stages or self.noise_floor is not None:
+            image = self.spotfield_view()
+            if image is not None:
+                for stage in self.image_stages:
+                    stage(image, self)
+        if self.noise_floor is not None and image is not None:
+            self.noise_floor(image, self)
+        else:
+            self._cut_image_noise_floor()
         self._calc_spots_centroid_diameter_intensity()
         self._get_spot_centroids()
         self._calc_beam_centroid_diameter()
@@ -3447,12 +3556,162 @@ class WFS(object):
         self._calc_wavefront_statistics()
         self._get_line_view()
         self._zernike_lsf()
+        stamps.analysis_done = time.perf_counter_ns()
+        self.instrumentation.record_update(stamps.analysis_done - start,
+                                           self.instrumentation.driver_ns - driver_start)
+        self.latency.frame_done(stamps)
+        self.frame_stamps = stamps
+        for listener in self.frame_listeners:
+            listener(self)
         return self.roc_mm.value
 
     def disconnect(self):
         """Disconnect from the WFS."""
         return self._close()
 
+    def camera_model(self):
+        """Get the model of the connected WFS, e.g. 'WFS20'.
+
+        Returns:
+            str: Key of cam_res_id, or None before _get_instrument_info()
+                or for an unknown model.
+        """
+        model = self.instrument_name_wfs.value.decode().split('-', 1)[0]
+        return model if model in self.cam_res_id else None
+
+    def image_size(self):
+        """Get the (columns, rows) of the image buffer.
+
+        The current camera resolution after _configure_cam(), else the
+        largest resolution of the model, else the largest of all models.
+        """
+        if self.cam_resolution_x.value > 0 and self.cam_resolution_y.value > 0:
+            return self.cam_resolution_x.value, self.cam_resolution_y.value
+        model = self.camera_model()
+        models = [self.cam_res_id[model]] if model else self.cam_res_id.values()
+        resolutions = [resolution for cam_res in models for resolution in cam_res.values()]
+        return max(x for x, _, _ in resolutions), max(y for _, y, _ in resolutions)
+
+    def _allocate_buffers(self):
+        """Size the image and line buffers for the camera resolution.
+
+        The buffers are reused until the resolution changes. The spot
+        arrays keep the [MAX_SPOTS_Y][MAX_SPOTS_X] layout of the driver.
+        """
+        size = self.image_size()
+        if size == self.image_buffer_size:
+            return
+        columns, rows = size
+        self.array_image_buffer = Vi.array_uint8(columns, rows)
+        self.array_line_max = Vi.array_float(columns)
+        self.array_line_min = Vi.array_float(columns)
+        self.array_line_selected = Vi.array_float(columns)
+        self.image_buffer_size = size
+        self.log_wfs.debug(f'Image Buffers: {columns} x {rows}')
+
+    def memory_report(self):
+        """Get the memory of the ctypes buffers of the session.
+
+        Returns:
+            dict: 'buffers' {name: bytes}, largest first, and 'total'
+                bytes.
+        """
+        buffers = {name: ctypes.sizeof(value) for name, value in vars(self).items()
+                   if isinstance(value, ctypes.Array)}
+        buffers = dict(sorted(buffers.items(), key=lambda item: item[1], reverse=True))
+        return {'buffers': buffers, 'total': sum(buffers.values())}
+
+    def spotfield_view(self):
+        """Get the spotfield image in the driver's buffer without a copy.
+
+        Call after _get_spotfield_image(). The view is valid until the
+        next image is taken; the driver calculates the spots from the
+        changed image if it is modified in place. Use spotfield() for a
+        view that checks this.
+
+        Returns:
+            np.ndarray: uint8 [rows][columns] view of the image, or
+                None if there is no image.
+        """
+        address = ctypes.c_void_p.from_buffer(self.array_image_buffer_ref).value
+        rows = self.spotfield_rows.value
+        columns = self.spotfield_columns.value
+        if not address or rows <= 0 or columns <= 0:
+            return None
+        buffer = (ctypes.c_ubyte * (rows * columns)).from_address(address)
+        return np.ctypeslib.as_array(buffer).reshape(rows, columns)
+
+    def spotfield(self):
+        """Get a checked zero-copy view of the current spotfield image.
+
+        Calls _get_spotfield_image() for the buffer address and size of
+        the last image taken. The view raises RuntimeError once the next
+        image is taken, the camera is reconfigured or an image is
+        averaged; SpotfieldView.copy() keeps the image.
+
+        Returns:
+            SpotfieldView: View of the image, or None if there is no
+                image.
+        """
+        self._get_spotfield_image()
+        array = self.spotfield_view()
+        if array is None:
+            return None
+        return SpotfieldView(self, array)
+
+    def driver_statistics(self):
+        """Get call counts, latencies and error codes of the driver.
+
+        Returns:
+            dict: 'functions' with count, total_ms, mean_us, p50_us,
+                p90_us, p99_us, max_us and errors {status: count} of
+                every WFS_* function called, sorted by total time, and
+                'update' with the same latencies of update() plus the
+                time spent in the driver (driver_ms) and in Python
+                (python_ms).
+        """
+        return self.instrumentation.summary()
+
+    def reset_driver_statistics(self):
+        """Reset the driver statistics."""
+        self.instrumentation.reset()
+
+    def latency_statistics(self):
+        """Get latency percentiles and jitter of the updated frames.
+
+        Returns:
+            dict: {name: {count, mean_us, p50_us, p90_us, p99_us,
+                max_us, jitter_us}} for capture, analysis, total,
+                period and delivery.<consumer> of every consumer that
+                marked a delivery with frame_stamps.delivered().
+        """
+        return self.latency.summary()
+
+    def reset_latency_statistics(self):
+        """Reset the latency statistics."""
+        self.latency.reset()
+
+    def profile(self, frames=100, mode='deterministic', output=None, interval=0.001):
+        """Profile update() for a number of frames.
+
+        Writes a collapsed-stack file and a summary table splitting the
+        time between DLL calls, logging, NumPy, ctypes and Python.
+
+        Args:
+            frames (int): Number of frames.
+            mode (str): 'deterministic' or 'sampling'.
+            output (str): Path without extension of the output files,
+                default wfs_profile_<date>_<time>.
+            interval (float): Sampling interval in seconds.
+
+        Returns:
+            dict: frames, mode, wall_s, categories {category: (ms, %)},
+                collapsed and summary paths.
+        """
+        from profiler import profile_wfs
+        return profile_wfs(self, frames, mode, output, interval)
+
 
 if __name__ == '__main__':
+    setup_logging()
     wfs = WFS()